@@ -0,0 +1,302 @@
+import io
+import pandas as pd
+# install package psycopg2-binary
+import psycopg2
+import db
+
+# Marker written in place of missing values so COPY can tell
+# NULLs apart from empty strings
+NULL_MARKER = "\\N"
+
+
+def copy_frame(cur, frame, table):
+    """
+    Stream a data frame into a table with COPY ... FROM STDIN
+    The frame is serialized to an in-memory CSV buffer, so its column
+    names must match the column names of the table
+    :param cur: Cursor of an open connection
+    :param frame: Data frame of rows to be copied
+    :param table: Name of the table to copy into
+    :return: Number of rows copied
+    """
+    buffer = io.StringIO()
+    frame.to_csv(buffer, index=False, header=False, na_rep=NULL_MARKER)
+    buffer.seek(0)
+    cur.copy_expert(
+        f"COPY {table} ({', '.join(frame.columns)}) "
+        f"FROM STDIN WITH (FORMAT csv, NULL '{NULL_MARKER}')",
+        buffer
+    )
+    return len(frame.index)
+
+
+def write_batches(cur, frame, table, batch_size=10000):
+    """
+    COPY a data frame into a table in batches, each under a savepoint
+    When a batch is rejected it is rolled back and split in half until
+    the rows that raised errors are isolated, so the good rows around
+    them are still written with COPY
+    :param cur: Cursor of an open connection
+    :param frame: Data frame of rows to be copied
+    :param table: Name of the table to copy into
+    :param batch_size: Number of rows sent per COPY
+    :return: List of (index label, error) pairs for the rows that
+    raised errors
+    """
+    failed = []
+    for start in range(0, len(frame.index), batch_size):
+        _copy_or_bisect(cur, frame.iloc[start:start + batch_size], table,
+                        failed)
+    return failed
+
+
+def _copy_or_bisect(cur, frame, table, failed):
+    """
+    COPY a batch under a savepoint, bisecting it if it is rejected
+    :param cur: Cursor of an open connection
+    :param frame: Data frame of rows to be copied
+    :param table: Name of the table to copy into
+    :param failed: List that (index label, error) pairs are appended to
+    """
+    cur.execute("SAVEPOINT batch")
+    try:
+        copy_frame(cur, frame, table)
+    except psycopg2.Error as error:
+        cur.execute("ROLLBACK TO SAVEPOINT batch")
+        cur.execute("RELEASE SAVEPOINT batch")
+        if len(frame.index) == 1:
+            failed.append((frame.index[0], error))
+        else:
+            middle = len(frame.index) // 2
+            _copy_or_bisect(cur, frame.iloc[:middle], table, failed)
+            _copy_or_bisect(cur, frame.iloc[middle:], table, failed)
+        return
+    cur.execute("RELEASE SAVEPOINT batch")
+
+
+def insert_rows(cur, frame, table):
+    """
+    Insert a data frame into a table one row at a time
+    Used instead of COPY when row-by-row loading is requested
+    Each row runs inside its own savepoint so that a failing row does
+    not abort the transaction for the rows after it. The INSERT is
+    prepared once on the server and executed for every row.
+    :param cur: Cursor of an open connection
+    :param frame: Data frame of rows to be inserted
+    :param table: Name of the table to insert into
+    :return: List of (index label, error) pairs for the rows that
+    raised errors
+    """
+    parameters = [f"${number}" for number in range(1, len(frame.columns) + 1)]
+    statement = (
+        f"INSERT INTO {table} ({', '.join(frame.columns)}) "
+        f"VALUES ({', '.join(parameters)})"
+    )
+    # Widen float32 columns through their shortest decimal form so the
+    # inserted values match what COPY writes instead of gaining digits
+    frame = frame.copy()
+    for column in frame.columns[frame.dtypes == "float32"]:
+        frame[column] = frame[column].astype(str).astype("float64")
+    # Convert numpy values to python values and missing values to None
+    values = frame.astype(object).where(frame.notna(), None)
+    failed = []
+    with db.prepared_statement(cur, f"insert_{table}".lower(),
+                               statement) as execute:
+        execute = f"{execute} ({', '.join(['%s'] * len(frame.columns))})"
+        for label, row in zip(values.index,
+                              values.itertuples(index=False)):
+            cur.execute("SAVEPOINT insert_row")
+            try:
+                cur.execute(execute, tuple(row))
+            except psycopg2.Error as error:
+                cur.execute("ROLLBACK TO SAVEPOINT insert_row")
+                failed.append((label, error))
+            cur.execute("RELEASE SAVEPOINT insert_row")
+    return failed
+
+
+def row_hash(frame, columns):
+    """
+    Hash the values of some columns of each row of a data frame
+    Values are hashed in the text form COPY sends them in, with booleans
+    as TRUE/FALSE, so the hash does not depend on how the frame was
+    parsed
+    :param frame: Data frame of rows
+    :param columns: List of columns to hash
+    :return: Series of 64-bit integer hashes, one per row
+    """
+    text = pd.DataFrame(index=frame.index)
+    for column in columns:
+        values = frame[column]
+        if pd.api.types.is_bool_dtype(values):
+            values = values.map({True: "TRUE", False: "FALSE"})
+        text[column] = values.astype("string").fillna(NULL_MARKER)
+    hashes = pd.util.hash_pandas_object(text, index=False)
+    # Reinterpret as signed so the hashes fit in a BIGINT column
+    return pd.Series(hashes.to_numpy().view("int64"), index=frame.index)
+
+
+def staging_table(table):
+    """
+    Name of the temporary staging table used for a table
+    :param table: Name of the destination table
+    :return: Name of the staging table
+    """
+    return f"{table}_staging"
+
+
+def create_staging_table(cur, table, extra_columns=None):
+    """
+    Create an empty temporary staging table shaped like a table
+    The staging table copies the column types and constraints of the
+    destination table, so bad rows are rejected while staging rather
+    than when the staged rows are moved across. It is dropped on commit,
+    and replaced if it already exists.
+    :param cur: Cursor of an open connection
+    :param table: Name of the destination table
+    :param extra_columns: List of definitions of further columns, for
+    staged rows that also feed other tables
+    """
+    staging = staging_table(table)
+    definitions = [f"LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS"]
+    definitions.extend(extra_columns or [])
+    cur.execute(f"DROP TABLE IF EXISTS {staging}")
+    cur.execute(
+        f"""
+            CREATE TEMPORARY TABLE {staging}
+            ({", ".join(definitions)})
+            ON COMMIT DROP
+        """
+    )
+
+
+def stage_frame(cur, frame, table, row_by_row=False, batch_size=10000):
+    """
+    Append a data frame to the staging table of a table
+    :param cur: Cursor of an open connection
+    :param frame: Data frame of rows to be staged
+    :param table: Name of the destination table
+    :param row_by_row: Skip COPY and insert one row at a time
+    :param batch_size: Number of rows sent per COPY
+    :return: List of (index label, error) pairs for the rows that
+    raised errors
+    """
+    staging = staging_table(table)
+    if row_by_row:
+        return insert_rows(cur, frame, staging)
+    return write_batches(cur, frame, staging, batch_size=batch_size)
+
+
+def insert_new_rows(cur, table, keys, update_columns=None, staging=None,
+                    columns=None, changed_column=None):
+    """
+    Move staged rows into a table, leaving rows whose keys already
+    exist alone or updating them
+    Duplicates are resolved by the database with ON CONFLICT against
+    the primary key, so only the staged rows ever cross the network.
+    Rows staged more than once are only moved once, keeping the first
+    one staged.
+    :param cur: Cursor of an open connection
+    :param table: Name of the destination table
+    :param keys: List of primary key columns of the table
+    :param update_columns: List of columns to overwrite when the key
+    already exists, or None to keep the existing row
+    :param staging: Name of the staging table to move rows from, by
+    default the staging table of the destination table
+    :param columns: List of columns to move, by default all of them
+    :param changed_column: Column holding a hash of each row; when
+    given, existing rows are only updated if their hash differs
+    :return: Number of rows inserted or updated
+    """
+    staging = staging or staging_table(table)
+    key_list = ", ".join(keys)
+    if columns is None:
+        target = table
+        selected = "staged.*"
+    else:
+        target = f"{table} ({', '.join(columns)})"
+        selected = ", ".join(f"staged.{column}" for column in columns)
+    if update_columns:
+        conflict = "DO UPDATE SET " + ", ".join(
+            f"{column} = EXCLUDED.{column}" for column in update_columns
+        )
+        if changed_column is not None:
+            conflict = conflict + (
+                f" WHERE {table}.{changed_column}"
+                f" IS DISTINCT FROM EXCLUDED.{changed_column}"
+            )
+    else:
+        conflict = "DO NOTHING"
+    # Rows of a fresh staging table are stored in the order they were
+    # staged, so ordering ties by ctid keeps the first one
+    cur.execute(
+        f"""
+            INSERT INTO {target}
+            SELECT DISTINCT ON ({key_list}) {selected}
+            FROM {staging} AS staged
+            ORDER BY {key_list}, staged.ctid
+            ON CONFLICT ({key_list}) {conflict}
+        """
+    )
+    return cur.rowcount
+
+
+def record_history(cur, history, keys, columns, hash_column, valid_from,
+                   staging):
+    """
+    Keep the history of staged rows in a table of rows with valid_from
+    and valid_to dates
+    The current row of a key, whose valid_to is NULL, is closed when
+    the staged row's hash differs from it, and the staged row becomes the
+    new current row. Keys with rows valid after valid_from are left
+    alone, so history has to be loaded in date order.
+    :param cur: Cursor of an open connection
+    :param history: Name of the history table, keyed by the keys and
+    valid_from
+    :param keys: List of key columns, without valid_from
+    :param columns: List of columns to keep, including the keys
+    :param hash_column: Column holding a hash of each row
+    :param valid_from: Date the staged rows are valid from
+    :param staging: Name of the staging table holding the rows
+    :return: Number of history rows added or replaced
+    """
+    key_list = ", ".join(keys)
+    key_match = " AND ".join(f"kept.{key} = staged.{key}" for key in keys)
+    # Close current rows that changed
+    cur.execute(
+        f"""
+            UPDATE {history} AS kept
+            SET valid_to = %s
+            FROM {staging} AS staged
+            WHERE {key_match}
+            AND kept.valid_to IS NULL
+            AND kept.valid_from < %s
+            AND kept.{hash_column} IS DISTINCT FROM staged.{hash_column}
+        """,
+        (valid_from, valid_from)
+    )
+    # Add staged rows that are not current yet; a row already added for
+    # the same date is replaced
+    kept_columns = columns + [hash_column]
+    cur.execute(
+        f"""
+            INSERT INTO {history} ({", ".join(kept_columns)}, valid_from)
+            SELECT DISTINCT ON ({key_list})
+            {", ".join(f"staged.{column}" for column in kept_columns)}, %s
+            FROM {staging} AS staged
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {history} AS kept
+                WHERE {key_match}
+                AND (kept.valid_from > %s
+                     OR (kept.valid_to IS NULL
+                         AND kept.{hash_column}
+                         IS NOT DISTINCT FROM staged.{hash_column}))
+            )
+            ORDER BY {key_list}, staged.ctid
+            ON CONFLICT ({key_list}, valid_from) DO UPDATE SET
+            {", ".join(f"{column} = EXCLUDED.{column}"
+                       for column in kept_columns)}
+        """,
+        (valid_from, valid_from)
+    )
+    return cur.rowcount
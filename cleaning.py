@@ -0,0 +1,78 @@
+# Version of the cleaning rules and of the types files are read with
+# Change it whenever either changes so cached parsed frames are rebuilt
+RULES_VERSION = 3
+
+# Value the HHS files use in place of suppressed or missing numbers
+SENTINEL = -999999
+
+# Strings that stand for a missing value in text columns
+NA_STRINGS = ["NaN", "NA", "nan", ""]
+
+
+def sentinel_to_null(series):
+    """
+    Replace the missing-value sentinel with a missing value
+    :param series: Column to clean
+    :return: Cleaned column
+    """
+    return series.mask(series == SENTINEL)
+
+
+def negative_to_null(series):
+    """
+    Replace negative numbers with a missing value
+    :param series: Column to clean
+    :return: Cleaned column
+    """
+    return series.mask(series < 0)
+
+
+def na_string_to_null(series):
+    """
+    Replace strings that stand for a missing value with a missing value
+    :param series: Column to clean
+    :return: Cleaned column
+    """
+    return series.mask(series.isin(NA_STRINGS))
+
+
+# Cleaning rules that can be listed for a column, by name
+RULES = {
+    "sentinel": sentinel_to_null,
+    "negative": negative_to_null,
+    "na_string": na_string_to_null
+}
+
+# Rules applied to the weekly HHS columns before rows are written
+HHS_RULES = {
+    "all_adult_hospital_beds_7_day_avg": ["sentinel", "negative"],
+    "all_pediatric_inpatient_beds_7_day_avg": ["sentinel", "negative"],
+    "all_adult_hospital_inpatient_bed_occupied_7_day_coverage":
+        ["sentinel", "negative"],
+    "all_pediatric_inpatient_bed_occupied_7_day_avg":
+        ["sentinel", "negative"],
+    "total_icu_beds_7_day_avg": ["sentinel", "negative"],
+    "icu_beds_used_7_day_avg": ["sentinel", "negative"],
+    "inpatient_beds_used_covid_7_day_avg": ["sentinel", "negative"],
+    "staffed_icu_adult_patients_confirmed_covid_7_day_avg":
+        ["sentinel", "negative"],
+    "geocoded_hospital_address": ["na_string"]
+}
+
+
+def clean_frame(frame, rules):
+    """
+    Apply cleaning rules to whole columns of a data frame at once
+    Columns without rules, and rules for columns the frame does not
+    have, are left alone. The given frame is not modified.
+    :param frame: Data frame to clean
+    :param rules: Dictionary of column name to list of rule names
+    :return: Cleaned copy of the data frame
+    """
+    frame = frame.copy()
+    for column, names in rules.items():
+        if column not in frame.columns:
+            continue
+        for name in names:
+            frame[column] = RULES[name](frame[column])
+    return frame
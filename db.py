@@ -0,0 +1,130 @@
+import contextlib
+import threading
+import credentials
+# install package psycopg2-binary
+import psycopg2
+import psycopg2.pool
+
+# Largest number of connections the shared pool keeps open
+MAX_CONNECTIONS = 4
+
+# Session settings applied for the length of a load when a loader is run
+# with --bulk-session
+# Commits no longer wait for the WAL flush, so a server crash can lose
+# the last loads (they are then missing from the manifest too) but never
+# leaves them half written
+BULK_LOAD_SETTINGS = {
+    "synchronous_commit": "off",
+    "work_mem": "256MB",
+    "maintenance_work_mem": "512MB",
+    "statement_timeout": "30min"
+}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def connect():
+    """
+    Open a connection to the database in credentials.py
+    :return: Open connection
+    """
+    return psycopg2.connect(
+        host=credentials.get_hostname(), dbname=credentials.get_db(),
+        user=credentials.get_username(), password=credentials.get_password()
+    )
+
+
+def get_pool(max_connections=MAX_CONNECTIONS):
+    """
+    Get the connection pool shared by the threads of this process,
+    creating it on first use
+    :param max_connections: Largest number of connections the pool keeps
+    open, used when the pool is created
+    :return: Thread-safe connection pool
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = psycopg2.pool.ThreadedConnectionPool(
+                1, max_connections,
+                host=credentials.get_hostname(),
+                dbname=credentials.get_db(),
+                user=credentials.get_username(),
+                password=credentials.get_password()
+            )
+        return _pool
+
+
+def close_pool():
+    """
+    Close every connection of the shared pool
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+
+
+@contextlib.contextmanager
+def pooled_connection():
+    """
+    Borrow a connection from the shared pool
+    The connection is rolled back if the block fails and is returned to
+    the pool either way
+    :return: Context manager giving an open connection
+    """
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn)
+
+
+def apply_bulk_load_settings(cur, settings=None):
+    """
+    Tune the current transaction for bulk loading
+    The settings are local to the transaction, so they end with its
+    commit or rollback and a pooled connection goes back unchanged
+    :param cur: Cursor of an open connection
+    :param settings: Dictionary of setting name to value, by default
+    BULK_LOAD_SETTINGS
+    """
+    for name, value in (settings or BULK_LOAD_SETTINGS).items():
+        cur.execute("SELECT set_config(%s, %s, true)", (name, value))
+
+
+@contextlib.contextmanager
+def prepared_statement(cur, name, statement):
+    """
+    Prepare a statement on the server for the length of a block
+    The statement is parsed and planned once instead of every time it
+    is run. It uses $1, $2, ... for its parameters; run it by executing
+    the statement this gives with the parameters as %s placeholders.
+    :param cur: Cursor of an open connection
+    :param name: Name of the prepared statement, in lowercase
+    :param statement: SQL statement to prepare
+    :return: Context manager giving the EXECUTE statement, without its
+    parameter list
+    """
+    # Prepared statements outlive rollbacks, and an aborted transaction
+    # cannot deallocate one, so drop one left behind by an earlier block
+    # that failed that way
+    cur.execute("SELECT 1 FROM pg_prepared_statements WHERE name = %s",
+                (name,))
+    if cur.fetchone() is not None:
+        cur.execute(f"DEALLOCATE {name}")
+    cur.execute(f"PREPARE {name} AS {statement}")
+    try:
+        yield f"EXECUTE {name}"
+    finally:
+        # Deallocate on every exit the transaction can still run
+        # statements on, keeping the block's own error if it has one
+        status = cur.connection.get_transaction_status()
+        if status != psycopg2.extensions.TRANSACTION_STATUS_INERROR:
+            cur.execute(f"DEALLOCATE {name}")
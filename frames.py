@@ -0,0 +1,60 @@
+class Declarations(dict):
+    """
+    Named functions that each derive one frame, used by FrameEngine
+    """
+
+    def frame(self, function):
+        """
+        Declare a frame, named after the function deriving it
+        Used as a decorator.
+        :param function: Function taking a FrameEngine, from which it asks
+        for its inputs and the frames it is derived from
+        :return: The function, unchanged
+        """
+        self[function.__name__] = function
+        return function
+
+
+class FrameEngine:
+    """
+    Frames derived from a set of declarations, each computed the first
+    time it is asked for and kept for the rest of the run
+    Every frame is shared by everything that asks for it, so it must be
+    treated as immutable; derive a new frame instead of changing one.
+    """
+
+    def __init__(self, declarations, provided=None, **inputs):
+        """
+        :param declarations: Declarations of the frames
+        :param provided: Dictionary of frames already computed, used
+        instead of their declarations
+        :param inputs: Values the declarations read, such as a cursor
+        """
+        self.declarations = declarations
+        self.inputs = inputs
+        self._frames = dict(provided or {})
+        self._computing = []
+
+    def __getitem__(self, name):
+        """
+        Get a frame, computing it on first use
+        :param name: Name of the frame
+        :return: The frame
+        """
+        if name not in self._frames:
+            if name in self._computing:
+                raise RuntimeError("Frames derived from each other: "
+                                   + " -> ".join(self._computing + [name]))
+            self._computing.append(name)
+            try:
+                self._frames[name] = self.declarations[name](self)
+            finally:
+                self._computing.pop()
+        return self._frames[name]
+
+    def computed(self):
+        """
+        List the frames computed so far
+        :return: List of frame names in the order they were computed
+        """
+        return list(self._frames)
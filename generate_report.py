@@ -1,112 +1,644 @@
+import argparse
+import os
 import pandas as pd
-import credentials
-import psycopg2
-import numpy as np
+import plotly
 import plotly.express as px
+import plotly.io as pio
 import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import timedelta
+import db
+import frames
+import rollups
 
-# Store filename from commandline
-file_name = "reports/" + sys.argv[1]
-
-# Access date
-end_date = sys.argv[2]
-
-# Connect to server
-conn = psycopg2.connect(
-    host=credentials.get_hostname(), dbname=credentials.get_db(),
-    user=credentials.get_username(), password=credentials.get_password()
-)
-cur = conn.cursor()
-
-# Get weekly info as dataframe
-cur.execute("SELECT * FROM Seymour_weekly_info")
-sql_weekly = pd.DataFrame(cur.fetchall(), columns=[
-    "hospital_pk",
-    "collection_week",
-    "all_adult_hospital_beds_7_day_avg",
-    "all_pediatric_inpatient_beds_7_day_avg",
-    "all_adult_hospital_inpatient_bed_occupied_7_day_coverage",
-    "all_pediatric_inpatient_bed_occupied_7_day_avg",
-    "total_icu_beds_7_day_avg",
-    "icu_beds_used_7_day_avg",
-    "inpatient_beds_used_covid_7_day_avg",
-    "staffed_icu_adult_patients_confirmed_covid_7_day_avg"
-])
-
-# Get geo info as dataframe
-cur.execute("SELECT * FROM Seymour_geo")
-sql_geo = pd.DataFrame(cur.fetchall(), columns=[
-    "hospital_pk",
-    "fips_code",
-    "hosptial_geocode"
-])
-
-# Get Hospital GI as dataframe
-cur.execute("SELECT * FROM Seymour_hospital")
-sql_hospital = pd.DataFrame(cur.fetchall(), columns=[
-    "Facility ID",
-    "Facility Name",
-    "Address",
-    "City",
-    "State",
-    "ZIP Code",
-    "County Name",
-    "Hospital Type",
-    "Emergency Services"
-])
-
-# Get quality info as dataframe
-cur.execute("SELECT * FROM Seymour_quality")
-sql_quality = pd.DataFrame(cur.fetchall(), columns=[
-    "Facility ID",
-    "date",
-    "Hospital overall rating"
-])
-
-# Close server connection
-conn.commit()
-conn.close()
-
-# PLOT 1
-
-# Convert 'collection_week' and 'date' to datetime
-sql_weekly['collection_week'] = pd.to_datetime(
-    sql_weekly['collection_week']
-).dt.date
-
-# Get time range to look at
-end_date = pd.to_datetime(end_date)
-end_date = end_date.date()
-start_date = end_date - timedelta(days=29)
-
-# Filter data to time range
-sql_weekly = sql_weekly[
-    (sql_weekly['collection_week'] >= start_date) &
-    (sql_weekly['collection_week'] <= end_date)
-]
-
-# Convert date back to regular format
-sql_weekly['collection_week'] = pd.to_datetime(sql_weekly['collection_week'])
-
-# Check that there is data to visualize
-if sql_weekly.shape[0] == 0:
-    print("No data associated with given week!")
-    sys.exit()
-
-# Merge weekly and quality
-merged_data = pd.merge(sql_weekly, sql_quality,
-                       left_on='hospital_pk',
-                       right_on='Facility ID',
-                       how='left')
-
-# Set collection week to be the index
-weekly_record_counts = sql_weekly['collection_week']\
-    .value_counts().sort_index()
-weekly_record_counts.index = weekly_record_counts.index.strftime('%Y-%m-%d')
-
-
-def generate_visualization1():
+# Establish necessary headers for html file
+header = """
+<!DOCTYPE html>
+<html>
+<head>
+    <title>Hospitals Report</title>
+</head>
+<body>
+    <h1>Summary of Beds by Collection Week</h1>
+"""
+
+header2 = """
+    <h1>Top Ten States with the Highest Increase Cases</h1>
+"""
+
+footer = """
+</body>
+</html>
+"""
+
+# Ways plotly.js is included in a report: "inline" writes it into the
+# report once, "shared" loads PLOTLY_JS_FILE from next to the report, written
+# once for every report in the directory
+PLOTLY_MODES = ["inline", "shared"]
+PLOTLY_JS_FILE = f"plotly-{plotly.__version__}.min.js"
+
+# Height of a chart before it is drawn, plotly's default height
+CHART_HEIGHT = "450px"
+
+# Draws each chart when it is first scrolled near, from the figure stored
+# next to it, with the template shared by the charts
+RENDER_SCRIPT = """
+<script type="text/javascript">
+(function () {
+    var shared = document.getElementById("chart-template");
+    var template = shared ? JSON.parse(shared.textContent) : undefined;
+    function render(div) {
+        var figure = JSON.parse(
+            document.getElementById(div.id + "-figure").textContent
+        );
+        if (!("template" in figure.layout)) {
+            figure.layout.template = template;
+        }
+        Plotly.newPlot(div, figure.data, figure.layout, {responsive: true});
+    }
+    var charts = document.querySelectorAll("div.report-chart");
+    if (!("IntersectionObserver" in window)) {
+        charts.forEach(render);
+        return;
+    }
+    var observer = new IntersectionObserver(function (entries) {
+        entries.forEach(function (entry) {
+            if (entry.isIntersecting) {
+                observer.unobserve(entry.target);
+                render(entry.target);
+            }
+        });
+    }, {rootMargin: "200px"});
+    charts.forEach(function (div) { observer.observe(div); });
+})();
+</script>
+"""
+
+
+# Order of the weekly rows of a state when adding up the change from one
+# row to the next: by week, then in the order of the file each week was
+# loaded from, as the rows were read before the report ran in SQL; rows
+# loaded before file_row was kept come after, by hospital_pk
+WEEKLY_ROW_ORDER = ("weekly.collection_week, weekly.file_row,"
+                    " weekly.hospital_pk")
+
+
+def report_window(end_date):
+    """
+    First and last dates of the weeks a report covers
+    :param end_date: Last date of the report as YYYY-MM-DD
+    :return: Tuple of the first and last dates
+    """
+    end_date = pd.to_datetime(end_date).date()
+    return end_date - timedelta(days=29), end_date
+
+
+# Frames a report is built from, each declared once below and computed the
+# first time a table or plot asks for it, so adding a chart only costs the
+# frames it adds
+REPORT_FRAMES = frames.Declarations()
+
+
+def report_frames(cur, end_date):
+    """
+    Frames of one report, read from the database as they are first used
+    :param cur: Cursor of an open connection, kept open until the report
+    is written
+    :param end_date: Last date of the report as YYYY-MM-DD
+    :return: FrameEngine of REPORT_FRAMES
+    """
+    return frames.FrameEngine(REPORT_FRAMES, cur=cur, end_date=end_date)
+
+
+@REPORT_FRAMES.frame
+def window(report):
+    """
+    First and last dates of the weeks the report covers
+    """
+    return report_window(report.inputs["end_date"])
+
+
+@REPORT_FRAMES.frame
+def fresh(report):
+    """
+    Whether totals by week, state and hospital type are read from the
+    rollups, which is when every load kept them up to date, instead of
+    from the weekly rows
+    """
+    return rollups.is_fresh(report.inputs["cur"])
+
+
+@REPORT_FRAMES.frame
+def weekly_totals(report):
+    """
+    Number of records and bed totals of each week, indexed by week; only
+    the weeks being reported on are scanned, and only their partitions
+    when the table is partitioned
+    """
+    cur = report.inputs["cur"]
+    if report["fresh"]:
+        totals = ", ".join(f"COALESCE(sum({column}_sum), 0)" for column
+                           in rollups.BED_COLUMNS)
+        cur.execute(
+            f"""
+                SELECT collection_week, sum(row_count)::BIGINT, {totals}
+                FROM {rollups.ROLLUP_TABLE}
+                WHERE collection_week BETWEEN %s AND %s
+                GROUP BY collection_week
+                ORDER BY collection_week
+            """,
+            report["window"]
+        )
+    else:
+        totals = ", ".join(f"COALESCE(sum({column}), 0)" for column
+                           in rollups.BED_COLUMNS)
+        cur.execute(
+            f"""
+                SELECT collection_week, count(*), {totals}
+                FROM Seymour_weekly_info
+                WHERE collection_week BETWEEN %s AND %s
+                GROUP BY collection_week
+                ORDER BY collection_week
+            """,
+            report["window"]
+        )
+    weekly_totals = pd.DataFrame(cur.fetchall(), columns=[
+        "collection_week",
+        "records"
+    ] + rollups.BED_COLUMNS)
+    weekly_totals["collection_week"] =\
+        pd.to_datetime(weekly_totals["collection_week"])
+    return weekly_totals.set_index("collection_week")
+
+
+@REPORT_FRAMES.frame
+def weekly_record_counts(report):
+    """
+    Number of records of each week, labelled by date
+    """
+    records = report["weekly_totals"]["records"]
+    return records.set_axis(records.index.strftime('%Y-%m-%d'))
+
+
+@REPORT_FRAMES.frame
+def recent_weekly_totals(report):
+    """
+    Bed totals of the last 5 weeks
+    """
+    return report["weekly_totals"].tail(5)
+
+
+@REPORT_FRAMES.frame
+def bed_usage_by_rating(report):
+    """
+    Average ICU beds of the weeks by the rating each hospital had at the
+    time, taking only the latest rating loaded on or before the week, from
+    either way ratings are stored, so each weekly row counts once however
+    many quality files were loaded
+    """
+    cur = report.inputs["cur"]
+    cur.execute(
+        """
+            SELECT quality.rating, avg(weekly.total_icu_beds_7_day_avg),
+            avg(weekly.icu_beds_used_7_day_avg)
+            FROM Seymour_weekly_info weekly
+            JOIN LATERAL (
+                SELECT rated.rating FROM (
+                    SELECT date, rating FROM Seymour_quality
+                    WHERE hospital_pk = weekly.hospital_pk
+                    AND date <= weekly.collection_week
+                    UNION ALL
+                    SELECT valid_from, rating FROM Seymour_rating_interval
+                    WHERE hospital_pk = weekly.hospital_pk
+                    AND valid_from <= weekly.collection_week
+                ) rated
+                ORDER BY rated.date DESC
+                LIMIT 1
+            ) quality ON TRUE
+            WHERE weekly.collection_week BETWEEN %s AND %s
+            AND quality.rating IS NOT NULL
+            GROUP BY quality.rating
+            ORDER BY quality.rating
+        """,
+        report["window"]
+    )
+    return pd.DataFrame(cur.fetchall(), columns=[
+        "Hospital overall rating",
+        "Average total ICU beds weekly",
+        "Average used ICU beds weekly"
+    ]).set_index("Hospital overall rating").astype(float)
+
+
+@REPORT_FRAMES.frame
+def state_summary(report):
+    """
+    Bed and COVID totals and averages of each state, over the rows that
+    report adult beds
+    """
+    cur = report.inputs["cur"]
+    if report["fresh"]:
+        cur.execute(
+            f"""
+                SELECT state, sum(all_adult_hospital_beds_7_day_avg_sum),
+                sum(all_adult_hospital_beds_7_day_avg_sum)
+                    / sum(with_beds_count)::FLOAT,
+                COALESCE(sum(covid_with_beds_sum), 0),
+                sum(covid_with_beds_sum)
+                    / NULLIF(sum(covid_with_beds_count), 0)::FLOAT
+                FROM {rollups.ROLLUP_TABLE}
+                WHERE collection_week BETWEEN %s AND %s
+                AND state IS NOT NULL
+                GROUP BY state
+                HAVING sum(with_beds_count) > 0
+                ORDER BY state
+            """,
+            report["window"]
+        )
+    else:
+        cur.execute(
+            """
+                SELECT hospital.state,
+                sum(weekly.all_adult_hospital_beds_7_day_avg),
+                avg(weekly.all_adult_hospital_beds_7_day_avg),
+                COALESCE(sum(weekly.inpatient_beds_used_covid_7_day_avg), 0),
+                avg(weekly.inpatient_beds_used_covid_7_day_avg)
+                FROM Seymour_weekly_info weekly
+                JOIN Seymour_hospital hospital
+                ON hospital.hospital_pk = weekly.hospital_pk
+                WHERE weekly.collection_week BETWEEN %s AND %s
+                AND weekly.all_adult_hospital_beds_7_day_avg <> 0
+                AND hospital.state IS NOT NULL
+                GROUP BY hospital.state
+                ORDER BY hospital.state
+            """,
+            report["window"]
+        )
+    return pd.DataFrame(cur.fetchall(), columns=[
+        "State",
+        "total_beds",
+        "avg_beds",
+        "total_covid_cases",
+        "avg_covid_cases"
+    ])
+
+
+@REPORT_FRAMES.frame
+def states_fewest_open_beds(report):
+    """
+    States by the percentage of beds used for COVID, highest first, so the
+    states with the fewest open beds come first
+    """
+    state_summary = report["state_summary"]
+    return state_summary.assign(
+        percent_beds_used_for_covid=(state_summary['total_covid_cases']
+                                     / state_summary['total_beds']) * 100
+    ).sort_values('percent_beds_used_for_covid', ascending=False)
+
+
+@REPORT_FRAMES.frame
+def utilization_by_type(report):
+    """
+    Average utilization of each type of hospital by week, leaving out
+    hospitals without adult beds
+    """
+    cur = report.inputs["cur"]
+    if report["fresh"]:
+        cur.execute(
+            f"""
+                SELECT collection_week, hospital_type,
+                sum(utilization_sum)
+                    / NULLIF(sum(utilization_count), 0)::FLOAT
+                FROM {rollups.ROLLUP_TABLE}
+                WHERE collection_week BETWEEN %s AND %s
+                AND hospital_type IS NOT NULL
+                GROUP BY collection_week, hospital_type
+                ORDER BY collection_week, hospital_type
+            """,
+            report["window"]
+        )
+    else:
+        cur.execute(
+            f"""
+                SELECT weekly.collection_week, hospital.hospital_type,
+                avg({rollups.UTILIZATION})
+                FROM Seymour_weekly_info weekly
+                JOIN Seymour_hospital hospital
+                ON hospital.hospital_pk = weekly.hospital_pk
+                WHERE weekly.collection_week BETWEEN %s AND %s
+                AND hospital.hospital_type IS NOT NULL
+                GROUP BY weekly.collection_week, hospital.hospital_type
+                ORDER BY weekly.collection_week, hospital.hospital_type
+            """,
+            report["window"]
+        )
+    utilization_by_type = pd.DataFrame(cur.fetchall(), columns=[
+        "collection_week",
+        "Hospital Type",
+        "hospital_utilization"
+    ])
+    utilization_by_type["collection_week"] =\
+        pd.to_datetime(utilization_by_type["collection_week"])
+    utilization_by_type["hospital_utilization"] =\
+        utilization_by_type["hospital_utilization"].astype(float)
+    return utilization_by_type
+
+
+@REPORT_FRAMES.frame
+def total_increase_by_state(report):
+    """
+    Total change in COVID cases of each state, adding up the rounded change
+    from one row to the next in WEEKLY_ROW_ORDER
+    """
+    cur = report.inputs["cur"]
+    cur.execute(
+        f"""
+            SELECT state, sum(covid_cases_change) FROM (
+                SELECT hospital.state, round(
+                    weekly.inpatient_beds_used_covid_7_day_avg
+                    - lag(weekly.inpatient_beds_used_covid_7_day_avg) OVER (
+                        PARTITION BY hospital.state
+                        ORDER BY {WEEKLY_ROW_ORDER}
+                    )
+                ) AS covid_cases_change
+                FROM Seymour_weekly_info weekly
+                JOIN Seymour_hospital hospital
+                ON hospital.hospital_pk = weekly.hospital_pk
+                WHERE weekly.collection_week BETWEEN %s AND %s
+                AND hospital.state IS NOT NULL
+            ) changes
+            WHERE covid_cases_change IS NOT NULL
+            GROUP BY state
+            ORDER BY state
+        """,
+        report["window"]
+    )
+    return pd.DataFrame(cur.fetchall(), columns=[
+        "State",
+        "covid_cases_change"
+    ])
+
+
+@REPORT_FRAMES.frame
+def top_10_states(report):
+    """
+    The 10 states with the highest total increase in cases
+    """
+    return report["total_increase_by_state"].sort_values(
+        by='covid_cases_change', ascending=False
+    ).head(10)
+
+
+# The frames below hold sums and counts by week, so the reports of a batch
+# can each add up the weeks of their own window from one read of the
+# database; see batch_frames
+
+
+@REPORT_FRAMES.frame
+def rating_weeks(report):
+    """
+    Sums and counts of ICU beds by week and by the rating each hospital
+    had at the week, as in bed_usage_by_rating, indexed by week
+    """
+    cur = report.inputs["cur"]
+    cur.execute(
+        """
+            SELECT weekly.collection_week, quality.rating,
+            sum(weekly.total_icu_beds_7_day_avg),
+            count(weekly.total_icu_beds_7_day_avg),
+            sum(weekly.icu_beds_used_7_day_avg),
+            count(weekly.icu_beds_used_7_day_avg)
+            FROM Seymour_weekly_info weekly
+            JOIN LATERAL (
+                SELECT rated.rating FROM (
+                    SELECT date, rating FROM Seymour_quality
+                    WHERE hospital_pk = weekly.hospital_pk
+                    AND date <= weekly.collection_week
+                    UNION ALL
+                    SELECT valid_from, rating FROM Seymour_rating_interval
+                    WHERE hospital_pk = weekly.hospital_pk
+                    AND valid_from <= weekly.collection_week
+                ) rated
+                ORDER BY rated.date DESC
+                LIMIT 1
+            ) quality ON TRUE
+            WHERE weekly.collection_week BETWEEN %s AND %s
+            AND quality.rating IS NOT NULL
+            GROUP BY weekly.collection_week, quality.rating
+            ORDER BY weekly.collection_week, quality.rating
+        """,
+        report["window"]
+    )
+    rating_weeks = pd.DataFrame(cur.fetchall(), columns=[
+        "collection_week",
+        "rating",
+        "total_icu_sum",
+        "total_icu_count",
+        "used_icu_sum",
+        "used_icu_count"
+    ]).astype({"total_icu_sum": float, "used_icu_sum": float})
+    rating_weeks["collection_week"] =\
+        pd.to_datetime(rating_weeks["collection_week"])
+    return rating_weeks.set_index("collection_week")
+
+
+@REPORT_FRAMES.frame
+def state_weeks(report):
+    """
+    Sums and counts of beds and COVID cases by week and state, over the
+    rows that report adult beds as in state_summary, indexed by week
+    """
+    cur = report.inputs["cur"]
+    if report["fresh"]:
+        cur.execute(
+            f"""
+                SELECT collection_week, state,
+                sum(all_adult_hospital_beds_7_day_avg_sum),
+                sum(with_beds_count), sum(covid_with_beds_sum),
+                sum(covid_with_beds_count)
+                FROM {rollups.ROLLUP_TABLE}
+                WHERE collection_week BETWEEN %s AND %s
+                AND state IS NOT NULL
+                GROUP BY collection_week, state
+                ORDER BY collection_week, state
+            """,
+            report["window"]
+        )
+    else:
+        cur.execute(
+            """
+                SELECT weekly.collection_week, hospital.state,
+                sum(weekly.all_adult_hospital_beds_7_day_avg), count(*),
+                sum(weekly.inpatient_beds_used_covid_7_day_avg),
+                count(weekly.inpatient_beds_used_covid_7_day_avg)
+                FROM Seymour_weekly_info weekly
+                JOIN Seymour_hospital hospital
+                ON hospital.hospital_pk = weekly.hospital_pk
+                WHERE weekly.collection_week BETWEEN %s AND %s
+                AND weekly.all_adult_hospital_beds_7_day_avg <> 0
+                AND hospital.state IS NOT NULL
+                GROUP BY weekly.collection_week, hospital.state
+                ORDER BY weekly.collection_week, hospital.state
+            """,
+            report["window"]
+        )
+    state_weeks = pd.DataFrame(cur.fetchall(), columns=[
+        "collection_week",
+        "State",
+        "beds_sum",
+        "beds_count",
+        "covid_sum",
+        "covid_count"
+    ]).astype({"beds_sum": float, "beds_count": int, "covid_sum": float,
+               "covid_count": int})
+    state_weeks["collection_week"] =\
+        pd.to_datetime(state_weeks["collection_week"])
+    return state_weeks.set_index("collection_week")
+
+
+@REPORT_FRAMES.frame
+def change_weeks(report):
+    """
+    Changes in COVID cases by week and state, as in
+    total_increase_by_state, indexed by week
+    The change into the first row of a week from the last row of an
+    earlier week is kept apart from the changes between rows of the week,
+    with the earlier week, so a window starting at the week can leave it
+    out.
+    """
+    cur = report.inputs["cur"]
+    cur.execute(
+        f"""
+            SELECT collection_week, state,
+            sum(covid_cases_change)
+                FILTER (WHERE previous_week = collection_week),
+            count(covid_cases_change)
+                FILTER (WHERE previous_week = collection_week),
+            sum(covid_cases_change)
+                FILTER (WHERE previous_week < collection_week),
+            count(covid_cases_change)
+                FILTER (WHERE previous_week < collection_week),
+            max(previous_week) FILTER (WHERE previous_week < collection_week)
+            FROM (
+                SELECT hospital.state, weekly.collection_week, round(
+                    weekly.inpatient_beds_used_covid_7_day_avg
+                    - lag(weekly.inpatient_beds_used_covid_7_day_avg)
+                        OVER ordered
+                ) AS covid_cases_change,
+                lag(weekly.collection_week) OVER ordered AS previous_week
+                FROM Seymour_weekly_info weekly
+                JOIN Seymour_hospital hospital
+                ON hospital.hospital_pk = weekly.hospital_pk
+                WHERE weekly.collection_week BETWEEN %s AND %s
+                AND hospital.state IS NOT NULL
+                WINDOW ordered AS (
+                    PARTITION BY hospital.state
+                    ORDER BY {WEEKLY_ROW_ORDER}
+                )
+            ) changes
+            GROUP BY collection_week, state
+            ORDER BY collection_week, state
+        """,
+        report["window"]
+    )
+    change_weeks = pd.DataFrame(cur.fetchall(), columns=[
+        "collection_week",
+        "State",
+        "within_change",
+        "within_count",
+        "into_change",
+        "into_count",
+        "previous_week"
+    ]).astype({"within_change": float, "into_change": float})
+    change_weeks["collection_week"] =\
+        pd.to_datetime(change_weeks["collection_week"])
+    change_weeks["previous_week"] =\
+        pd.to_datetime(change_weeks["previous_week"])
+    return change_weeks.set_index("collection_week")
+
+
+def batch_frames(cur, end_dates):
+    """
+    Frames by week over the weeks of every report of a batch, read from
+    the database the first time they are used
+    :param cur: Cursor of an open connection
+    :param end_dates: List of the last dates of the reports as YYYY-MM-DD
+    :return: FrameEngine of REPORT_FRAMES whose window covers every report
+    """
+    windows = [report_window(end_date) for end_date in end_dates]
+    window = (min(first for first, _ in windows),
+              max(last for _, last in windows))
+    return frames.FrameEngine(REPORT_FRAMES, provided={"window": window},
+                              cur=cur)
+
+
+def window_frames(batch, end_date):
+    """
+    Frames one report reads from the database, taken from the weeks of
+    its window in the frames of a batch
+    :param batch: FrameEngine returned by batch_frames
+    :param end_date: Last date of the report as YYYY-MM-DD
+    :return: Dictionary of frames for the report's FrameEngine
+    """
+    window = report_window(end_date)
+    first, last = pd.Timestamp(window[0]), pd.Timestamp(window[1])
+
+    # The frames by week are sorted by week, so .loc finds the window's
+    # weeks without scanning the others
+    weekly_totals = batch["weekly_totals"].loc[first:last]
+    utilization_by_type = batch["utilization_by_type"]
+    utilization_by_type = utilization_by_type[
+        utilization_by_type["collection_week"].between(first, last)
+    ].reset_index(drop=True)
+
+    ratings = batch["rating_weeks"].loc[first:last].groupby("rating").sum()
+    bed_usage_by_rating = pd.DataFrame({
+        "Average total ICU beds weekly": ratings["total_icu_sum"]
+        / ratings["total_icu_count"].where(ratings["total_icu_count"] > 0),
+        "Average used ICU beds weekly": ratings["used_icu_sum"]
+        / ratings["used_icu_count"].where(ratings["used_icu_count"] > 0)
+    }).rename_axis("Hospital overall rating").astype(float)
+
+    states = batch["state_weeks"].loc[first:last].groupby("State").sum()
+    states = states[states["beds_count"] > 0]
+    state_summary = pd.DataFrame({
+        "State": states.index,
+        "total_beds": states["beds_sum"],
+        "avg_beds": states["beds_sum"] / states["beds_count"],
+        "total_covid_cases": states["covid_sum"],
+        "avg_covid_cases": states["covid_sum"]
+        / states["covid_count"].where(states["covid_count"] > 0)
+    }).reset_index(drop=True)
+
+    # Changes into a week from a week before the window are left out,
+    # like the first row of each state in the window has no change
+    changes = batch["change_weeks"].loc[first:last]
+    into = changes["previous_week"] >= first
+    changes = pd.DataFrame({
+        "State": changes["State"],
+        "covid_cases_change": changes["within_change"].fillna(0)
+        + changes["into_change"].where(into, 0).fillna(0),
+        "count": changes["within_count"]
+        + changes["into_count"].where(into, 0)
+    }).groupby("State").sum()
+    changes = changes[changes["count"] > 0]
+    total_increase_by_state = pd.DataFrame({
+        "State": changes.index,
+        "covid_cases_change": changes["covid_cases_change"]
+    }).reset_index(drop=True)
+
+    return {
+        "window": window,
+        "weekly_totals": weekly_totals,
+        "bed_usage_by_rating": bed_usage_by_rating,
+        "state_summary": state_summary,
+        "utilization_by_type": utilization_by_type,
+        "total_increase_by_state": total_increase_by_state
+    }
+
+
+def generate_visualization1(weekly_record_counts):
     # Plotting with Plotly Express
     fig = px.bar(weekly_record_counts,
                  x=weekly_record_counts.index,
@@ -126,58 +658,7 @@ def generate_visualization1():
     return fig
 
 
-# Store plot for html
-interactive_html1 = generate_visualization1()
-html_content1 = interactive_html1.to_html(full_html=False)
-
-# TABLE 1
-
-# Group by week and summarize bed information
-beds_summary1 = sql_weekly.groupby('collection_week').agg({
-    'all_adult_hospital_beds_7_day_avg': 'sum',
-    'all_pediatric_inpatient_beds_7_day_avg': 'sum',
-    'all_adult_hospital_inpatient_bed_occupied_7_day_coverage': 'sum'
-}).tail(5)  # Last 5 weeks
-beds_summary2 = sql_weekly.groupby('collection_week').agg({
-    'all_pediatric_inpatient_bed_occupied_7_day_avg': 'sum',
-    'total_icu_beds_7_day_avg': 'sum',
-    'icu_beds_used_7_day_avg': 'sum'
-}).tail(5)  # Last 5 weeks
-beds_summary3 = sql_weekly.groupby('collection_week').agg({
-    'inpatient_beds_used_covid_7_day_avg': 'sum',
-    'staffed_icu_adult_patients_confirmed_covid_7_day_avg': 'sum'
-}).tail(5)  # Last 5 weeks
-
-# Store tables for html
-interactive_html2 = beds_summary1.to_html(classes='table table-sm',
-                                          justify='center')
-interactive_html3 = beds_summary2.to_html(classes='table table-sm',
-                                          justify='center')
-# 9 instead of 4 because third table added later
-interactive_html9 = beds_summary3.to_html(classes='table table-sm',
-                                          justify='center')
-
-# PLOT 2
-
-# Rename columns for visualization output
-merged_data['Average total ICU beds weekly'] =\
-    merged_data['total_icu_beds_7_day_avg']
-merged_data['Average used ICU beds weekly'] =\
-    merged_data['icu_beds_used_7_day_avg']
-
-# Assuming the quality rating is available and properly aligned
-# with the weekly data
-bed_usage_by_rating = merged_data.groupby('Hospital overall rating').agg({
-    'Average total ICU beds weekly': 'mean',
-    'Average used ICU beds weekly': 'mean'
-})
-
-barWidth = 0.35
-r1 = np.arange(len(bed_usage_by_rating))
-r2 = [x + barWidth for x in r1]
-
-
-def generate_visualization2():
+def generate_visualization2(bed_usage_by_rating):
     # Plotting with Plotly Express
     fig = px.bar(bed_usage_by_rating,
                  x=bed_usage_by_rating.index,
@@ -197,25 +678,17 @@ def generate_visualization2():
     return fig
 
 
-# Store plot for html
-interactive_html4 = generate_visualization2()
-html_content2 = interactive_html4.to_html(full_html=False)
-
-# PLOT 3
-
-
-def generate_visualization3():
-    # Group by week and aggregate
-    sql_weekly2 = sql_weekly
-    sql_weekly2['Average hospital beds for 7 days'] =\
-        sql_weekly2[
-            'all_adult_hospital_inpatient_bed_occupied_7_day_coverage'
-        ]
-    sql_weekly2['Average hospital covid beds for 7 days'] =\
-        sql_weekly2['inpatient_beds_used_covid_7_day_avg']
+def generate_visualization3(sql_weekly):
+    # Name the bed columns for the plot, leaving the shared frame unchanged
+    sql_weekly2 = sql_weekly.rename(columns={
+        'all_adult_hospital_inpatient_bed_occupied_7_day_coverage':
+            'Average hospital beds for 7 days',
+        'inpatient_beds_used_covid_7_day_avg':
+            'Average hospital covid beds for 7 days'
+    })
 
     # Aggregate bed typed for collection week
-    total_beds_used = sql_weekly.groupby('collection_week').agg({
+    total_beds_used = sql_weekly2.groupby('collection_week').agg({
         'Average hospital beds for 7 days': 'sum',
         'Average hospital covid beds for 7 days': 'sum'
     })
@@ -237,53 +710,7 @@ def generate_visualization3():
     return fig
 
 
-# Store plot for html
-interactive_html5 = generate_visualization3()
-html_content3 = interactive_html5.to_html(full_html=False)
-
-# PLOT 4
-
-# Merging 'sql_weekly' with 'sql_hospital' on 'hospital_pk' or 'Facility ID'
-weekly_hospital_merged = pd.merge(sql_weekly,
-                                  sql_hospital,
-                                  left_on='hospital_pk',
-                                  right_on='Facility ID',
-                                  how='inner')
-
-# Make sure values are not null
-weekly_hospital_merged =\
-    weekly_hospital_merged[weekly_hospital_merged[
-                               'all_adult_hospital_beds_7_day_avg'
-                           ].notnull()
-                           & (weekly_hospital_merged[
-                                  'all_adult_hospital_beds_7_day_avg'
-                              ] != 0)]
-
-
-# Grouping by state to find the total and average hospital beds and covid cases
-state_summary = weekly_hospital_merged.groupby('State').agg(
-    total_beds=pd.NamedAgg(column='all_adult_hospital_beds_7_day_avg',
-                           aggfunc='sum'),
-    avg_beds=pd.NamedAgg(column='all_adult_hospital_beds_7_day_avg',
-                         aggfunc='mean'),
-    total_covid_cases=pd.NamedAgg(column='inpatient_beds_used_covid_7_day_avg',
-                                  aggfunc='sum'),
-    avg_covid_cases=pd.NamedAgg(column='inpatient_beds_used_covid_7_day_avg',
-                                aggfunc='mean')
-).reset_index()
-
-# Calculating the percentage of beds used for COVID in each state
-state_summary['percent_beds_used_for_covid'] =\
-    (state_summary['total_covid_cases'] / state_summary['total_beds']) * 100
-
-# Sorting states by the fewest open beds
-# (highest percentage of beds used for COVID)
-states_fewest_open_beds =\
-    state_summary.sort_values('percent_beds_used_for_covid',
-                              ascending=False)
-
-
-def generate_visualization4():
+def generate_visualization4(states_fewest_open_beds):
     # Plotting with Plotly
     fig = px.bar(states_fewest_open_beds, x='State',
                  y='percent_beds_used_for_covid',
@@ -298,41 +725,7 @@ def generate_visualization4():
     return fig
 
 
-# Store plot for html
-interactive_html6 = generate_visualization4()
-html_content4 = interactive_html6.to_html(full_html=False)
-
-
-# PLOT 5
-
-# Merge 'sql_weekly' and 'sql_hospital' datasets
-weekly_hospital_type_merged = pd.merge(sql_weekly,
-                                       sql_hospital,
-                                       left_on='hospital_pk',
-                                       right_on='Facility ID',
-                                       how='inner')
-
-# Calculate hospital utilization percentage
-# (percentage of available beds being used)
-weekly_hospital_type_merged['hospital_utilization'] = (
-    weekly_hospital_type_merged[
-        'all_adult_hospital_inpatient_bed_occupied_7_day_coverage'
-    ] /
-    weekly_hospital_type_merged['all_adult_hospital_beds_7_day_avg']
-) * 100
-
-# Handle missing or infinite values in utilization calculation
-weekly_hospital_type_merged['hospital_utilization'] =\
-    weekly_hospital_type_merged['hospital_utilization'].replace([
-        np.inf, -np.inf
-    ], np.nan)
-
-# Convert 'collection_week' to datetime for time series plotting
-weekly_hospital_type_merged['collection_week'] =\
-    pd.to_datetime(weekly_hospital_type_merged['collection_week'])
-
-
-def generate_visualization5():
+def generate_visualization5(weekly_hospital_type_merged):
     mean_values = weekly_hospital_type_merged.groupby(
         ['collection_week', 'Hospital Type']
     )['hospital_utilization'].mean().reset_index()
@@ -357,88 +750,307 @@ def generate_visualization5():
     return fig
 
 
-# Store plot for html
-interactive_html7 = generate_visualization5()
-html_content5 = interactive_html7.to_html(full_html=False)
-
-# TABLE 2
-
-# Merge 'sql_weekly' and 'sql_hospital' datasets
-weekly_hospital_merged = pd.merge(sql_weekly,
-                                  sql_hospital,
-                                  left_on='hospital_pk',
-                                  right_on='Facility ID',
-                                  how='inner')
-
-# Sort the data by state and collection week,
-# then calculate the weekly change in COVID cases
-weekly_hospital_merged.sort_values(by=['State', 'collection_week'],
-                                   inplace=True)
-weekly_hospital_merged['covid_cases_change'] =\
-    weekly_hospital_merged.groupby('State')[
-        'inpatient_beds_used_covid_7_day_avg'
-    ].diff()
-
-# Round the change in cases to ensure they are integers
-weekly_hospital_merged['covid_cases_change'] =\
-    weekly_hospital_merged['covid_cases_change'].round()
-
-# Drop NaN values that result from the diff operation
-# (the first value in each group will be NaN)
-weekly_hospital_merged.dropna(subset=['covid_cases_change'],
-                              inplace=True)
-
-# Calculate the total increase in cases for each state
-total_increase_by_state =\
-    weekly_hospital_merged.groupby('State')[
-        'covid_cases_change'
-    ].sum().reset_index()
-
-# Sort the states by the total increase in cases
-total_increase_by_state =\
-    total_increase_by_state.sort_values(by='covid_cases_change',
-                                        ascending=False)
-
-# Display the top 10 states with the highest increase in cases
-top_10_states = total_increase_by_state.head(10)
-
-# Convert table to html
-interactive_html8 = top_10_states.to_html(classes='table table-sm',
-                                          justify='center')
-
-# Establish necessary headers for html file
-header = """
-<!DOCTYPE html>
-<html>
-<head>
-    <title>Hospitals Report</title>
-</head>
-<body>
-    <h1>Summary of Beds by Collection Week</h1>
-"""
-
-header2 = """
-    <h1>Top Ten States with the Highest Increase Cases</h1>
-"""
-
-footer = """
-</body>
-</html>
-"""
-
-# Print all stored plots and tables to an html file in reports directory
-# Note: These are not in numerical order because print order was adjusted
-# at the end of building
-with open(file_name, 'w') as f:
-    f.write(header)
-    f.write(interactive_html2)
-    f.write(interactive_html3)
-    f.write(interactive_html9)
-    f.write(header2)
-    f.write(interactive_html8)
-    f.write(html_content1)
-    f.write(html_content2)
-    f.write(html_content3)
-    f.write(html_content4)
-    f.write(html_content5)
-    f.write(footer)
+def _json_script(element_id, value):
+    """
+    HTML element holding a value as JSON, for RENDER_SCRIPT to read
+    :param element_id: id of the element
+    :param value: Value to store
+    :return: HTML of a script element that is not run
+    """
+    # Escape "<" so a string holding "</script>" cannot end the element
+    text = pio.json.to_json_plotly(value).replace("<", "\\u003c")
+    return (f'<script type="application/json" id="{element_id}">{text}'
+            + '</script>\n')
+
+
+def chart_html(fig, chart_id):
+    """
+    HTML of a chart drawn by RENDER_SCRIPT when it is scrolled near
+    The figure is stored without the default template, which
+    charts_script stores once for every chart.
+    :param fig: Plotly figure
+    :param chart_id: id of the chart, unique within the report
+    :return: HTML of the chart
+    """
+    figure = fig.to_plotly_json()
+    template = pio.templates[pio.templates.default].to_plotly_json()
+    if figure["layout"].get("template") == template:
+        figure["layout"] = {key: value for key, value
+                            in figure["layout"].items() if key != "template"}
+    return (f'<div id="{chart_id}" class="report-chart"'
+            + f' style="height:{CHART_HEIGHT}; width:100%;"></div>\n'
+            + _json_script(f"{chart_id}-figure", figure))
+
+
+def write_plotly_js(directory):
+    """
+    Write PLOTLY_JS_FILE into a directory if it is not there yet, for the
+    reports written there in "shared" mode
+    :param directory: Directory of the reports
+    :return: Path of the file
+    """
+    path = os.path.join(directory, PLOTLY_JS_FILE)
+    if not os.path.exists(path):
+        # Write under a name of this writer's own, then rename, so
+        # reports written at the same time, in processes or threads,
+        # never read half a file
+        handle, partial = tempfile.mkstemp(
+            dir=directory or ".", prefix=f"{PLOTLY_JS_FILE}.",
+            suffix=".partial"
+        )
+        with os.fdopen(handle, 'w') as f:
+            f.write(plotly.offline.get_plotlyjs())
+        os.chmod(partial, 0o644)
+        try:
+            os.replace(partial, path)
+        except OSError:
+            # Another writer put the same file in place first
+            os.remove(partial)
+            if not os.path.exists(path):
+                raise
+    return path
+
+
+def charts_script(file_name, plotly_mode):
+    """
+    HTML that loads plotly.js once and draws the charts of a report
+    In "shared" mode, PLOTLY_JS_FILE is written next to the report if it
+    is not there yet.
+    :param file_name: Path of the HTML file of the report
+    :param plotly_mode: One of PLOTLY_MODES
+    :return: HTML of the scripts, placed after the charts
+    """
+    if plotly_mode == "shared":
+        write_plotly_js(os.path.dirname(file_name))
+        library = f'<script src="{PLOTLY_JS_FILE}"></script>\n'
+    else:
+        library = ('<script type="text/javascript">'
+                   + plotly.offline.get_plotlyjs() + '</script>\n')
+    template = pio.templates[pio.templates.default].to_plotly_json()
+    return (library + _json_script("chart-template", template)
+            + RENDER_SCRIPT)
+
+
+def write_report(report, file_name, plotly_mode="inline"):
+    """
+    Write a report to an HTML file
+    :param report: FrameEngine returned by report_frames
+    :param file_name: Path of the HTML file
+    :param plotly_mode: One of PLOTLY_MODES
+    :return: False if there is no data in the weeks the report covers, in
+    which case no file is written
+    """
+    # Check that there is data to visualize
+    if report["weekly_totals"].empty:
+        return False
+
+    # PLOT 1
+
+    # Store plot for html
+    interactive_html1 =\
+        generate_visualization1(report["weekly_record_counts"])
+    html_content1 = chart_html(interactive_html1, "chart1")
+
+    # TABLE 1
+
+    # Summarize bed information by week
+    recent_weekly_totals = report["recent_weekly_totals"]
+    beds_summary1 = recent_weekly_totals[[
+        'all_adult_hospital_beds_7_day_avg',
+        'all_pediatric_inpatient_beds_7_day_avg',
+        'all_adult_hospital_inpatient_bed_occupied_7_day_coverage'
+    ]]
+    beds_summary2 = recent_weekly_totals[[
+        'all_pediatric_inpatient_bed_occupied_7_day_avg',
+        'total_icu_beds_7_day_avg',
+        'icu_beds_used_7_day_avg'
+    ]]
+    beds_summary3 = recent_weekly_totals[[
+        'inpatient_beds_used_covid_7_day_avg',
+        'staffed_icu_adult_patients_confirmed_covid_7_day_avg'
+    ]]
+
+    # Store tables for html
+    interactive_html2 = beds_summary1.to_html(classes='table table-sm',
+                                              justify='center')
+    interactive_html3 = beds_summary2.to_html(classes='table table-sm',
+                                              justify='center')
+    # 9 instead of 4 because third table added later
+    interactive_html9 = beds_summary3.to_html(classes='table table-sm',
+                                              justify='center')
+
+    # PLOT 2
+
+    # Store plot for html
+    interactive_html4 = generate_visualization2(report["bed_usage_by_rating"])
+    html_content2 = chart_html(interactive_html4, "chart2")
+
+    # PLOT 3
+
+    # Store plot for html
+    interactive_html5 = generate_visualization3(report["weekly_totals"])
+    html_content3 = chart_html(interactive_html5, "chart3")
+
+    # PLOT 4
+
+    # Store plot for html
+    interactive_html6 =\
+        generate_visualization4(report["states_fewest_open_beds"])
+    html_content4 = chart_html(interactive_html6, "chart4")
+
+    # PLOT 5
+
+    # Store plot for html
+    interactive_html7 = generate_visualization5(report["utilization_by_type"])
+    html_content5 = chart_html(interactive_html7, "chart5")
+
+    # TABLE 2
+
+    # Convert table to html
+    interactive_html8 = report["top_10_states"].to_html(
+        classes='table table-sm', justify='center'
+    )
+
+    # Print all stored plots and tables to an html file in reports directory
+    # Note: These are not in numerical order because print order was adjusted
+    # at the end of building
+    with open(file_name, 'w') as f:
+        f.write(header)
+        f.write(interactive_html2)
+        f.write(interactive_html3)
+        f.write(interactive_html9)
+        f.write(header2)
+        f.write(interactive_html8)
+        f.write(html_content1)
+        f.write(html_content2)
+        f.write(html_content3)
+        f.write(html_content4)
+        f.write(html_content5)
+        f.write(charts_script(file_name, plotly_mode))
+        f.write(footer)
+    return True
+
+
+def _write_window_report(job):
+    """
+    Write one report of a batch, in a process of the pool
+    :param job: Tuple of the file name, the end date, the frames returned
+    by window_frames and the plotly mode
+    :return: True if the report was written
+    """
+    file_name, end_date, provided, plotly_mode = job
+    report = frames.FrameEngine(REPORT_FRAMES, provided=provided,
+                                end_date=end_date)
+    return write_report(report, file_name, plotly_mode)
+
+
+def write_reports(cur, reports, plotly_mode="inline", workers=None):
+    """
+    Write many reports, reading the database once for all of them and
+    writing the files in a pool of processes
+    :param cur: Cursor of an open connection
+    :param reports: List of (file name, end date as YYYY-MM-DD) pairs
+    :param plotly_mode: One of PLOTLY_MODES
+    :param workers: Number of processes (default: the number of CPUs)
+    :return: List of the end dates without data, whose reports were not
+    written
+    """
+    batch = batch_frames(cur, [end_date for _, end_date in reports])
+    jobs = [(file_name, end_date, window_frames(batch, end_date),
+             plotly_mode) for file_name, end_date in reports]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        written = list(executor.map(_write_window_report, jobs))
+    return [end_date for (_, end_date), done in zip(reports, written)
+            if not done]
+
+
+def parse_args():
+    """
+    Get the report file, its dates and output options from commandline
+    :return: Parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        description="Write a report on the weeks up to a date, or one"
+                    " report for each of many dates"
+    )
+    parser.add_argument("file_name", help="HTML file written to the reports"
+                                          " directory; with many dates,"
+                                          " {date} is replaced by each date,"
+                                          " as in report_{date:%%Y_%%m_%%d}"
+                                          ".html")
+    parser.add_argument("end_dates", nargs="+", metavar="end_date",
+                        help="Last date of a report as YYYY-MM-DD")
+    parser.add_argument("--through", default=None,
+                        help="Write a report every --every days from the"
+                             " end date through this date")
+    parser.add_argument("--every", type=int, default=7,
+                        help="Number of days between reports with"
+                             " --through")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Number of processes writing reports of many"
+                             " dates (default: the number of CPUs)")
+    parser.add_argument("--plotly", choices=PLOTLY_MODES, default="inline",
+                        help="Write plotly.js into the report once"
+                             " (inline), or load it from a file next to"
+                             " the reports shared by all of them (shared)")
+    args = parser.parse_args()
+    if args.through is not None:
+        if len(args.end_dates) != 1:
+            parser.error("--through takes a single end date")
+        if args.every < 1:
+            parser.error("--every must be at least 1")
+        if pd.to_datetime(args.through) < pd.to_datetime(args.end_dates[0]):
+            parser.error("--through is before the end date")
+        args.end_dates = [
+            str(date.date()) for date in pd.date_range(
+                args.end_dates[0], args.through, freq=f"{args.every}D"
+            )
+        ]
+    if len(args.end_dates) > 1 and "{date" not in args.file_name:
+        parser.error("the file name needs {date} to write many reports")
+    return args
+
+
+def main():
+    """
+    Write the reports named on the commandline
+    """
+    args = parse_args()
+
+    # Store filename of each date from commandline
+    reports = [
+        ("reports/" + args.file_name.format(
+            date=pd.to_datetime(end_date).date()
+        ), end_date) for end_date in args.end_dates
+    ]
+
+    # Connect to server, which stays open while the reports read their
+    # frames
+    conn = db.connect()
+    cur = conn.cursor()
+    start = time.perf_counter()
+    if len(reports) == 1:
+        file_name, end_date = reports[0]
+        written = write_report(report_frames(cur, end_date), file_name,
+                               args.plotly)
+        missing = [] if written else [end_date]
+    else:
+        missing = write_reports(cur, reports, args.plotly, args.workers)
+
+    # Close server connection
+    conn.commit()
+    conn.close()
+
+    if len(reports) == 1:
+        if missing:
+            print("No data associated with given week!")
+            sys.exit()
+        return
+    for end_date in missing:
+        print(f"No data associated with the week of {end_date}!")
+    print(f"Wrote {len(reports) - len(missing)} reports in"
+          + f" {time.perf_counter() - start:.2f} seconds.")
+
+
+if __name__ == "__main__":
+    main()
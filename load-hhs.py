@@ -1,38 +1,22 @@
-import sys
-import pandas as pd
-import credentials
-# install package psycopg2-binary
-import psycopg2
-
-# Get name of file from commandline
-file_name = sys.argv[1]
-
-# Read in given file from data file for Seymour_weekly table
-hospital_weekly = pd.read_csv(file_name)
-
-# Select specific columns from hospital_weekly that will be added
-# to Seymour_geo
-# Store these columns in a data frame
-hospital_geo = hospital_weekly[[
-    "hospital_pk",
-    "fips_code",
-    "geocoded_hospital_address"
-]]
-
-# Remove all duplicate hospital_pk values from hospital_geo
-hospital_geo = hospital_geo.drop_duplicates(subset=["hospital_pk"])
-
-# Connect to SQL
-conn = psycopg2.connect(
-    host=credentials.get_hostname(), dbname=credentials.get_db(),
-    user=credentials.get_username(), password=credentials.get_password()
-)
-cur = conn.cursor()
-
-# Get the current Seymour_weekly_info from the server and save it
-# as a data frame
-cur.execute("SELECT * FROM Seymour_weekly_info")
-sql_weekly = pd.DataFrame(cur.fetchall(), columns=[
+import argparse
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import bulk_load
+import cleaning
+import db
+import manifest
+import partitions
+import parse_cache
+import readers
+import rejects
+import rollups
+import validation
+
+# Columns of the Seymour_weekly_info table
+weekly_columns = [
     "hospital_pk",
     "collection_week",
     "all_adult_hospital_beds_7_day_avg",
@@ -42,299 +26,495 @@ sql_weekly = pd.DataFrame(cur.fetchall(), columns=[
     "total_icu_beds_7_day_avg",
     "icu_beds_used_7_day_avg",
     "inpatient_beds_used_covid_7_day_avg",
-    "staffed_icu_adult_patients_confirmed_covid_7_day_avg"
-])
-
-# Get length of rows to find duplicates
-weekly_rows = len(hospital_weekly.index)
-
-# Check that there are no existing pairs of hospital_pk and collection_week
-exclusion_pairs = set(zip(sql_weekly["hospital_pk"].tolist(),
-                          sql_weekly["collection_week"]
-                          .apply(lambda x: x.strftime('%Y-%m-%d'))
-                          .tolist()))
-# Remove existing pairs as needed
-hospital_weekly = hospital_weekly[
-    ~hospital_weekly[
-        ["hospital_pk", "collection_week"]
-    ].apply(tuple, axis=1).isin(exclusion_pairs)
+    "staffed_icu_adult_patients_confirmed_covid_7_day_avg",
+    "file_row"
 ]
-# Fix indices for formatting
-hospital_weekly.reset_index(drop=True, inplace=True)
-
-# Find the number of duplicates dropped
-duplicates_dropped_weekly = weekly_rows - len(hospital_weekly.index)
 
-# Get the current Seymour_geo from the server and save it as a data frame
-cur.execute("SELECT * FROM Seymour_geo")
-sql_geo = pd.DataFrame(cur.fetchall(), columns=[
+# Columns of the Seymour_geo table
+geo_columns = [
     "hospital_pk",
     "fips_code",
     "hosptial_geocode"
-])
-
-# Get length of rows to find duplicates
-geo_rows = len(hospital_geo.index)
-
-# Only add non-existing hospital_pk values to the table
-id_list = sql_geo["hospital_pk"].tolist()
-# Remove existing hospital_pk values
-hospital_geo = hospital_geo[~hospital_geo["hospital_pk"].isin(id_list)]
-# Fix indices for formatting
-hospital_geo.reset_index(drop=True, inplace=True)
-
-# Find the number of duplicates dropped
-duplicates_dropped_geo = geo_rows - len(hospital_geo.index)
-
-# Placeholders for number of rows added and skipped
-added_weekly = 0
-skipped_weekly = 0
-
-# Empty dataframe to store error rows (omissions)
-omitted_weekly_df = pd.DataFrame(columns=sql_weekly.columns)
-omitted_weekly_df = omitted_weekly_df.astype(str)
-
-# Map each variable into Seymour_weekly_info and insert the values
-for i in range(len(hospital_weekly)):
-    try:
-        cur.execute(
-            """
-                INSERT INTO Seymour_weekly_info
-                (hospital_pk,
-                collection_week,
-                all_adult_hospital_beds_7_day_avg,
-                all_pediatric_inpatient_beds_7_day_avg,
-                all_adult_hospital_inpatient_bed_occupied_7_day_coverage,
-                all_pediatric_inpatient_bed_occupied_7_day_avg,
-                total_icu_beds_7_day_avg,
-                icu_beds_used_7_day_avg,
-                inpatient_beds_used_covid_7_day_avg,
-                staffed_icu_adult_patients_confirmed_covid_7_day_avg)
-                VALUES
-                (%(hospital_pk)s,
-                %(collection_week)s,
-                %(all_adult_hospital_beds_7_day_avg)s,
-                %(all_pediatric_inpatient_beds_7_day_avg)s,
-                %(all_adult_hospital_inpatient_bed_occupied_7_day_coverage)s,
-                %(all_pediatric_inpatient_bed_occupied_7_day_avg)s,
-                %(total_icu_beds_7_day_avg)s,
-                %(icu_beds_used_7_day_avg)s,
-                %(inpatient_beds_used_covid_7_day_avg)s,
-                %(staffed_icu_adult_patients_confirmed_covid_7_day_avg)s);
-            """,
-            {
-                'hospital_pk':
-                hospital_weekly['hospital_pk'][i],
-                'collection_week':
-                hospital_weekly['collection_week'][i],
-                'all_adult_hospital_beds_7_day_avg':
-                hospital_weekly['all_adult_hospital_beds_7_day_avg'][i].item(),
-                'all_pediatric_inpatient_beds_7_day_avg':
-                hospital_weekly[
-                    'all_pediatric_inpatient_beds_7_day_avg'
-                ][i].item(),
-                'all_adult_hospital_inpatient_bed_occupied_7_day_coverage':
-                hospital_weekly[
-                    'all_adult_hospital_inpatient_bed_occupied_7_day_coverage'
-                ][i].item(),
-                'all_pediatric_inpatient_bed_occupied_7_day_avg':
-                hospital_weekly[
-                    'all_pediatric_inpatient_bed_occupied_7_day_avg'
-                ][i].item(),
-                'total_icu_beds_7_day_avg':
-                hospital_weekly['total_icu_beds_7_day_avg'][i].item(),
-                'icu_beds_used_7_day_avg':
-                hospital_weekly['icu_beds_used_7_day_avg'][i].item(),
-                'inpatient_beds_used_covid_7_day_avg':
-                hospital_weekly[
-                    'inpatient_beds_used_covid_7_day_avg'
-                ][i].item(),
-                'staffed_icu_adult_patients_confirmed_covid_7_day_avg':
-                hospital_weekly[
-                    'staffed_icu_adult_patients_confirmed_covid_7_day_avg'
-                ][i].item()
-            })
-        # Add to count for successes
-        added_weekly = added_weekly + 1
-    except Exception:
-        # Append the new failed row to a dataframe of omissions
-        new_row = {'hospital_pk': str(hospital_weekly['hospital_pk'][i]),
-                   'collection_week':
-                       str(hospital_weekly['collection_week'][i]),
-                   'all_adult_hospital_beds_7_day_avg':
-                       str(hospital_weekly[
-                               'all_adult_hospital_beds_7_day_avg'
-                           ][i]),
-                   'all_pediatric_inpatient_beds_7_day_avg':
-                       str(hospital_weekly[
-                               'all_pediatric_inpatient_beds_7_day_avg'
-                           ][i]),
-                   'all_adult_hospital_inpatient_bed_occupied_7_day_coverage':
-                       str(hospital_weekly[
-                        'all_adult_hospital_inpatient_\
-                            bed_occupied_7_day_coverage'
-                           ][i]),
-                   'all_pediatric_inpatient_bed_occupied_7_day_avg':
-                       str(hospital_weekly[
-                            'all_pediatric_inpatient_bed_occupied_7_day_avg'
-                           ][i]),
-                   'total_icu_beds_7_day_avg':
-                       str(hospital_weekly['total_icu_beds_7_day_avg'][i]),
-                   'icu_beds_used_7_day_avg':
-                       str(hospital_weekly['icu_beds_used_7_day_avg'][i]),
-                   'inpatient_beds_used_covid_7_day_avg':
-                       str(hospital_weekly[
-                               'inpatient_beds_used_covid_7_day_avg'
-                           ][i]),
-                   'staffed_icu_adult_patients_confirmed_covid_7_day_avg':
-                       str(hospital_weekly[
-                            'staffed_icu_adult_patients_\
-                                confirmed_covid_7_day_avg'
-                           ][i])
-                   }
-        omitted_weekly_df.loc[len(omitted_weekly_df)] = new_row
-        # Export the omission dataframe to a csv
-        omitted_weekly_df.to_csv('omitted/omitted_weekly.csv', index=False)
-        # Add to count for failures
-        skipped_weekly = skipped_weekly + 1
-
-# Change all negative values to NULL for the 8 following variables
-cur.execute(
+]
+
+
+def parse_args(argv=None):
     """
-        UPDATE Seymour_weekly_info
-        SET all_adult_hospital_beds_7_day_avg = NULL
-        WHERE all_adult_hospital_beds_7_day_avg < 0
+    Get names of files and load options from commandline
+    :param argv: List of arguments, by default those of the commandline
+    :return: Parsed arguments
     """
-)
-cur.execute(
+    parser = argparse.ArgumentParser(
+        description="Load weekly HHS files into the database"
+    )
+    parser.add_argument("file_names", nargs="+",
+                        help="CSV files of weekly HHS data, directories of"
+                             " them, or glob patterns")
+    parser.add_argument("--row-by-row", action="store_true",
+                        help="Insert one row at a time instead of using"
+                             " COPY")
+    parser.add_argument("--batch-size", type=int, default=10000,
+                        help="Number of rows sent per COPY")
+    parser.add_argument("--chunk-size", type=int, default=None,
+                        help="Read and load a single file this many rows"
+                             " at a time")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Number of processes parsing files when"
+                             " several are given (default: one per core)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Parse every file even if it was parsed before")
+    parser.add_argument("--force", action="store_true",
+                        help="Load files even if the manifest shows they"
+                             " were already loaded")
+    parser.add_argument("--overlap", action="store_true",
+                        help="Parse the next chunks or files in the"
+                             " background while earlier ones are written,"
+                             " taking several files in order of file name")
+    parser.add_argument("--queue-size", type=int, default=2,
+                        help="Number of chunks or files parsed ahead of"
+                             " writing with --overlap")
+    parser.add_argument("--bulk-session", action="store_true",
+                        help="Tune the database session for bulk loading"
+                             " (asynchronous commit, more work memory)"
+                             " for the length of the load")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Only read and validate the files, printing"
+                             " how many rows would be staged, without"
+                             " connecting to the database")
+    return parser.parse_args(argv)
+
+
+def expand_file_names(names):
+    """
+    Expand directories and glob patterns into a list of CSV files
+    :param names: File names, directories or glob patterns
+    :return: Sorted list of file names without repeats
     """
-        UPDATE Seymour_weekly_info
-        SET all_pediatric_inpatient_beds_7_day_avg = NULL
-        WHERE all_pediatric_inpatient_beds_7_day_avg < 0
+    file_names = set()
+    for name in names:
+        if os.path.isdir(name):
+            file_names.update(glob.glob(os.path.join(name, "*-hhs-data.csv")))
+        elif glob.has_magic(name):
+            file_names.update(glob.glob(name))
+        else:
+            file_names.add(name)
+    return sorted(file_names)
+
+
+def read_batches(file_names, chunk_size=None, workers=None, use_cache=True,
+                 per_file=False):
     """
-)
-cur.execute(
+    Read and clean the given files, grouped into batches that are each
+    deduplicated against the database in a single pass
+    A single file read in chunks is streamed one chunk per batch so
+    memory use stays bounded. Otherwise the files form one batch, ordered
+    by collection_week, and several files are parsed in a pool of
+    processes. Whole files are taken from the parse cache when possible.
+    :param file_names: List of CSV files
+    :param chunk_size: Number of rows per chunk when reading one file
+    :param workers: Number of processes parsing files
+    :param use_cache: Reuse frames parsed from the same file contents
+    :param per_file: Give each of several files as its own batch, in
+    order of file name, as soon as it is parsed
+    :return: Iterable of lists of (file name, cleaned data frame) pairs
+    """
+    if len(file_names) == 1 and chunk_size is not None:
+        for chunk in readers.read_hhs(file_names[0], chunk_size=chunk_size):
+            # Change negative values and missing-value strings to NULL
+            # before the rows are written, following the rules for each
+            # column
+            yield [(file_names[0],
+                    cleaning.clean_frame(chunk, cleaning.HHS_RULES))]
+        return
+    read = partial(readers.read_clean_hhs, use_cache=use_cache)
+    if len(file_names) == 1:
+        yield [(file_names[0], read(file_names[0]))]
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        if per_file:
+            for file_name, frame in zip(file_names,
+                                        pool.map(read, file_names)):
+                yield [(file_name, frame)]
+            return
+        frames = list(pool.map(read, file_names))
+    # Apply the files in order of the weeks they hold
+    batch = [(file_name, frame) for file_name, frame
+             in zip(file_names, frames) if len(frame.index) > 0]
+    batch.sort(key=lambda pair: pair[1]["collection_week"].astype(str).min())
+    yield batch
+
+
+def create_staging_tables(cur):
     """
-        UPDATE Seymour_weekly_info
-        SET all_adult_hospital_inpatient_bed_occupied_7_day_coverage = NULL
-        WHERE all_adult_hospital_inpatient_bed_occupied_7_day_coverage < 0
+    Create empty staging tables for Seymour_weekly_info and Seymour_geo
+    :param cur: Cursor of an open connection
     """
-)
-cur.execute(
+    bulk_load.create_staging_table(cur, "Seymour_weekly_info")
+    bulk_load.create_staging_table(cur, "Seymour_geo")
+
+
+def split_frame(hospital_weekly):
+    """
+    Split a cleaned HHS frame into the rows of Seymour_weekly_info and of
+    Seymour_geo
+    :param hospital_weekly: Cleaned data frame of weekly HHS data
+    :return: Tuple of the data frame for Seymour_weekly_info and the data
+    frame for Seymour_geo
+    """
+    # Keep only the columns of Seymour_weekly_info, adding the position
+    # of each row in its file, which the index holds as files are read
+    # with a default index that chunks carry on
+    weekly_insert = hospital_weekly.assign(
+        file_row=hospital_weekly.index
+    )[weekly_columns]
+
+    # Select specific columns from hospital_weekly that will be added to
+    # Seymour_geo, renamed to match the table
+    hospital_geo = hospital_weekly[[
+        "hospital_pk",
+        "fips_code",
+        "geocoded_hospital_address"
+    ]].rename(columns={"geocoded_hospital_address": "hosptial_geocode"})
+
+    # Remove all duplicate hospital_pk values from hospital_geo
+    hospital_geo = hospital_geo.drop_duplicates(subset=["hospital_pk"])
+    return weekly_insert, hospital_geo
+
+
+def stage_batch(cur, batch, args, omitted_weekly, omitted_geo, file_stats):
+    """
+    Append a batch of frames to the staging tables, leaving out rows that
+    fail validation
+    :param cur: Cursor of an open connection
+    :param batch: List of (file name, cleaned data frame) pairs of
+    weekly HHS data
+    :param args: Parsed commandline arguments
+    :param omitted_weekly: Reject log for Seymour_weekly_info
+    :param omitted_geo: Reject log for Seymour_geo
+    :param file_stats: Dictionary of file name to [rows read, rows
+    rejected] that the rows of the batch are counted into
+    :return: Tuple of rows staged for Seymour_weekly_info and for
+    Seymour_geo, then rows that failed validation for each
+    """
+    staged_weekly = 0
+    staged_geo = 0
+    invalid_weekly_rows = 0
+    invalid_geo_rows = 0
+    for file_name, hospital_weekly in batch:
+        weekly_insert, hospital_geo = split_frame(hospital_weekly)
+
+        # Check whole columns at once against the constraints of the
+        # tables and send the rows that fail to the reject logs, so they
+        # never reach the database
+        invalid_weekly = validation.validate(weekly_insert,
+                                             validation.WEEKLY_CHECKS)
+        omitted_weekly.add_frame(weekly_insert, invalid_weekly)
+        weekly_insert = weekly_insert.drop(
+            index=[label for label, _ in invalid_weekly]
+        )
+        invalid_geo = validation.validate(hospital_geo,
+                                          validation.GEO_CHECKS)
+        omitted_geo.add_frame(hospital_geo, invalid_geo)
+        hospital_geo = hospital_geo.drop(
+            index=[label for label, _ in invalid_geo]
+        )
+        invalid_weekly_rows = invalid_weekly_rows + len(invalid_weekly)
+        invalid_geo_rows = invalid_geo_rows + len(invalid_geo)
+
+        # Stream all rows into a staging copy of Seymour_weekly_info with
+        # batched COPYs, isolating any rows the database rejects
+        failed_weekly = bulk_load.stage_frame(cur, weekly_insert,
+                                              "Seymour_weekly_info",
+                                              row_by_row=args.row_by_row,
+                                              batch_size=args.batch_size)
+        omitted_weekly.add_frame(weekly_insert, failed_weekly)
+        staged_weekly = staged_weekly + \
+            len(weekly_insert.index) - len(failed_weekly)
+
+        # Stream all rows into a staging copy of Seymour_geo with batched
+        # COPYs, isolating any rows the database rejects
+        failed_geo = bulk_load.stage_frame(cur, hospital_geo, "Seymour_geo",
+                                           row_by_row=args.row_by_row,
+                                           batch_size=args.batch_size)
+        omitted_geo.add_frame(hospital_geo, failed_geo)
+        staged_geo = staged_geo + len(hospital_geo.index) - len(failed_geo)
+
+        # Count the rows of the file for the manifest
+        stats = file_stats.setdefault(file_name, [0, 0])
+        stats[0] = stats[0] + len(hospital_weekly.index)
+        stats[1] = stats[1] + len(invalid_weekly) + len(invalid_geo) \
+            + len(failed_weekly) + len(failed_geo)
+
+    return staged_weekly, staged_geo, invalid_weekly_rows, invalid_geo_rows
+
+
+def move_staged(cur):
     """
-        UPDATE Seymour_weekly_info
-        SET all_pediatric_inpatient_bed_occupied_7_day_avg = NULL
-        WHERE all_pediatric_inpatient_bed_occupied_7_day_avg < 0
+    Move the new rows of the staging tables into the tables
+    :param cur: Cursor of an open connection
+    :return: Tuple of rows added to Seymour_weekly_info and to
+    Seymour_geo
     """
-)
-cur.execute(
+    # Create the monthly partitions the staged weeks need, when
+    # Seymour_weekly_info is partitioned
+    partitions.ensure_partitions(
+        cur, "Seymour_weekly_info",
+        bulk_load.staging_table("Seymour_weekly_info")
+    )
+
+    # Move staged rows across unless their pair of hospital_pk and
+    # collection_week already exists
+    added_weekly = bulk_load.insert_new_rows(
+        cur, "Seymour_weekly_info", ["hospital_pk", "collection_week"]
+    )
+
+    # Only add non-existing hospital_pk values to Seymour_geo
+    added_geo = bulk_load.insert_new_rows(cur, "Seymour_geo", ["hospital_pk"])
+
+    # Recompute the report's rollups of the weeks just loaded
+    rollups.refresh_weeks(cur, bulk_load.staging_table("Seymour_weekly_info"))
+
+    return added_weekly, added_geo
+
+
+def load_batch(cur, batch, args, omitted_weekly, omitted_geo, file_stats):
     """
-        UPDATE Seymour_weekly_info
-        SET total_icu_beds_7_day_avg = NULL
-        WHERE total_icu_beds_7_day_avg < 0
+    Stage a batch of frames and move the new rows into the tables
+    :param cur: Cursor of an open connection
+    :param batch: List of (file name, cleaned data frame) pairs of
+    weekly HHS data
+    :param args: Parsed commandline arguments
+    :param omitted_weekly: Reject log for Seymour_weekly_info
+    :param omitted_geo: Reject log for Seymour_geo
+    :param file_stats: Dictionary of file name to [rows read, rows
+    rejected] that the rows of the batch are counted into
+    :return: Tuple of rows added to and duplicates dropped for
+    Seymour_weekly_info, then the same for Seymour_geo, then rows that
+    failed validation for each
     """
-)
-cur.execute(
+    create_staging_tables(cur)
+    staged_weekly, staged_geo, invalid_weekly, invalid_geo = stage_batch(
+        cur, batch, args, omitted_weekly, omitted_geo, file_stats
+    )
+    added_weekly, added_geo = move_staged(cur)
+    return (added_weekly, staged_weekly - added_weekly,
+            added_geo, staged_geo - added_geo, invalid_weekly, invalid_geo)
+
+
+def load_files(conn, args, start=None):
     """
-        UPDATE Seymour_weekly_info
-        SET icu_beds_used_7_day_avg = NULL
-        WHERE icu_beds_used_7_day_avg < 0
+    Load the files given in the arguments and commit them
+    :param conn: Open connection, with no transaction in progress
+    :param args: Parsed arguments
+    :param start: perf_counter value the load started at, for the
+    duration recorded in the manifest
+    :return: Dictionary of row counts, or None if the manifest shows
+    every file was already loaded
     """
-)
-cur.execute(
+    if start is None:
+        start = time.perf_counter()
+    file_names = expand_file_names(args.file_names)
+    cur = conn.cursor()
+
+    # Skip files whose contents the manifest shows were already loaded
+    content_hashes = {}
+    for file_name in file_names:
+        content_hashes[file_name] = parse_cache.file_hash(file_name)
+        status = manifest.find_load(cur, "hhs", content_hashes[file_name])
+        if status is not None and not args.force:
+            print(f"Skipping {file_name}: its contents were already loaded"
+                  + f" ({status}). Pass --force to load it again.")
+            del content_hashes[file_name]
+    file_names = [name for name in file_names if name in content_hashes]
+    if not file_names:
+        conn.rollback()
+        return None
+
+    # Settings end with the load's transaction
+    if args.bulk_session:
+        db.apply_bulk_load_settings(cur)
+
+    # Running totals across all batches
+    duplicates_dropped_weekly = 0
+    duplicates_dropped_geo = 0
+    added_weekly = 0
+    added_geo = 0
+    invalid_weekly = 0
+    invalid_geo = 0
+
+    # Rows that raise errors (omissions) are appended to one file per
+    # table for this run
+    run_id = rejects.new_run_id()
+    omitted_weekly = rejects.RejectLog("weekly", weekly_columns, run_id)
+    omitted_geo = rejects.RejectLog("geo", geo_columns, run_id)
+
+    # Read in given files from data file for Seymour_weekly table and
+    # load them one batch at a time
+    file_stats = {}
+    batches = read_batches(file_names, chunk_size=args.chunk_size,
+                           workers=args.workers, use_cache=not args.no_cache,
+                           per_file=args.overlap)
+    if args.overlap:
+        # Stage each chunk or file while the next ones are parsed in the
+        # background, then move all of the staged rows across in one pass
+        create_staging_tables(cur)
+        staged_weekly = 0
+        staged_geo = 0
+        for batch in readers.prefetch(batches, queue_size=args.queue_size):
+            staged = stage_batch(cur, batch, args, omitted_weekly,
+                                 omitted_geo, file_stats)
+            staged_weekly = staged_weekly + staged[0]
+            staged_geo = staged_geo + staged[1]
+            invalid_weekly = invalid_weekly + staged[2]
+            invalid_geo = invalid_geo + staged[3]
+        added_weekly, added_geo = move_staged(cur)
+        duplicates_dropped_weekly = staged_weekly - added_weekly
+        duplicates_dropped_geo = staged_geo - added_geo
+    else:
+        for batch in batches:
+            counts = load_batch(cur, batch, args, omitted_weekly,
+                                omitted_geo, file_stats)
+            added_weekly = added_weekly + counts[0]
+            duplicates_dropped_weekly = duplicates_dropped_weekly + counts[1]
+            added_geo = added_geo + counts[2]
+            duplicates_dropped_geo = duplicates_dropped_geo + counts[3]
+            invalid_weekly = invalid_weekly + counts[4]
+            invalid_geo = invalid_geo + counts[5]
+
+    # Record each file in the manifest; rows added can only be told
+    # apart per file when a single file was loaded
+    duration = time.perf_counter() - start
+    for file_name in file_names:
+        rows_read, rows_rejected = file_stats.get(file_name, [0, 0])
+        manifest.record_load(
+            cur, "hhs", file_name, content_hashes[file_name], rows_read,
+            added_weekly + added_geo if len(file_names) == 1 else None,
+            rows_rejected, duration
+        )
+    conn.commit()
+
+    # Write out any omissions still buffered
+    omitted_weekly.flush()
+    omitted_geo.flush()
+
+    return {
+        "added_weekly": added_weekly,
+        "added_geo": added_geo,
+        "duplicates_dropped_weekly": duplicates_dropped_weekly,
+        "duplicates_dropped_geo": duplicates_dropped_geo,
+        # The reject logs hold the rows that failed validation as well as
+        # the rows the database rejected
+        "invalid_weekly": invalid_weekly,
+        "invalid_geo": invalid_geo,
+        "skipped_weekly": omitted_weekly.count - invalid_weekly,
+        "skipped_geo": omitted_geo.count - invalid_geo
+    }
+
+
+def dry_run(args):
     """
-        UPDATE Seymour_weekly_info
-        SET inpatient_beds_used_covid_7_day_avg = NULL
-        WHERE inpatient_beds_used_covid_7_day_avg < 0
+    Read and validate the files given in the arguments without
+    connecting to the database
+    :param args: Parsed arguments
+    :return: Dictionary of row counts, with the failing rows of each
+    table counted by column and check
     """
-)
-cur.execute(
+    file_names = expand_file_names(args.file_names)
+    rows_read = 0
+    passed_weekly = 0
+    passed_geo = 0
+    errors_weekly = []
+    errors_geo = []
+    for batch in read_batches(file_names, chunk_size=args.chunk_size,
+                              workers=args.workers,
+                              use_cache=not args.no_cache, per_file=True):
+        for _, hospital_weekly in batch:
+            weekly_insert, hospital_geo = split_frame(hospital_weekly)
+            failed_weekly = validation.validate(weekly_insert,
+                                                validation.WEEKLY_CHECKS)
+            failed_geo = validation.validate(hospital_geo,
+                                             validation.GEO_CHECKS)
+            rows_read = rows_read + len(hospital_weekly.index)
+            passed_weekly = passed_weekly + \
+                len(weekly_insert.index) - len(failed_weekly)
+            passed_geo = passed_geo + \
+                len(hospital_geo.index) - len(failed_geo)
+            errors_weekly.extend(failed_weekly)
+            errors_geo.extend(failed_geo)
+    return {
+        "files": len(file_names),
+        "rows_read": rows_read,
+        "passed_weekly": passed_weekly,
+        "passed_geo": passed_geo,
+        "failed_weekly": validation.count_errors(errors_weekly),
+        "failed_geo": validation.count_errors(errors_geo)
+    }
+
+
+def print_dry_run(counts):
     """
-        UPDATE Seymour_weekly_info
-        SET staffed_icu_adult_patients_confirmed_covid_7_day_avg = NULL
-        WHERE staffed_icu_adult_patients_confirmed_covid_7_day_avg < 0
+    Print the row counts of a dry run
+    :param counts: Dictionary of row counts returned by dry_run
     """
-)
-
-# Placeholders for number of rows added and skipped
-added_geo = 0
-skipped_geo = 0
-
-# Empty dataframe to store error rows (omissions)
-omitted_geo_df = pd.DataFrame(columns=sql_geo.columns)
-omitted_geo_df = omitted_geo_df.astype(str)
-
-# Map each variable into Seymour_geo and insert the values
-for i in range(len(hospital_geo)):
-    try:
-        cur.execute(
-            """
-                INSERT INTO Seymour_geo
-                (hospital_pk,
-                fips_code,
-                hosptial_geocode)
-                VALUES (%(hospital_pk)s,
-                %(fips_code)s,
-                %(hosptial_geocode)s);
-            """,
-            {
-                'hospital_pk': hospital_geo['hospital_pk'][i],
-                'fips_code': hospital_geo['fips_code'][i].item(),
-                'hosptial_geocode':
-                    hospital_geo['geocoded_hospital_address'][i]
-            })
-        # Add to count for successes
-        added_geo = added_geo + 1
-    except Exception:
-        # Append the new failed row to a dataframe of omissions
-        new_row = {'hospital_pk': str(hospital_geo['hospital_pk'][i]),
-                   'fips_code': str(hospital_geo['fips_code'][i]),
-                   'geocoded_hospital_address':
-                       str(hospital_geo['geocoded_hospital_address'][i])
-                   }
-        omitted_geo_df.loc[len(omitted_geo_df)] = new_row
-        # Export the omission dataframe to a csv
-        omitted_geo_df.to_csv('omitted/omitted_geo.csv', index=False)
-        # Add to count for failures
-        skipped_geo = skipped_geo + 1
-
-# Update 'NaN' string to be a NULL value
-cur.execute(
+    print(f"Read {counts['rows_read']} rows from {counts['files']} files.")
+    for table, name in [("Seymour_weekly_info", "weekly"),
+                        ("Seymour_geo", "geo")]:
+        failed = counts[f"failed_{name}"]
+        print(f"{counts[f'passed_{name}']} rows would be staged for {table}"
+              + f" and {sum(failed.values())} fail validation.")
+        for check, count in sorted(failed.items()):
+            print(f"  {check}: {count}")
+
+
+def print_summary(counts):
     """
-        UPDATE Seymour_geo
-        SET hosptial_geocode = NULL
-        WHERE hosptial_geocode = 'NaN'
+    Print the row counts of a load
+    :param counts: Dictionary of row counts returned by load_files
     """
-)
+    # Print duplicates dropped
+    print(f"Dropped {counts['duplicates_dropped_weekly']} duplicate rows" +
+          " of hospital_pk/date pairings before inserting into" +
+          " Seymour_weekly_info.")
+    print(f"Dropped {counts['duplicates_dropped_geo']} duplicate rows of" +
+          " hospital_pk before inserting into Seymour_weekly_geo.")
+    print("")
+    # Print number of rows successfully inserted
+    print(f"Successfully inserted {counts['added_weekly']}" +
+          " rows to Seymour_weekly_info.")
+    print(f"Successfully inserted {counts['added_geo']}" +
+          " rows to Seymour_geo.")
+    print("")
+    # Print number of rows that failed validation before reaching the
+    # database, then of rows the database rejected
+    print(f"{counts['invalid_weekly']} rows failed validation before" +
+          " loading into Seymour_weekly_info.")
+    print(f"{counts['invalid_geo']} rows failed validation before" +
+          " loading into Seymour_geo.")
+    print(f"{counts['skipped_weekly']} rows were not inserted" +
+          " into Seymour_weekly_info due to errors.")
+    print(f"{counts['skipped_geo']} rows were not inserted" +
+          " into Seymour_geo due to errors.")
+    print("")
+
 
-# Update 'NA' string to be a NULL value
-cur.execute(
+def main():
     """
-        UPDATE Seymour_geo
-        SET hosptial_geocode = NULL
-        WHERE hosptial_geocode = 'NA'
+    Load the files given on the commandline and print a summary
     """
-)
-
-# Close SQL
-conn.commit()
-conn.close()
-
-# Print duplicates dropped
-print(f"Dropped {duplicates_dropped_weekly} duplicate rows of" +
-      " hospital_pk/date pairings before inserting into Seymour_weekly_info.")
-print(f"Dropped {duplicates_dropped_geo} duplicate rows of" +
-      " hospital_pk before inserting into Seymour_weekly_geo.")
-print("")
-# Print number of rows successfully inserted
-print(f"Successfully inserted {added_weekly}" +
-      " rows to Seymour_weekly_info.")
-print(f"Successfully inserted {added_geo}" +
-      " rows to Seymour_geo.")
-print("")
-# Print number of rows that raised errors
-print(f"{skipped_weekly} rows were not inserted" +
-      " into Seymour_weekly_info due to errors.")
-print(f"{skipped_geo} rows were not inserted" +
-      " into Seymour_geo due to errors.")
-print("")
+    start = time.perf_counter()
+    args = parse_args()
+    if args.dry_run:
+        print_dry_run(dry_run(args))
+        return
+
+    # Connect to SQL
+    conn = db.connect()
+    counts = load_files(conn, args, start=start)
+    # Close SQL
+    conn.close()
+    if counts is not None:
+        print_summary(counts)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,244 +1,487 @@
-import sys
+import argparse
+import datetime
+import time
 import pandas as pd
-import credentials
-# install package psycopg2-binary
-import psycopg2
-import numpy as np
-
-# Take in file name and date in file name from command line
-date = sys.argv[1]
-file_name = sys.argv[2]
-
-
-# Read in given file from data file for Seymour_hospital table
-hospitals = pd.read_csv(file_name)
-# Create a new column called date
-hospitals["date"] = date
-# Replace all 'Not Available' strings to -1 so it can be converted
-# -1's will be converted to NULL later
-hospitals["Hospital overall rating"]\
-    = hospitals["Hospital overall rating"].replace("Not Available", "-1")
-# Convert ratings to Int64
-hospitals["Hospital overall rating"]\
-    = hospitals["Hospital overall rating"].astype('Int64')
-# Change Emergency Services to a Boolean (TRUE or FALSE)
-hospitals["Emergency Services"] =\
-    pd.Series(np.where(hospitals[
-                           "Emergency Services"
-                       ].values == 'Yes', "TRUE", "FALSE"), hospitals[
-        "Emergency Services"
-    ].index)
-
-# Create a separate data frame for Seymour_quality table
-ratings = hospitals[["Facility ID", "date", "Hospital overall rating"]]
-
-# Connect to SQL
-conn = psycopg2.connect(
-    host=credentials.get_hostname(), dbname=credentials.get_db(),
-    user=credentials.get_username(), password=credentials.get_password()
-)
-cur = conn.cursor()
-
-# Get the current Seymour_hospital table from the server and
-# save it as a data frame
-cur.execute("SELECT * FROM Seymour_hospital")
-sql_hospital = pd.DataFrame(cur.fetchall(), columns=[
-    "Facility ID",
-    "Facility Name",
-    "Address",
-    "City",
-    "State",
-    "ZIP Code",
-    "County Name",
-    "Hospital Type",
-    "Emergency Services"
-])
-
-hospital_gi = hospitals[[
-    "Facility ID",
-    "Facility Name",
-    "Address",
-    "City",
-    "State",
-    "ZIP Code",
-    "County Name",
-    "Hospital Type",
-    "Emergency Services"
-]]
-
-# Get length of rows to find duplicates
-gi_rows = len(hospital_gi.index)
-
-# Create a new data frame to be inserted containing only new ID numbers
-id_list = sql_hospital['Facility ID'].tolist()
-hospital_gi = hospital_gi[~hospital_gi["Facility ID"].isin(id_list)]
-# Remove lingering duplicates
-hospital_gi = hospital_gi.drop_duplicates(subset=['Facility ID'])
-# Fix indices for formatting
-hospital_gi.reset_index(drop=True, inplace=True)
-
-# Find the number of duplicates dropped
-duplicates_dropped_gi = gi_rows - len(hospital_gi.index)
-
-# Get the current Seymour_quality table from the server and save
-# it as a data frame
-cur.execute("SELECT * FROM Seymour_quality")
-sql_quality = pd.DataFrame(cur.fetchall(), columns=[
-    "Facility ID",
+import bulk_load
+import db
+import manifest
+import parse_cache
+import readers
+import rejects
+import rollups
+import validation
+
+# Columns of the Seymour_hospital table compared when upserting
+hospital_attributes = [
+    "hospital_name",
+    "address",
+    "city",
+    "state",
+    "zip_code",
+    "county",
+    "hospital_type",
+    "emergency_services"
+]
+
+# Columns of the CMS files staged, and the names they are staged under
+cms_columns = {
+    "Facility ID": "hospital_pk",
+    "Facility Name": "hospital_name",
+    "Address": "address",
+    "City": "city",
+    "State": "state",
+    "ZIP Code": "zip_code",
+    "County Name": "county",
+    "Hospital Type": "hospital_type",
+    "Emergency Services": "emergency_services",
+    "date": "date",
+    "Hospital overall rating": "rating"
+}
+
+# Columns of the frame staged for Seymour_hospital and Seymour_quality
+staged_columns = ["hospital_pk"] + hospital_attributes + [
     "date",
-    "Hospital overall rating"
-])
-
-# Get length of rows to find duplicates
-ratings_rows = len(ratings.index)
-
-# Create a new data frame to be inserted containing only new ID
-# numbers and date pairings
-exclusion_pairs = set(zip(sql_quality["Facility ID"].tolist(),
-                          sql_quality["date"].apply(
-                              lambda x: x.strftime('%Y-%m-%d')
-                          ).tolist()))
-ratings = ratings[~ratings[
-    ['Facility ID', 'date']
-].apply(tuple, axis=1).isin(exclusion_pairs)]
-# Remove lingering duplicates
-ratings = ratings.drop_duplicates(subset=['Facility ID', 'date'])
-# Fix indices for formatting
-ratings.reset_index(drop=True, inplace=True)
-
-# Find the number of duplicates dropped
-duplicates_dropped_ratings = ratings_rows - len(ratings.index)
-
-# Placeholders for number of rows added and skipped
-added_gi = 0
-skipped_gi = 0
-
-# Empty dataframe to store error rows (omissions)
-omitted_hospitals_df = pd.DataFrame(columns=sql_hospital.columns)
-omitted_hospitals_df = omitted_hospitals_df.astype(str)
-
-# Map each variable into Seymour_hospital and insert the values
-for i in range(len(hospital_gi)):
-    try:
-        cur.execute(
-            """
-                INSERT INTO Seymour_hospital
-                (hospital_pk,
-                hospital_name,
-                address,
-                city,
-                state,
-                zip_code,
-                county,
-                hospital_type,
-                emergency_services)
-                VALUES (%(hospital_pk)s,
-                %(hospital_name)s,
-                %(address)s,
-                %(city)s,
-                %(state)s,
-                %(zip_code)s,
-                %(county)s,
-                %(hospital_type)s,
-                %(emergency_services)s);
-            """,
-            {
-                'hospital_pk': hospital_gi['Facility ID'][i],
-                'hospital_name': hospital_gi['Facility Name'][i],
-                'address': hospital_gi['Address'][i],
-                'city': hospital_gi['City'][i],
-                'state': hospital_gi['State'][i],
-                'zip_code': hospital_gi['ZIP Code'][i].item(),
-                'county': hospital_gi['County Name'][i],
-                'hospital_type': hospital_gi['Hospital Type'][i],
-                'emergency_services': hospital_gi['Emergency Services'][i]
-            })
-        # Add to count for successes
-        added_gi = added_gi + 1
-    except Exception:
-        # Append the new failed row to a dataframe of omissions
-        new_row = {'Facility ID': str(hospital_gi['Facility ID'][i]),
-                   'Facility Name': str(hospital_gi['Facility Name'][i]),
-                   'Address': str(hospital_gi['Address'][i]),
-                   'City': str(hospital_gi['City'][i]),
-                   'State': str(hospital_gi['State'][i]),
-                   'ZIP Code': str(hospital_gi['ZIP Code'][i]),
-                   'County Name': str(hospital_gi['County Name'][i]),
-                   'Hospital Type': str(hospital_gi['Hospital Type'][i]),
-                   'Emergency Services':
-                       str(hospital_gi['Emergency Services'][i])
-                   }
-        omitted_hospitals_df.loc[len(omitted_hospitals_df)] = new_row
-        # Export the omission dataframe to a csv
-        omitted_hospitals_df.to_csv('omitted/omitted_hospitals.csv',
-                                    index=False)
-        # Add to count for failures
-        skipped_gi = skipped_gi + 1
-
-# Placeholders for number of rows added and skipped
-added_ratings = 0
-skipped_ratings = 0
-
-# Empty dataframe to store error rows (omissions)
-omitted_quality_df = pd.DataFrame(columns=sql_quality.columns)
-omitted_quality_df = omitted_quality_df.astype(str)
-
-# Map each variable into Seymour_quality and insert the values
-for i in range(len(ratings)):
-    try:
-        cur.execute(
-            """
-                INSERT INTO Seymour_quality (hospital_pk, date, rating)
-                VALUES (%(hospital_pk)s, %(date)s, %(rating)s);
-            """,
-            {
-                'hospital_pk': ratings['Facility ID'][i],
-                'date': str(ratings['date'][i]),
-                'rating': ratings['Hospital overall rating'][i].item()
-            })
-        # Add to count for successes
-        added_ratings = added_ratings + 1
-    except Exception:
-        # Append the new failed row to a dataframe of omissions
-        new_row = {'hospital_pk': str(ratings['Facility ID'][i]),
-                   'date': str(ratings['date'][i]),
-                   'Hospital overall rating':
-                       str(ratings['Hospital overall rating'][i])
-                   }
-        omitted_quality_df.loc[len(omitted_quality_df)] = new_row
-        # Export the omission dataframe to a csv
-        omitted_quality_df.to_csv('omitted/omitted_quality.csv', index=False)
-        # Add to count for failures
-        skipped_ratings = skipped_ratings + 1
-
-# Set all rating values in Seymour quality that are -1 equal to NULL
-cur.execute(
-    """
-        UPDATE Seymour_quality
-        SET rating = NULL
-        WHERE rating = -1
-    """
-)
-
-# Close SQL
-conn.commit()
-conn.close()
-
-# Print duplicates dropped
-print(f"Dropped {duplicates_dropped_gi} duplicate rows of" +
-      " hospital_pk before inserting into Seymour_hospital.")
-print(f"Dropped {duplicates_dropped_ratings} duplicate rows of" +
-      " hospital_pk/date pairings before inserting into Seymour_quality.")
-print("")
-# Print number of rows successfully inserted
-print(f"Successfully inserted {added_gi}" +
-      " rows to Seymour_hospital.")
-print(f"Successfully inserted {added_ratings}" +
-      " rows to Seymour_quality.")
-print("")
-# Print number of rows that raised errors
-print(f"{skipped_gi} rows were not inserted" +
-      " into Seymour_hospital due to errors.")
-print(f"{skipped_ratings} rows were not inserted" +
-      " into Seymour_quality due to errors.")
-print("")
+    "rating",
+    "attribute_hash"
+]
+
+
+def prepare_frame(hospitals, date):
+    """
+    Select and rename the columns of a CMS frame that are staged, reject
+    the rows that fail validation, and hash each hospital's information
+    :param hospitals: Data frame read from a CMS file
+    :param date: Date of the file as YYYY-MM-DD
+    :return: Tuple of the data frame with the staged columns of the rows
+    that passed, the data frame of the rows that failed, and the list of
+    (index label, ValidationError) pairs for them
+    """
+    # Create a new column called date
+    hospitals = hospitals.assign(date=date)
+
+    # Select the columns of Seymour_hospital and Seymour_quality, renamed
+    # to match the tables
+    hospital_quality = hospitals[list(cms_columns)].rename(
+        columns=cms_columns
+    )
+
+    # Check whole columns at once against the constraints of the tables,
+    # so rows that would fail never reach the database, then convert
+    # the columns read as text in the rows that passed
+    errors = validation.validate(hospital_quality,
+                                 validation.QUALITY_CHECKS)
+    failed = [label for label, _ in errors]
+    rejected = hospital_quality.loc[failed]
+    hospital_quality = validation.convert(
+        hospital_quality.drop(index=failed),
+        {cms_columns[column]: dtype for column, dtype
+         in readers.CMS_CHECKED_DTYPES.items()}
+    )
+
+    # Hash each hospital's information in one pass so only hospitals that
+    # changed are updated
+    hospital_quality["attribute_hash"] = bulk_load.row_hash(
+        hospital_quality, hospital_attributes
+    )
+    return hospital_quality, rejected, errors
+
+
+def rating_changes(current, ratings):
+    """
+    Compare the open rating intervals with the ratings of a file in one
+    vectorized pass
+    A missing rating is a rating of its own, so a hospital whose rating
+    becomes or stops being "Not Available" changes too.
+    :param current: Data frame of hospital_pk and rating of the open
+    intervals
+    :param ratings: Data frame of hospital_pk and rating from the file,
+    one row per hospital
+    :return: Tuple of the hospital_pk values whose open interval ends,
+    and the data frame of hospital_pk and rating of the intervals that
+    start
+    """
+    merged = current.astype({"rating": "Int64"}).merge(
+        ratings.astype({"rating": "Int64"}), on="hospital_pk", how="outer",
+        suffixes=("_current", ""), indicator=True
+    )
+    both = merged["_merge"] == "both"
+    same = merged["rating_current"].eq(merged["rating"]).fillna(False) \
+        | (merged["rating_current"].isna() & merged["rating"].isna())
+    changed = both & ~same
+    ended = merged.loc[(merged["_merge"] == "left_only") | changed,
+                       "hospital_pk"]
+    started = merged.loc[(merged["_merge"] == "right_only") | changed,
+                         ["hospital_pk", "rating"]]
+    return ended, started
+
+
+def compact_ratings(cur, ratings, date):
+    """
+    Record the ratings of a file in Seymour_rating_interval, only where
+    they changed
+    Files must be loaded in date order. Loading the latest date again
+    first undoes what its earlier load changed.
+    :param cur: Cursor of an open connection
+    :param ratings: Data frame of hospital_pk and rating from the file,
+    one row per hospital
+    :param date: Date of the file as YYYY-MM-DD
+    :return: Tuple of the number of intervals started and ended
+    """
+    cur.execute(
+        """
+            SELECT GREATEST(max(valid_from), max(valid_to))
+            FROM Seymour_rating_interval
+        """
+    )
+    latest = cur.fetchone()[0]
+    if latest is not None and latest > datetime.date.fromisoformat(date):
+        raise RuntimeError(f"Ratings up to {latest} are already compacted;"
+                           + " load quality files in date order with"
+                           + " --compact")
+    if latest is not None and latest == datetime.date.fromisoformat(date):
+        cur.execute("DELETE FROM Seymour_rating_interval"
+                    + " WHERE valid_from = %s", (date,))
+        cur.execute("UPDATE Seymour_rating_interval SET valid_to = NULL"
+                    + " WHERE valid_to = %s", (date,))
+
+    # Diff the file against the open intervals in pandas
+    cur.execute(
+        """
+            SELECT hospital_pk, rating FROM Seymour_rating_interval
+            WHERE valid_to IS NULL
+        """
+    )
+    current = pd.DataFrame(cur.fetchall(), columns=["hospital_pk", "rating"])
+    ended, started = rating_changes(current, ratings)
+
+    # End the intervals of hospitals that changed or left the file, then
+    # start the new ones
+    cur.execute(
+        """
+            CREATE TEMPORARY TABLE ended_ratings (hospital_pk VARCHAR)
+            ON COMMIT DROP
+        """
+    )
+    bulk_load.copy_frame(cur, ended.to_frame(), "ended_ratings")
+    cur.execute(
+        """
+            UPDATE Seymour_rating_interval SET valid_to = %s
+            FROM ended_ratings
+            WHERE Seymour_rating_interval.hospital_pk
+                = ended_ratings.hospital_pk
+            AND valid_to IS NULL
+        """,
+        (date,)
+    )
+    bulk_load.copy_frame(cur, started.assign(valid_from=date),
+                         "Seymour_rating_interval")
+    return len(started.index), len(ended.index)
+
+
+def parse_args(argv=None):
+    """
+    Get file name, date in file name and load options from commandline
+    :param argv: List of arguments, by default those of the commandline
+    :return: Parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        description="Load a CMS hospital quality file into the database"
+    )
+    parser.add_argument("date", help="Date of the file as YYYY-MM-DD")
+    parser.add_argument("file_name", help="CSV file of CMS hospital data")
+    parser.add_argument("--row-by-row", action="store_true",
+                        help="Insert one row at a time instead of using"
+                             " COPY")
+    parser.add_argument("--batch-size", type=int, default=10000,
+                        help="Number of rows sent per COPY")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Parse the file even if it was parsed before")
+    parser.add_argument("--force", action="store_true",
+                        help="Load the file even if the manifest shows it"
+                             " was already loaded for this date")
+    parser.add_argument("--upsert", action="store_true",
+                        help="Update hospitals whose information changed"
+                             " instead of only adding new hospitals")
+    parser.add_argument("--history", action="store_true",
+                        help="Also keep earlier hospital information in"
+                             " Seymour_hospital_history (implies --upsert)")
+    parser.add_argument("--compact", action="store_true",
+                        help="Record ratings in Seymour_rating_interval only"
+                             " when they change, instead of a row per"
+                             " hospital in Seymour_quality")
+    parser.add_argument("--overlap", action="store_true",
+                        help="Read the file in chunks, parsing the next"
+                             " chunks in the background while earlier ones"
+                             " are written")
+    parser.add_argument("--chunk-size", type=int, default=1000,
+                        help="Number of rows per chunk with --overlap")
+    parser.add_argument("--queue-size", type=int, default=2,
+                        help="Number of chunks parsed ahead of writing with"
+                             " --overlap")
+    parser.add_argument("--bulk-session", action="store_true",
+                        help="Tune the database session for bulk loading"
+                             " (asynchronous commit, more work memory)"
+                             " for the length of the load")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Only read and validate the file, printing how"
+                             " many rows would be staged, without"
+                             " connecting to the database")
+    return parser.parse_args(argv)
+
+
+def load_file(conn, args, start=None):
+    """
+    Load the file given in the arguments and commit it
+    :param conn: Open connection, with no transaction in progress
+    :param args: Parsed arguments
+    :param start: perf_counter value the load started at, for the
+    duration recorded in the manifest
+    :return: Dictionary of row counts, or None if the manifest shows the
+    file was already loaded
+    """
+    if start is None:
+        start = time.perf_counter()
+    date = args.date
+    file_name = args.file_name
+    upsert = args.upsert or args.history
+    cur = conn.cursor()
+
+    # Skip the file if the manifest shows its contents were already loaded
+    # for this date
+    content_hash = parse_cache.file_hash(file_name)
+    status = manifest.find_load(cur, "quality", content_hash, file_date=date)
+    if status is not None and not args.force:
+        print(f"Skipping {file_name}: its contents were already loaded for"
+              + f" {date} ({status}). Pass --force to load it again.")
+        conn.rollback()
+        return None
+
+    # Settings end with the load's transaction
+    if args.bulk_session:
+        db.apply_bulk_load_settings(cur)
+
+    # Rows that raise errors (omissions) are appended to a file for this
+    # run
+    run_id = rejects.new_run_id()
+    omitted_quality = rejects.RejectLog("quality", staged_columns, run_id)
+
+    # Read in given file from data file for Seymour_hospital table, either
+    # in chunks parsed in the background while earlier chunks are written,
+    # or whole, reusing the cleaned frame from an earlier run over the same
+    # file when there is one
+    if args.overlap:
+        frames = readers.prefetch(
+            (prepare_frame(chunk, date) for chunk
+             in readers.read_cms(file_name, chunk_size=args.chunk_size)),
+            queue_size=args.queue_size
+        )
+    else:
+        frames = [prepare_frame(
+            readers.read_clean_cms(file_name, use_cache=not args.no_cache),
+            date
+        )]
+
+    # Stream all rows once into a staging table shaped like
+    # Seymour_hospital that also holds the date and rating, with batched
+    # COPYs, isolating any rows the database rejects
+    bulk_load.create_staging_table(cur, "Seymour_hospital", extra_columns=[
+        "date DATE",
+        "rating INT CHECK (-1 <= rating and rating <= 5)"
+    ])
+    rows_read = 0
+    staged = 0
+    invalid = 0
+    ratings = []
+    for hospital_quality, rejected, errors in frames:
+        # Rows that failed validation go straight to the reject log
+        omitted_quality.add_frame(rejected, errors)
+        invalid = invalid + len(errors)
+        rows_read = rows_read + len(rejected.index)
+
+        failed = bulk_load.stage_frame(cur, hospital_quality,
+                                       "Seymour_hospital",
+                                       row_by_row=args.row_by_row,
+                                       batch_size=args.batch_size)
+        omitted_quality.add_frame(hospital_quality, failed)
+        if args.compact:
+            ratings.append(hospital_quality.drop(
+                index=[label for label, _ in failed]
+            )[["hospital_pk", "rating"]])
+        rows_read = rows_read + len(hospital_quality.index)
+        staged = staged + len(hospital_quality.index) - len(failed)
+
+    # Keep the history of hospital information before Seymour_hospital is
+    # updated
+    staging = bulk_load.staging_table("Seymour_hospital")
+    if args.history:
+        bulk_load.record_history(cur, "Seymour_hospital_history",
+                                 ["hospital_pk"],
+                                 ["hospital_pk"] + hospital_attributes,
+                                 "attribute_hash", date, staging)
+
+    # Add new hospital_pk values to Seymour_hospital; existing ones are
+    # left as they are, or with --upsert updated when their hash changed
+    rollups.remember_hospitals(cur, staging)
+    added_gi = bulk_load.insert_new_rows(
+        cur, "Seymour_hospital", ["hospital_pk"],
+        update_columns=hospital_attributes + ["attribute_hash"] if upsert
+        else None,
+        columns=["hospital_pk"] + hospital_attributes + ["attribute_hash"],
+        changed_column="attribute_hash"
+    )
+
+    # Recompute the report's rollups of the hospitals whose state or type
+    # changed, since their weekly rows now count towards other groups
+    rollups.refresh_hospitals(cur)
+
+    # Only add pairs of hospital_pk and date that do not exist yet to
+    # Seymour_quality, taken from the same staged rows, or with --compact
+    # only record the ratings that changed, keeping the first staged row
+    # of each hospital like the staging table does
+    ended_ratings = 0
+    if args.compact:
+        ratings = pd.concat(ratings) if ratings \
+            else pd.DataFrame(columns=["hospital_pk", "rating"])
+        added_ratings, ended_ratings = compact_ratings(
+            cur, ratings.drop_duplicates(subset=["hospital_pk"]), date
+        )
+    else:
+        added_ratings = bulk_load.insert_new_rows(
+            cur, "Seymour_quality", ["hospital_pk", "date"],
+            staging=staging,
+            columns=["hospital_pk", "date", "rating"]
+        )
+
+    # Record the file in the manifest
+    manifest.record_load(
+        cur, "quality", file_name, content_hash, rows_read,
+        added_gi + added_ratings, omitted_quality.count,
+        time.perf_counter() - start, file_date=date
+    )
+    conn.commit()
+
+    # Write out any omissions still buffered
+    omitted_quality.flush()
+
+    # Find the number of duplicates dropped; a rejected row is missing
+    # from both tables
+    return {
+        "added_gi": added_gi,
+        "added_ratings": added_ratings,
+        "duplicates_dropped_gi": staged - added_gi,
+        "duplicates_dropped_ratings": staged - added_ratings,
+        # The reject log holds the rows that failed validation as well as
+        # the rows the database rejected, which are missing from both
+        # tables
+        "invalid": invalid,
+        "skipped": omitted_quality.count - invalid,
+        "ended_ratings": ended_ratings
+    }
+
+
+def dry_run(args):
+    """
+    Read and validate the file given in the arguments without connecting
+    to the database
+    :param args: Parsed arguments
+    :return: Dictionary of row counts, with the failing rows counted by
+    column and check
+    """
+    if args.overlap:
+        chunks = readers.read_cms(args.file_name, chunk_size=args.chunk_size)
+    else:
+        chunks = [readers.read_clean_cms(args.file_name,
+                                         use_cache=not args.no_cache)]
+    rows_read = 0
+    passed = 0
+    errors = []
+    for chunk in chunks:
+        hospital_quality, _, failed = prepare_frame(chunk, args.date)
+        rows_read = rows_read + len(chunk.index)
+        passed = passed + len(hospital_quality.index)
+        errors.extend(failed)
+    return {
+        "rows_read": rows_read,
+        "passed": passed,
+        "failed": validation.count_errors(errors)
+    }
+
+
+def print_dry_run(counts):
+    """
+    Print the row counts of a dry run
+    :param counts: Dictionary of row counts returned by dry_run
+    """
+    print(f"Read {counts['rows_read']} rows; {counts['passed']} would be"
+          + " staged for Seymour_hospital and Seymour_quality and"
+          + f" {sum(counts['failed'].values())} fail validation.")
+    for check, count in sorted(counts["failed"].items()):
+        print(f"  {check}: {count}")
+
+
+def print_summary(counts, upsert=False, compact=False):
+    """
+    Print the row counts of a load
+    :param counts: Dictionary of row counts returned by load_file
+    :param upsert: Whether Seymour_hospital was upserted
+    :param compact: Whether ratings were recorded as intervals
+    """
+    # Print duplicates dropped
+    if upsert:
+        print(f"Left {counts['duplicates_dropped_gi']} unchanged rows of" +
+              " hospital_pk in Seymour_hospital.")
+    else:
+        print(f"Dropped {counts['duplicates_dropped_gi']} duplicate rows of" +
+              " hospital_pk before inserting into Seymour_hospital.")
+    if compact:
+        print(f"Left {counts['duplicates_dropped_ratings']} unchanged" +
+              " ratings in Seymour_rating_interval.")
+    else:
+        print(f"Dropped {counts['duplicates_dropped_ratings']} duplicate" +
+              " rows of hospital_pk/date pairings before inserting into" +
+              " Seymour_quality.")
+    print("")
+    # Print number of rows successfully inserted
+    print(f"Successfully {'upserted' if upsert else 'inserted'}" +
+          f" {counts['added_gi']} rows to Seymour_hospital.")
+    if compact:
+        print(f"Started {counts['added_ratings']} and ended" +
+              f" {counts['ended_ratings']} rating intervals in" +
+              " Seymour_rating_interval.")
+    else:
+        print(f"Successfully inserted {counts['added_ratings']}" +
+              " rows to Seymour_quality.")
+    print("")
+    # Print number of rows that failed validation before reaching the
+    # database, then of rows the database rejected, which are left out of
+    # both tables
+    print(f"{counts['invalid']} rows failed validation before loading.")
+    print(f"{counts['skipped']} rows were not inserted into" +
+          " Seymour_hospital or" +
+          (" Seymour_rating_interval" if compact else " Seymour_quality") +
+          " due to errors.")
+    print("")
+
+
+def main():
+    """
+    Load the file given on the commandline and print a summary
+    """
+    start = time.perf_counter()
+    args = parse_args()
+    if args.dry_run:
+        print_dry_run(dry_run(args))
+        return
+
+    # Connect to SQL
+    conn = db.connect()
+    counts = load_file(conn, args, start=start)
+    # Close SQL
+    conn.close()
+    if counts is not None:
+        print_summary(counts, upsert=args.upsert or args.history,
+                      compact=args.compact)
+
+
+if __name__ == "__main__":
+    main()
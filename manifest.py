@@ -0,0 +1,58 @@
+# Name of the table recording every file loaded into the database
+MANIFEST_TABLE = "Seymour_load_manifest"
+
+
+def find_load(cur, loader, content_hash, file_date=None):
+    """
+    Look up the most recent load of a file's contents by a loader
+    :param cur: Cursor of an open connection
+    :param loader: Name of the loader, e.g. hhs or quality
+    :param content_hash: Hash of the file contents
+    :param file_date: Date the file was loaded for, if the loader takes one
+    :return: Status of the most recent load, or None if never loaded
+    """
+    cur.execute(
+        f"""
+            SELECT status FROM {MANIFEST_TABLE}
+            WHERE loader = %s AND content_hash = %s
+            AND file_date IS NOT DISTINCT FROM %s
+            ORDER BY loaded_at DESC
+            LIMIT 1
+        """,
+        (loader, content_hash, file_date)
+    )
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def record_load(cur, loader, file_name, content_hash, rows_read, rows_added,
+                rows_rejected, duration, file_date=None):
+    """
+    Record a load of a file in the manifest
+    Run inside the same transaction as the load, so a file is only
+    recorded once its rows are committed. A load is complete when no rows
+    were rejected and partial otherwise.
+    :param cur: Cursor of an open connection
+    :param loader: Name of the loader, e.g. hhs or quality
+    :param file_name: Path of the file as given to the loader
+    :param content_hash: Hash of the file contents
+    :param rows_read: Number of rows read from the file
+    :param rows_added: Number of rows added to the tables, or None when
+    the file was loaded in a batch with other files
+    :param rows_rejected: Number of rows the database rejected
+    :param duration: Duration of the load in seconds
+    :param file_date: Date the file was loaded for, if the loader takes one
+    :return: Status recorded for the load
+    """
+    status = "complete" if rows_rejected == 0 else "partial"
+    cur.execute(
+        f"""
+            INSERT INTO {MANIFEST_TABLE}
+            (file_name, content_hash, loader, file_date, rows_read,
+            rows_added, rows_rejected, duration_seconds, status)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """,
+        (file_name, content_hash, loader, file_date, rows_read, rows_added,
+         rows_rejected, duration, status)
+    )
+    return status
@@ -0,0 +1,87 @@
+import hashlib
+import os
+# install package pyarrow to enable the cache
+try:
+    import pyarrow.feather as feather
+except ImportError:
+    feather = None
+
+# Directory the parsed frames are cached in
+CACHE_DIR = os.path.join(".cache", "parsed")
+
+# Total size the cache may grow to before the least recently used
+# frames are deleted
+MAX_CACHE_BYTES = 2 * 1024 ** 3
+
+
+def file_hash(file_name):
+    """
+    Hash the contents of a file
+    :param file_name: Path of the file
+    :return: Hex digest of the SHA-256 of the file
+    """
+    digest = hashlib.sha256()
+    with open(file_name, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cached_frame(file_name, parse, version, cache_dir=CACHE_DIR,
+                 max_bytes=MAX_CACHE_BYTES):
+    """
+    Get the parsed frame of a file from the cache, parsing it on a miss
+    Frames are stored uncompressed in the Arrow IPC (Feather) format,
+    keyed by the content hash of the file and a version that must change
+    whenever the parsing or cleaning changes, and are memory-mapped when
+    read back. Without pyarrow the file is always parsed.
+    :param file_name: Path of the file
+    :param parse: Function that parses the file into a data frame
+    :param version: Version of the parsing and cleaning rules
+    :param cache_dir: Directory of the cache
+    :param max_bytes: Size the cache is trimmed to after a write
+    :return: Parsed data frame
+    """
+    if feather is None:
+        return parse(file_name)
+    path = os.path.join(cache_dir, f"{file_hash(file_name)}-{version}.arrow")
+    if os.path.exists(path):
+        # Mark the entry as recently used
+        os.utime(path)
+        # Split blocks so numeric columns can stay backed by the map
+        return feather.read_table(path, memory_map=True)\
+            .to_pandas(split_blocks=True)
+    frame = parse(file_name)
+    os.makedirs(cache_dir, exist_ok=True)
+    # Write under a temporary name so readers never see a partial file
+    partial = f"{path}.{os.getpid()}.partial"
+    feather.write_feather(frame, partial, compression="uncompressed")
+    os.replace(partial, path)
+    evict(cache_dir, max_bytes)
+    return frame
+
+
+def evict(cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+    """
+    Delete the least recently used frames until the cache fits its size
+    :param cache_dir: Directory of the cache
+    :param max_bytes: Size the cache is trimmed to
+    """
+    entries = []
+    for name in os.listdir(cache_dir):
+        if not name.endswith(".arrow"):
+            continue
+        try:
+            stat = os.stat(os.path.join(cache_dir, name))
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, name))
+    total = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(os.path.join(cache_dir, name))
+        except FileNotFoundError:
+            pass
+        total = total - size
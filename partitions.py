@@ -0,0 +1,123 @@
+import datetime
+
+# Table that table_setup.py --partitioned splits into monthly ranges of
+# collection_week
+WEEKLY_TABLE = "Seymour_weekly_info"
+
+
+def is_partitioned(cur, table):
+    """
+    Check whether a table is a partitioned table
+    :param cur: Cursor of an open connection
+    :param table: Name of the table
+    :return: True if the table is partitioned
+    """
+    cur.execute(
+        """
+            SELECT 1 FROM pg_partitioned_table
+            WHERE partrelid = to_regclass(%s)
+        """,
+        (table,)
+    )
+    return cur.fetchone() is not None
+
+
+def partition_name(table, month):
+    """
+    Name of the partition holding one month of a table
+    :param table: Name of the partitioned table
+    :param month: Date of the first day of the month
+    :return: Name of the partition
+    """
+    return f"{table}_{month:%Y_%m}"
+
+
+def next_month(month):
+    """
+    First day of the month after a month
+    :param month: Date of the first day of a month
+    :return: Date of the first day of the next month
+    """
+    return (month + datetime.timedelta(days=32)).replace(day=1)
+
+
+def attached_partitions(cur, table):
+    """
+    List the partitions attached to a table
+    :param cur: Cursor of an open connection
+    :param table: Name of the partitioned table
+    :return: List of partition names in lowercase
+    """
+    cur.execute(
+        """
+            SELECT inhrelid::regclass::text FROM pg_inherits
+            WHERE inhparent = to_regclass(%s)
+        """,
+        (table,)
+    )
+    return [row[0] for row in cur.fetchall()]
+
+
+def ensure_partitions(cur, table, staging, column="collection_week"):
+    """
+    Create the monthly partitions that the rows of a staging table need
+    Does nothing when the table is not partitioned. A month whose
+    partition was detached is not created again, so its rows are not
+    split across two tables; the load then fails until the partition is
+    attached again or dropped.
+    :param cur: Cursor of an open connection
+    :param table: Name of the partitioned table
+    :param staging: Name of the staging table holding the rows
+    :param column: Date column the table is partitioned on
+    :return: List of names of the partitions created
+    """
+    if not is_partitioned(cur, table):
+        return []
+    cur.execute(
+        f"""
+            SELECT DISTINCT date_trunc('month', {column})::date
+            FROM {staging}
+            WHERE {column} IS NOT NULL
+        """
+    )
+    months = sorted(row[0] for row in cur.fetchall())
+    attached = attached_partitions(cur, table)
+    created = []
+    for month in months:
+        name = partition_name(table, month)
+        if name.lower() in attached:
+            continue
+        cur.execute("SELECT to_regclass(%s) IS NOT NULL", (name,))
+        if cur.fetchone()[0]:
+            raise RuntimeError(f"{name} was detached from {table}; attach"
+                               + " it again or drop it before loading"
+                               + f" {month:%Y-%m}")
+        cur.execute(
+            f"""
+                CREATE TABLE {name} PARTITION OF {table}
+                FOR VALUES FROM (%s) TO (%s)
+            """,
+            (month, next_month(month))
+        )
+        created.append(name)
+    return created
+
+
+def detach_partitions(cur, table, before):
+    """
+    Detach the monthly partitions holding only dates before a date
+    Detached partitions stay in the database as plain tables, so they
+    can be dumped and dropped, or attached again, without touching the
+    rows of the table
+    :param cur: Cursor of an open connection
+    :param table: Name of the partitioned table
+    :param before: Date the detached months end by
+    :return: List of names of the partitions detached
+    """
+    detached = []
+    for name in sorted(attached_partitions(cur, table)):
+        month = datetime.datetime.strptime(name[-7:], "%Y_%m").date()
+        if next_month(month) <= before:
+            cur.execute(f"ALTER TABLE {table} DETACH PARTITION {name}")
+            detached.append(name)
+    return detached
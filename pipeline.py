@@ -0,0 +1,337 @@
+import argparse
+import importlib
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import db
+import frames
+import generate_report
+import table_migrate
+import table_setup
+import table_teardown
+
+# The loaders' file names are not valid module names, so they are
+# imported by name
+load_hhs = importlib.import_module("load-hhs")
+load_quality = importlib.import_module("load-quality")
+
+
+def parse_args():
+    """
+    Get the config file and runner options from commandline
+    :return: Parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        description="Run table setup, loads and reports as one pipeline"
+    )
+    parser.add_argument("config", help="JSON file listing the files to load"
+                                       " and the reports to write")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Number of stages run at once (default: the"
+                             " config's workers, or 4)")
+    return parser.parse_args()
+
+
+def with_connection(function):
+    """
+    Run a function with a connection from the shared pool
+    :param function: Function taking an open connection
+    :return: What the function returns
+    """
+    with db.pooled_connection() as conn:
+        return function(conn)
+
+
+def tables_exist(cur):
+    """
+    Check whether table_setup.py has been run
+    :param cur: Cursor of an open connection
+    :return: True if the Seymour tables exist
+    """
+    cur.execute("SELECT to_regclass('Seymour_hospital') IS NOT NULL")
+    return cur.fetchone()[0]
+
+
+def reset_stage(context):
+    """
+    Drop the tables, if they exist
+    """
+    def reset(conn):
+        cur = conn.cursor()
+        if not tables_exist(cur):
+            return "no tables"
+        table_teardown.drop_tables(cur)
+        conn.commit()
+        return "dropped tables"
+    return with_connection(reset)
+
+
+def setup_stage(partitioned):
+    """
+    Make a stage that creates the tables, or migrates them if they
+    already exist
+    :param partitioned: Partition Seymour_weekly_info by month when the
+    tables are created
+    :return: Stage function
+    """
+    def setup(conn):
+        cur = conn.cursor()
+        if not tables_exist(cur):
+            table_setup.create_tables(cur, partitioned=partitioned)
+            conn.commit()
+            return "created tables"
+        problems = table_migrate.migrate(cur)
+        if problems:
+            raise RuntimeError("; ".join(problems))
+        conn.commit()
+        return "migrated tables"
+    return lambda context: with_connection(setup)
+
+
+def hhs_stage(argv):
+    """
+    Make a stage that loads HHS files
+    :param argv: List of arguments for load-hhs.py
+    :return: Stage function
+    """
+    args = load_hhs.parse_args(argv)
+
+    def stage(context):
+        counts = with_connection(
+            lambda conn: load_hhs.load_files(conn, args)
+        )
+        if counts is None:
+            return "already loaded"
+        return (f"{counts['added_weekly']} weekly rows added,"
+                + f" {counts['invalid_weekly'] + counts['invalid_geo']}"
+                + " invalid,"
+                + f" {counts['skipped_weekly'] + counts['skipped_geo']}"
+                + " rejected")
+    return stage
+
+
+def quality_stage(argv):
+    """
+    Make a stage that loads a quality file
+    :param argv: List of arguments for load-quality.py
+    :return: Stage function
+    """
+    args = load_quality.parse_args(argv)
+
+    def stage(context):
+        counts = with_connection(
+            lambda conn: load_quality.load_file(conn, args)
+        )
+        if counts is None:
+            return "already loaded"
+        return (f"{counts['added_ratings']} ratings added,"
+                + f" {counts['invalid']} invalid,"
+                + f" {counts['skipped']} rejected")
+    return stage
+
+
+def report_frames_stage(end_dates, shared_directories):
+    """
+    Make a stage that reads the frames of every report from the database
+    at once and shares them with the report stages through the context
+    It also writes the plotly.js shared by the "shared" reports, so the
+    report stages running at the same time find it already written.
+    :param end_dates: List of the last dates of the reports as YYYY-MM-DD
+    :param shared_directories: Directories of the reports written in
+    "shared" mode
+    :return: Stage function
+    """
+    def stage(context):
+        for directory in shared_directories:
+            generate_report.write_plotly_js(directory)
+
+        def read(conn):
+            batch = generate_report.batch_frames(conn.cursor(), end_dates)
+            # Every report's frames are taken here, since the report
+            # stages run in threads and the batch computes its frames on
+            # first use
+            shared = {end_date: generate_report.window_frames(batch,
+                                                              end_date)
+                      for end_date in end_dates}
+            conn.commit()
+            return shared
+        context["report frames"] = with_connection(read)
+        return f"{len(set(end_dates))} report dates"
+    return stage
+
+
+def report_stage(file_name, end_date, plotly_mode):
+    """
+    Make a stage that writes a report from the frames shared by the
+    report frames stage
+    :param file_name: Path of the HTML file
+    :param end_date: Last date of the report as YYYY-MM-DD
+    :param plotly_mode: How plotly.js is included, one of
+    generate_report.PLOTLY_MODES
+    :return: Stage function
+    """
+    def stage(context):
+        report = frames.FrameEngine(
+            generate_report.REPORT_FRAMES,
+            provided=context["report frames"][end_date], end_date=end_date
+        )
+        if not generate_report.write_report(report, file_name, plotly_mode):
+            return "no data associated with given week"
+        return file_name
+    return stage
+
+
+def build_stages(config):
+    """
+    Build the stages of a pipeline and the stages each one waits for
+    HHS and quality loads run at the same time once the tables are set
+    up; quality files are loaded one after another in date order, so
+    hospital history is kept in order. The reports' frames are read once
+    every load is done, then the reports are written at the same time.
+    :param config: Dictionary read from the config file
+    :return: Dictionary of stage name to (stage function, list of names
+    of the stages it waits for)
+    """
+    stages = {}
+    before_loads = []
+    if config.get("reset"):
+        stages["reset"] = (reset_stage, [])
+        before_loads = ["reset"]
+    if config.get("setup", True):
+        stages["setup"] = (setup_stage(config.get("partitioned", False)),
+                           before_loads)
+        before_loads = ["setup"]
+
+    loads = []
+    if config.get("hhs_files"):
+        stages["load hhs"] = (
+            hhs_stage(config.get("hhs_options", []) + config["hhs_files"]),
+            before_loads
+        )
+        loads.append("load hhs")
+    previous = before_loads
+    for entry in sorted(config.get("quality_files", []),
+                        key=lambda entry: entry["date"]):
+        name = f"load quality {entry['date']}"
+        stages[name] = (
+            quality_stage(config.get("quality_options", [])
+                          + [entry["date"], entry["file"]]),
+            previous
+        )
+        previous = [name]
+        loads.append(name)
+
+    # The reports' frames are read from the database once for all of
+    # them, and each report is written from its share
+    reports = config.get("reports", [])
+    if reports:
+        stages["read reports"] = (
+            report_frames_stage(
+                [entry["date"] for entry in reports],
+                sorted({os.path.dirname(os.path.join("reports", entry["file"]))
+                        for entry in reports
+                        if entry.get("plotly", "inline") == "shared"})
+            ),
+            loads or before_loads
+        )
+    for entry in reports:
+        file_name = os.path.join("reports", entry["file"])
+        stages[f"report {entry['file']}"] = (
+            report_stage(file_name, entry["date"],
+                         entry.get("plotly", "inline")),
+            ["read reports"]
+        )
+    return stages
+
+
+def run_stages(stages, context, workers):
+    """
+    Run stages in threads as soon as the stages they wait for are done
+    A stage that fails is printed and the stages waiting for it are
+    skipped; the others still run.
+    :param stages: Dictionary returned by build_stages
+    :param context: Dictionary shared by the stages
+    :param workers: Number of stages run at once
+    :return: Dictionary of stage name to (status, seconds, note), in the
+    order the stages finished
+    """
+    results = {}
+    pending = dict(stages)
+    running = {}
+
+    def timed(name, function):
+        start = time.perf_counter()
+        try:
+            note = function(context)
+        except Exception:
+            print(f"Stage {name} failed:")
+            traceback.print_exc()
+            return "failed", time.perf_counter() - start, ""
+        return "done", time.perf_counter() - start, note or ""
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while pending or running:
+            for name, (function, waits) in list(pending.items()):
+                statuses = [results.get(wait_for, ("",))[0]
+                            for wait_for in waits]
+                if any(status in ("failed", "skipped")
+                       for status in statuses):
+                    results[name] = ("skipped", 0.0, "")
+                    del pending[name]
+                elif all(status == "done" for status in statuses):
+                    running[executor.submit(timed, name, function)] = name
+                    del pending[name]
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                results[running.pop(future)] = future.result()
+    return results
+
+
+def print_timings(results, total):
+    """
+    Print how long each stage took
+    :param results: Dictionary returned by run_stages
+    :param total: Seconds the whole pipeline took
+    """
+    width = max([len(name) for name in results] + [5])
+    print("")
+    print(f"{'Stage':<{width}}  {'Status':<8}  {'Seconds':>8}")
+    for name, (status, seconds, note) in results.items():
+        print(f"{name:<{width}}  {status:<8}  {seconds:>8.2f}  {note}")
+    busy = sum(seconds for _, seconds, _ in results.values())
+    print(f"{'Total':<{width}}  {'':<8}  {total:>8.2f}"
+          + f"  ({busy:.2f} seconds of stages)")
+
+
+def main():
+    """
+    Run the pipeline described by the config file on the commandline
+    """
+    start = time.perf_counter()
+    args = parse_args()
+    with open(args.config) as f:
+        config = json.load(f)
+    workers = args.workers or config.get("workers", 4)
+    stages = build_stages(config)
+
+    # Stages borrow connections from one pool, with a connection for
+    # each stage running at once
+    db.get_pool(workers)
+    context = {}
+    try:
+        results = run_stages(stages, context, workers)
+    finally:
+        db.close_pool()
+
+    print_timings(results, time.perf_counter() - start)
+    if any(status != "done" for status, _, _ in results.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
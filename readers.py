@@ -0,0 +1,177 @@
+import queue
+import threading
+import pandas as pd
+import cleaning
+import parse_cache
+
+# Columns of the weekly HHS files used by the pipeline and the type each
+# is parsed as; every other column in the file is skipped while reading
+HHS_DTYPES = {
+    "hospital_pk": "category",
+    "collection_week": "category",
+    "state": "category",
+    "fips_code": "float64",
+    "geocoded_hospital_address": "object",
+    "all_adult_hospital_beds_7_day_avg": "float32",
+    "all_pediatric_inpatient_beds_7_day_avg": "float32",
+    "all_adult_hospital_inpatient_bed_occupied_7_day_coverage": "float32",
+    "all_pediatric_inpatient_bed_occupied_7_day_avg": "float32",
+    "total_icu_beds_7_day_avg": "float32",
+    "icu_beds_used_7_day_avg": "float32",
+    "inpatient_beds_used_covid_7_day_avg": "float32",
+    "staffed_icu_adult_patients_confirmed_covid_7_day_avg": "float32"
+}
+
+# Columns of the CMS Hospital_General_Information files used by the
+# pipeline and the type each is parsed as; every other column in the
+# file is skipped while reading
+# ZIP codes, ratings and Emergency Services are read as text, since one
+# malformed value would otherwise fail the whole file; load-quality.py
+# converts them to CMS_CHECKED_DTYPES once validation.py has rejected
+# the rows that would not convert
+CMS_DTYPES = {
+    "Facility ID": "object",
+    "Facility Name": "object",
+    "Address": "object",
+    "City": "object",
+    "State": "category",
+    "ZIP Code": "object",
+    "County Name": "category",
+    "Hospital Type": "category",
+    "Emergency Services": "category",
+    "Hospital overall rating": "category"
+}
+
+# Types the text columns of CMS_DTYPES are converted to
+CMS_CHECKED_DTYPES = {
+    "ZIP Code": "Int32",
+    "Emergency Services": "boolean",
+    "Hospital overall rating": "Int8"
+}
+
+# Strings the CMS files use for a missing value, by column
+CMS_NA_VALUES = {"Hospital overall rating": ["Not Available"]}
+
+
+def read_hhs(file_name, chunk_size=None):
+    """
+    Read the columns the pipeline uses from a weekly HHS file
+    :param file_name: Path of the CSV file
+    :param chunk_size: Number of rows per chunk, or None to read the
+    whole file at once
+    :return: Iterable of data frames, each holding one chunk of the file
+    """
+    reader = pd.read_csv(
+        file_name,
+        usecols=list(HHS_DTYPES),
+        dtype=HHS_DTYPES,
+        chunksize=chunk_size
+    )
+    if chunk_size is None:
+        return [reader]
+    return reader
+
+
+def read_clean_hhs(file_name, use_cache=True):
+    """
+    Read a whole weekly HHS file and apply the HHS cleaning rules
+    Kept at module level so it can be run in worker processes
+    :param file_name: Path of the CSV file
+    :param use_cache: Reuse the cleaned frame from an earlier run over
+    the same file contents when there is one
+    :return: Cleaned data frame
+    """
+    if use_cache:
+        return parse_cache.cached_frame(
+            file_name, lambda name: read_clean_hhs(name, use_cache=False),
+            f"hhs-{cleaning.RULES_VERSION}"
+        )
+    hospital_weekly = read_hhs(file_name)[0]
+    return cleaning.clean_frame(hospital_weekly, cleaning.HHS_RULES)
+
+
+def read_cms(file_name, chunk_size=None):
+    """
+    Read the columns the pipeline uses from a CMS
+    Hospital_General_Information file
+    Ratings that are "Not Available" are read as missing values
+    :param file_name: Path of the CSV file
+    :param chunk_size: Number of rows per chunk, or None to read the
+    whole file at once
+    :return: Iterable of data frames, each holding one chunk of the file
+    """
+    reader = pd.read_csv(
+        file_name,
+        usecols=list(CMS_DTYPES),
+        dtype=CMS_DTYPES,
+        na_values=CMS_NA_VALUES,
+        chunksize=chunk_size
+    )
+    if chunk_size is None:
+        return [reader]
+    return reader
+
+
+def read_clean_cms(file_name, use_cache=True):
+    """
+    Read a whole CMS Hospital_General_Information file
+    :param file_name: Path of the CSV file
+    :param use_cache: Reuse the parsed frame from an earlier run over
+    the same file contents when there is one
+    :return: Parsed data frame
+    """
+    if use_cache:
+        return parse_cache.cached_frame(
+            file_name, lambda name: read_clean_cms(name, use_cache=False),
+            f"cms-{cleaning.RULES_VERSION}"
+        )
+    return read_cms(file_name)[0]
+
+
+def prefetch(iterable, queue_size=2):
+    """
+    Iterate over an iterable that is run ahead in a background thread
+    Up to queue_size items are prepared while the caller works on the
+    current one, so parsing overlaps with writing to the database. The
+    bounded queue holds the reader back when writing is slower. An error
+    raised by the iterable is raised again by this generator.
+    :param iterable: Iterable of items to prepare, such as data frames
+    :param queue_size: Number of items prepared ahead of the caller
+    :return: Generator of the items in order
+    """
+    items = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        # Give up when the caller has stopped taking items
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+            put((done, None))
+        except Exception as error:
+            put((done, error))
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            item, error = items.get()
+            if error is not None:
+                raise error
+            if item is done:
+                return
+            yield item
+    finally:
+        stop.set()
+        producer.join()
@@ -0,0 +1,83 @@
+import csv
+import os
+from datetime import datetime
+import pandas as pd
+
+
+def new_run_id():
+    """
+    Create an id for a loader run, used to name its reject files
+    :return: Run id made of the start time and process id
+    """
+    return f"{datetime.now().strftime('%Y%m%dT%H%M%S')}-{os.getpid()}"
+
+
+class RejectLog:
+    """
+    Append-only log of rows that could not be loaded into a table
+    Rows are buffered in memory and appended to one CSV file per table
+    per run in batches, along with the class and message of the error
+    that rejected them. The file is only created once a row is logged.
+    """
+
+    def __init__(self, name, columns, run_id, directory="omitted",
+                 flush_every=1000):
+        """
+        :param name: Name of the rejected rows, e.g. weekly
+        :param columns: Column names of the rejected rows
+        :param run_id: Id of the current run
+        :param directory: Directory the reject file is written to
+        :param flush_every: Number of buffered rows that triggers a write
+        """
+        self.columns = list(columns)
+        self.path = os.path.join(directory, f"omitted_{name}_{run_id}.csv")
+        self.flush_every = flush_every
+        self.count = 0
+        self._buffer = []
+        self._header_written = False
+
+    def add(self, row, error):
+        """
+        Record a rejected row
+        :param row: Dictionary of column name to value
+        :param error: Exception raised for the row, or a message string
+        """
+        if isinstance(error, BaseException):
+            error_class = error.__class__.__name__
+            # psycopg2 errors carry the server message on several lines
+            error_message = " ".join(str(error).split())
+        else:
+            error_class = ""
+            error_message = str(error)
+        values = [row.get(column) for column in self.columns]
+        self._buffer.append(
+            ["" if pd.isna(value) else value for value in values]
+            + [error_class, error_message]
+        )
+        self.count = self.count + 1
+        if len(self._buffer) >= self.flush_every:
+            self.flush()
+
+    def add_frame(self, frame, errors):
+        """
+        Record rejected rows of a data frame
+        :param frame: Data frame holding the rejected rows
+        :param errors: List of (index label, error) pairs
+        """
+        for label, error in errors:
+            self.add(frame.loc[label].to_dict(), error)
+
+    def flush(self):
+        """
+        Append the buffered rows to the reject file
+        """
+        if not self._buffer:
+            return
+        with open(self.path, "a", newline="") as f:
+            writer = csv.writer(f)
+            if not self._header_written:
+                writer.writerow(self.columns + ["error_class",
+                                                "error_message"])
+                self._header_written = True
+            writer.writerows(self._buffer)
+        self._buffer = []
@@ -0,0 +1,324 @@
+# Rollups of Seymour_weekly_info by week, state and hospital type, read
+# by generate_report.py instead of the weekly rows when they are fresh
+# The loaders keep them up to date by recomputing only the groups a load
+# touched; table_rollup.py rebuilds them from scratch
+
+ROLLUP_TABLE = "Seymour_weekly_rollup"
+
+# One row holding when the rollups were last brought up to date; no row
+# means they were never built and are not kept up to date
+STATUS_TABLE = "Seymour_rollup_status"
+
+# Transaction-level advisory lock held by everything that changes the
+# rollups, so loads running at the same time bring them up to date one
+# after another, each seeing the rows the ones before it committed
+LOCK = f"SELECT pg_advisory_xact_lock(hashtext('{ROLLUP_TABLE}'))"
+
+# Bed columns of Seymour_weekly_info with a sum and a count of non-null
+# values in each rollup row
+BED_COLUMNS = [
+    "all_adult_hospital_beds_7_day_avg",
+    "all_pediatric_inpatient_beds_7_day_avg",
+    "all_adult_hospital_inpatient_bed_occupied_7_day_coverage",
+    "all_pediatric_inpatient_bed_occupied_7_day_avg",
+    "total_icu_beds_7_day_avg",
+    "icu_beds_used_7_day_avg",
+    "inpatient_beds_used_covid_7_day_avg",
+    "staffed_icu_adult_patients_confirmed_covid_7_day_avg"
+]
+
+# Utilization of a row's adult beds as a percentage, NULL without beds
+UTILIZATION = """(
+    weekly.all_adult_hospital_inpatient_bed_occupied_7_day_coverage
+    / NULLIF(weekly.all_adult_hospital_beds_7_day_avg, 0) * 100
+)"""
+
+# Condition on the rows that report adult beds
+WITH_BEDS = "weekly.all_adult_hospital_beds_7_day_avg <> 0"
+
+# Columns of a rollup row after its keys, with the expression computing
+# each from the weekly rows of its group
+AGGREGATES = [("row_count", "count(*)")] + [
+    aggregate for column in BED_COLUMNS for aggregate in [
+        (f"{column}_sum", f"sum(weekly.{column})"),
+        (f"{column}_count", f"count(weekly.{column})")
+    ]
+] + [
+    ("with_beds_count", f"count(*) FILTER (WHERE {WITH_BEDS})"),
+    ("covid_with_beds_sum",
+     "sum(weekly.inpatient_beds_used_covid_7_day_avg)"
+     f" FILTER (WHERE {WITH_BEDS})"),
+    ("covid_with_beds_count",
+     "count(weekly.inpatient_beds_used_covid_7_day_avg)"
+     f" FILTER (WHERE {WITH_BEDS})"),
+    ("utilization_sum", f"sum({UTILIZATION})"),
+    ("utilization_count", f"count({UTILIZATION})")
+]
+
+
+def _select_groups(condition):
+    """
+    Query computing the rollup rows of the weekly rows meeting a
+    condition
+    :param condition: SQL condition on the weekly and hospital aliases
+    :return: SELECT statement
+    """
+    aggregates = ",\n".join(f"{expression} AS {name}"
+                            for name, expression in AGGREGATES)
+    return f"""
+        SELECT weekly.collection_week, hospital.state, hospital.hospital_type,
+        {aggregates}
+        FROM Seymour_weekly_info weekly
+        LEFT JOIN Seymour_hospital hospital
+        ON hospital.hospital_pk = weekly.hospital_pk
+        WHERE {condition}
+        GROUP BY weekly.collection_week, hospital.state, hospital.hospital_type
+    """
+
+
+def create_tables(cur, built=True):
+    """
+    Create the rollup and status tables if they do not exist
+    :param cur: Cursor of an open connection
+    :param built: Mark the rollups as built, for empty weekly tables; an
+    existing status is kept
+    """
+    columns = ",\n".join(
+        f"{name} {'BIGINT' if name.endswith('_count') else 'FLOAT'}"
+        for name, _ in AGGREGATES
+    )
+    # state and hospital_type are NULL for hospitals missing from
+    # Seymour_hospital, so the keys are not a primary key
+    cur.execute(
+        f"""
+            CREATE TABLE IF NOT EXISTS {ROLLUP_TABLE}(
+                collection_week DATE,
+                state VARCHAR,
+                hospital_type VARCHAR,
+                {columns}
+            )
+        """
+    )
+    cur.execute(
+        f"""
+            CREATE INDEX IF NOT EXISTS {ROLLUP_TABLE}_week
+            ON {ROLLUP_TABLE} (collection_week)
+        """
+    )
+    cur.execute(
+        f"""
+            CREATE TABLE IF NOT EXISTS {STATUS_TABLE}(
+                refreshed_at TIMESTAMP
+            )
+        """
+    )
+    if built:
+        cur.execute(
+            f"""
+                INSERT INTO {STATUS_TABLE} (refreshed_at)
+                SELECT now() WHERE NOT EXISTS (SELECT 1 FROM {STATUS_TABLE})
+            """
+        )
+
+
+def drop_tables(cur):
+    """
+    Drop the rollup and status tables, if they exist
+    :param cur: Cursor of an open connection
+    """
+    cur.execute(f"DROP TABLE IF EXISTS {ROLLUP_TABLE}")
+    cur.execute(f"DROP TABLE IF EXISTS {STATUS_TABLE}")
+
+
+def is_built(cur):
+    """
+    Check whether the rollups were built and are kept up to date
+    :param cur: Cursor of an open connection
+    :return: True if the rollups were built
+    """
+    cur.execute(f"SELECT to_regclass('{STATUS_TABLE}') IS NOT NULL")
+    if not cur.fetchone()[0]:
+        return False
+    cur.execute(f"SELECT 1 FROM {STATUS_TABLE}")
+    return cur.fetchone() is not None
+
+
+def is_fresh(cur):
+    """
+    Check whether the rollups were brought up to date by every load
+    recorded in the manifest
+    :param cur: Cursor of an open connection
+    :return: True if the rollups can be read instead of the weekly rows
+    """
+    if not is_built(cur):
+        return False
+    cur.execute(
+        f"""
+            SELECT max(status.refreshed_at) >= COALESCE(
+                (SELECT max(loaded_at) FROM Seymour_load_manifest),
+                '-infinity'
+            )
+            FROM {STATUS_TABLE} status
+        """
+    )
+    return bool(cur.fetchone()[0])
+
+
+def lock(cur):
+    """
+    Wait until no other transaction is changing the rollups, and keep
+    them from changing until the current transaction ends
+    The loaders' transactions run at READ COMMITTED, so every statement
+    after the lock sees the rows of the loads that held it before.
+    :param cur: Cursor of an open connection
+    """
+    cur.execute(LOCK)
+
+
+def _mark_refreshed(cur):
+    """
+    Record that the rollups are up to date as of now
+    The time is taken when marking rather than when the transaction
+    started, so it is later than the loaded_at of every load committed
+    while the lock was waited for.
+    :param cur: Cursor of an open connection
+    """
+    cur.execute(f"UPDATE {STATUS_TABLE} SET refreshed_at = clock_timestamp()")
+
+
+def refresh_weeks(cur, staging):
+    """
+    Recompute the rollups of the weeks held by a staging table, after its
+    rows were moved into Seymour_weekly_info
+    Does nothing when the rollups were never built.
+    :param cur: Cursor of an open connection
+    :param staging: Name of the staging table of Seymour_weekly_info
+    """
+    lock(cur)
+    if not is_built(cur):
+        return
+    weeks = f"SELECT DISTINCT collection_week FROM {staging}"
+    cur.execute(f"DELETE FROM {ROLLUP_TABLE} WHERE collection_week IN"
+                + f" ({weeks})")
+    cur.execute(f"INSERT INTO {ROLLUP_TABLE} "
+                + _select_groups(f"weekly.collection_week IN ({weeks})"))
+    _mark_refreshed(cur)
+
+
+def remember_hospitals(cur, staging):
+    """
+    Keep the state and type of the hospitals in a staging table before
+    Seymour_hospital is changed, for refresh_hospitals
+    Does nothing when the rollups were never built.
+    :param cur: Cursor of an open connection
+    :param staging: Name of a staging table with a hospital_pk column
+    """
+    lock(cur)
+    if not is_built(cur):
+        return
+    cur.execute(
+        f"""
+            CREATE TEMPORARY TABLE rollup_hospitals ON COMMIT DROP AS
+            SELECT DISTINCT staged.hospital_pk, hospital.state,
+            hospital.hospital_type
+            FROM {staging} staged
+            LEFT JOIN Seymour_hospital hospital
+            ON hospital.hospital_pk = staged.hospital_pk
+        """
+    )
+
+
+def refresh_hospitals(cur):
+    """
+    Recompute the rollup groups of the hospitals remembered by
+    remember_hospitals whose state or type has changed since, both the
+    groups they left and the groups they joined, over every week they
+    have rows in
+    Does nothing when the rollups were never built.
+    :param cur: Cursor of an open connection
+    """
+    lock(cur)
+    if not is_built(cur):
+        return
+    cur.execute(
+        """
+            CREATE TEMPORARY TABLE rollup_groups ON COMMIT DROP AS
+            WITH moved AS (
+                SELECT earlier.hospital_pk, earlier.state AS old_state,
+                earlier.hospital_type AS old_type, later.state,
+                later.hospital_type
+                FROM rollup_hospitals earlier
+                JOIN Seymour_hospital later
+                ON later.hospital_pk = earlier.hospital_pk
+                WHERE (earlier.state, earlier.hospital_type)
+                    IS DISTINCT FROM (later.state, later.hospital_type)
+            ), affected AS (
+                SELECT hospital_pk, old_state AS state,
+                old_type AS hospital_type FROM moved
+                UNION
+                SELECT hospital_pk, state, hospital_type FROM moved
+            )
+            SELECT DISTINCT weekly.collection_week, affected.state,
+            affected.hospital_type
+            FROM affected
+            JOIN Seymour_weekly_info weekly
+            ON weekly.hospital_pk = affected.hospital_pk
+        """
+    )
+    cur.execute(
+        f"""
+            DELETE FROM {ROLLUP_TABLE} summary USING rollup_groups affected
+            WHERE summary.collection_week = affected.collection_week
+            AND summary.state IS NOT DISTINCT FROM affected.state
+            AND summary.hospital_type
+                IS NOT DISTINCT FROM affected.hospital_type
+        """
+    )
+    cur.execute(f"INSERT INTO {ROLLUP_TABLE} " + _select_groups(
+        """
+            EXISTS (
+                SELECT 1 FROM rollup_groups affected
+                WHERE affected.collection_week = weekly.collection_week
+                AND affected.state IS NOT DISTINCT FROM hospital.state
+                AND affected.hospital_type
+                    IS NOT DISTINCT FROM hospital.hospital_type
+            )
+        """
+    ))
+    _mark_refreshed(cur)
+
+
+def forget_missing_weeks(cur):
+    """
+    Delete the rollups of weeks no longer in Seymour_weekly_info, such as
+    the weeks of detached partitions
+    Does nothing when the rollups were never built.
+    :param cur: Cursor of an open connection
+    """
+    lock(cur)
+    if not is_built(cur):
+        return
+    cur.execute(
+        f"""
+            DELETE FROM {ROLLUP_TABLE} summary
+            WHERE NOT EXISTS (
+                SELECT 1 FROM Seymour_weekly_info weekly
+                WHERE weekly.collection_week = summary.collection_week
+            )
+        """
+    )
+
+
+def rebuild(cur):
+    """
+    Rebuild the rollups from every row of Seymour_weekly_info and mark
+    them as built
+    :param cur: Cursor of an open connection
+    """
+    lock(cur)
+    create_tables(cur, built=False)
+    cur.execute(f"TRUNCATE {ROLLUP_TABLE}")
+    cur.execute(f"INSERT INTO {ROLLUP_TABLE} " + _select_groups("TRUE"))
+    cur.execute(f"DELETE FROM {STATUS_TABLE}")
+    cur.execute(f"INSERT INTO {STATUS_TABLE} (refreshed_at)"
+                + " VALUES (clock_timestamp())")
@@ -0,0 +1,59 @@
+import argparse
+import datetime
+import sys
+import db
+import partitions
+import rollups
+
+# Detaches the months of a partitioned Seymour_weekly_info that end by a
+# date, so old weeks leave the table without a DELETE
+# Detached months stay as plain tables named Seymour_weekly_info_YYYY_MM
+# to be dumped and dropped, unless --drop is given
+
+
+def main():
+    """
+    Detach the months of Seymour_weekly_info before the date on the
+    commandline
+    """
+    parser = argparse.ArgumentParser(
+        description="Detach old months of a partitioned Seymour_weekly_info"
+    )
+    parser.add_argument("before", help="Detach months that end by this"
+                                       " date, as YYYY-MM-DD")
+    parser.add_argument("--drop", action="store_true",
+                        help="Drop the detached months instead of keeping"
+                             " them as tables")
+    args = parser.parse_args()
+    before = datetime.date.fromisoformat(args.before)
+
+    # Connect to SQL
+    conn = db.connect()
+    cur = conn.cursor()
+
+    if not partitions.is_partitioned(cur, partitions.WEEKLY_TABLE):
+        print(f"{partitions.WEEKLY_TABLE} is not partitioned; create it with"
+              + " python table_setup.py --partitioned.")
+        conn.close()
+        sys.exit(1)
+
+    detached = partitions.detach_partitions(cur, partitions.WEEKLY_TABLE,
+                                            before)
+    if args.drop:
+        for name in detached:
+            cur.execute(f"DROP TABLE {name}")
+
+    # The report's rollups no longer cover the detached weeks
+    rollups.forget_missing_weeks(cur)
+
+    # Close SQL
+    conn.commit()
+    conn.close()
+
+    for name in detached:
+        print(f"{'Dropped' if args.drop else 'Detached'} {name}.")
+    print(f"{len(detached)} months archived.")
+
+
+if __name__ == "__main__":
+    main()
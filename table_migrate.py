@@ -0,0 +1,256 @@
+import sys
+import db
+import rollups
+
+# Migrates tables created by an earlier table_setup.py to the current
+# schema: primary keys, indexes, the load manifest, hospital history,
+# rating intervals and weekly rollups
+# Safe to run more than once; nothing is changed unless every step works
+
+# Primary key columns of each table
+primary_keys = {
+    "Seymour_hospital": ["hospital_pk"],
+    "Seymour_weekly_info": ["hospital_pk", "collection_week"],
+    "Seymour_quality": ["hospital_pk", "date"],
+    "Seymour_geo": ["hospital_pk"]
+}
+
+
+def migrate(cur):
+    """
+    Bring the tables up to the current schema
+    Nothing is changed when a table holds rows that cannot take its
+    primary key; commit afterwards to keep the changes
+    :param cur: Cursor of an open connection
+    :return: List of problems that stopped the migration, empty if it
+    was done
+    """
+    # Check that the existing rows can take a primary key
+    problems = []
+    for table, keys in primary_keys.items():
+        key_list = ", ".join(keys)
+        cur.execute(
+            f"""
+                SELECT COUNT(*) FROM (
+                    SELECT {key_list} FROM {table}
+                    GROUP BY {key_list}
+                    HAVING COUNT(*) > 1
+                ) AS duplicates
+            """
+        )
+        duplicates = cur.fetchone()[0]
+        if duplicates > 0:
+            problems.append(f"{table} has {duplicates} duplicated values of"
+                            + f" ({key_list})")
+        nulls = " OR ".join(f"{key} IS NULL" for key in keys)
+        cur.execute(f"SELECT COUNT(*) FROM {table} WHERE {nulls}")
+        missing = cur.fetchone()[0]
+        if missing > 0:
+            problems.append(f"{table} has {missing} rows missing a value of"
+                            + f" ({key_list})")
+    if problems:
+        return problems
+
+    # Add the primary keys the tables do not have yet
+    for table, keys in primary_keys.items():
+        cur.execute(
+            """
+                SELECT 1 FROM pg_constraint
+                WHERE conrelid = %s::regclass AND contype = 'p'
+            """,
+            (table,)
+        )
+        if cur.fetchone() is None:
+            cur.execute(
+                f"ALTER TABLE {table} ADD PRIMARY KEY ({', '.join(keys)})"
+            )
+            print(f"Added primary key to {table}.")
+
+    # The primary key replaces the old UNIQUE constraint on hospital_pk
+    cur.execute(
+        """
+            ALTER TABLE Seymour_hospital
+            DROP CONSTRAINT IF EXISTS seymour_hospital_hospital_pk_key
+        """
+    )
+
+    # Indexes for the report's date windows and per-state summaries
+    cur.execute(
+        """
+            CREATE INDEX IF NOT EXISTS Seymour_weekly_info_week
+            ON Seymour_weekly_info (collection_week)
+        """
+    )
+    cur.execute(
+        """
+            CREATE INDEX IF NOT EXISTS Seymour_quality_date
+            ON Seymour_quality (date)
+        """
+    )
+    cur.execute(
+        """
+            CREATE INDEX IF NOT EXISTS Seymour_hospital_state
+            ON Seymour_hospital (state)
+        """
+    )
+
+    # Missing ratings used to be loaded as -1 and set to NULL afterwards;
+    # they are now NULL when loaded
+    cur.execute("UPDATE Seymour_quality SET rating = NULL WHERE rating = -1")
+
+    # Missing numbers used to be loaded as NaN; they are now NULL when
+    # loaded, and the report's SUM and AVG would count NaN, so set every
+    # FLOAT column of the tables to NULL where it holds NaN
+    cur.execute(
+        """
+            SELECT table_name, column_name FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name IN %s
+            AND data_type = 'double precision'
+            ORDER BY table_name, ordinal_position
+        """,
+        (tuple(table.lower() for table in primary_keys),)
+    )
+    nan_weekly = 0
+    for table, column in cur.fetchall():
+        cur.execute(
+            f"UPDATE {table} SET {column} = NULL WHERE {column} = 'NaN'"
+        )
+        if cur.rowcount > 0:
+            print(f"Set {cur.rowcount} NaN values of {table}.{column} to"
+                  + " NULL.")
+        if table == "seymour_weekly_info":
+            nan_weekly = nan_weekly + cur.rowcount
+
+    # Hash of each hospital's information, compared by upserting loads
+    cur.execute(
+        """
+            ALTER TABLE Seymour_hospital
+            ADD COLUMN IF NOT EXISTS attribute_hash BIGINT
+        """
+    )
+
+    # Position of each weekly row in its file, left NULL for rows loaded
+    # before it was kept
+    cur.execute(
+        """
+            ALTER TABLE Seymour_weekly_info
+            ADD COLUMN IF NOT EXISTS file_row INT
+        """
+    )
+
+    # History of hospital information kept by loads with --history
+    cur.execute(
+        """
+            CREATE TABLE IF NOT EXISTS Seymour_hospital_history(
+                hospital_pk VARCHAR,
+                hospital_name VARCHAR,
+                address VARCHAR,
+                city VARCHAR,
+                state VARCHAR,
+                zip_code INT,
+                county VARCHAR,
+                hospital_type VARCHAR,
+                emergency_services BOOL,
+                attribute_hash BIGINT,
+                valid_from DATE,
+                valid_to DATE,
+                PRIMARY KEY (hospital_pk, valid_from)
+            )
+        """
+    )
+
+    # Load manifest used by the loaders
+    cur.execute(
+        """
+            CREATE TABLE IF NOT EXISTS Seymour_load_manifest(
+                file_name VARCHAR,
+                content_hash VARCHAR,
+                loader VARCHAR,
+                file_date DATE,
+                rows_read INT,
+                rows_added INT,
+                rows_rejected INT,
+                duration_seconds FLOAT,
+                status VARCHAR CHECK (status IN ('complete', 'partial')),
+                loaded_at TIMESTAMP DEFAULT now()
+            )
+        """
+    )
+    cur.execute(
+        """
+            CREATE INDEX IF NOT EXISTS Seymour_load_manifest_hash
+            ON Seymour_load_manifest (loader, content_hash)
+        """
+    )
+
+    # Rating intervals kept by loads with --compact, and the view and
+    # function giving the ratings at a date
+    cur.execute(
+        """
+            CREATE TABLE IF NOT EXISTS Seymour_rating_interval(
+                hospital_pk VARCHAR,
+                rating INT CHECK (-1 <= rating and rating <= 5),
+                valid_from DATE,
+                valid_to DATE,
+                PRIMARY KEY (hospital_pk, valid_from)
+            )
+        """
+    )
+    cur.execute(
+        """
+            CREATE OR REPLACE VIEW Seymour_rating_snapshot AS
+            SELECT held.hospital_pk, loaded.date, held.rating
+            FROM (
+                SELECT DISTINCT file_date AS date FROM Seymour_load_manifest
+                WHERE loader = 'quality'
+            ) loaded
+            JOIN Seymour_rating_interval held
+            ON held.valid_from <= loaded.date
+            AND (held.valid_to IS NULL OR loaded.date < held.valid_to)
+        """
+    )
+    cur.execute(
+        """
+            CREATE OR REPLACE FUNCTION Seymour_rating_at(at DATE)
+            RETURNS TABLE (hospital_pk VARCHAR, rating INT) AS $$
+                SELECT hospital_pk, rating FROM Seymour_rating_interval
+                WHERE valid_from <= at AND (valid_to IS NULL OR at < valid_to)
+            $$ LANGUAGE SQL STABLE
+        """
+    )
+
+    # Rollups of Seymour_weekly_info, left unbuilt until table_rollup.py
+    # builds them from the rows already loaded
+    rollups.create_tables(cur, built=False)
+    # Rollups built over NaN values hold NaN sums, so build them again
+    if nan_weekly > 0 and rollups.is_built(cur):
+        rollups.rebuild(cur)
+        print("Rebuilt the rollups of Seymour_weekly_info.")
+    return []
+
+
+def main():
+    """
+    Migrate the tables in the database from credentials.py
+    """
+    # Connect to SQL
+    conn = db.connect()
+    cur = conn.cursor()
+
+    problems = migrate(cur)
+    if problems:
+        for problem in problems:
+            print(problem)
+        print("Remove these rows and run the migration again.")
+        conn.close()
+        sys.exit(1)
+
+    # Close SQL
+    conn.commit()
+    conn.close()
+
+    print("Migration complete.")
+
+
+if __name__ == "__main__":
+    main()
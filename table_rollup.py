@@ -0,0 +1,34 @@
+import time
+import db
+import rollups
+
+# Rebuilds the rollups of Seymour_weekly_info read by generate_report.py
+# from every row loaded so far
+# Run it once after table_migrate.py, or whenever the rollups are stale
+# because the tables were changed other than by the loaders
+
+
+def main():
+    """
+    Rebuild the rollups in the database from credentials.py
+    """
+    start = time.perf_counter()
+
+    # Connect to SQL
+    conn = db.connect()
+    cur = conn.cursor()
+
+    rollups.rebuild(cur)
+    cur.execute(f"SELECT count(*) FROM {rollups.ROLLUP_TABLE}")
+    groups = cur.fetchone()[0]
+
+    # Close SQL
+    conn.commit()
+    conn.close()
+
+    print(f"Rebuilt {groups} rollup rows in"
+          + f" {time.perf_counter() - start:.2f} seconds.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,75 +1,229 @@
-import credentials
-# install package psycopg2-binary
-import psycopg2
-
-# Connect to SQL
-conn = psycopg2.connect(
-    host=credentials.get_hostname(), dbname=credentials.get_db(),
-    user=credentials.get_username(), password=credentials.get_password()
-)
-cur = conn.cursor()
-
-# Each row represents a single hospital and all associated information
-cur.execute(
+import argparse
+import db
+import rollups
+
+
+def create_tables(cur, partitioned=False):
     """
-        CREATE TABLE Seymour_hospital (
-            hospital_pk VARCHAR UNIQUE,
-            hospital_name VARCHAR,
-            address VARCHAR,
-            city VARCHAR,
-            state VARCHAR,
-            zip_code INT,
-            county VARCHAR,
-            hospital_type VARCHAR,
-            emergency_services BOOL
-        )
+    Create the tables and indexes used by the pipeline
+    :param cur: Cursor of an open connection
+    :param partitioned: Partition Seymour_weekly_info into monthly ranges
+    of collection_week, created by load-hhs.py as weeks are loaded
     """
-    )
+    # Each row represents a single hospital and all associated information
+    cur.execute(
+        """
+            CREATE TABLE Seymour_hospital (
+                hospital_pk VARCHAR PRIMARY KEY,
+                hospital_name VARCHAR,
+                address VARCHAR,
+                city VARCHAR,
+                state VARCHAR,
+                zip_code INT,
+                county VARCHAR,
+                hospital_type VARCHAR,
+                emergency_services BOOL,
+                -- hash of the columns above except hospital_pk, so loads can
+                -- tell which hospitals changed
+                attribute_hash BIGINT
+            )
+        """
+        )
 
-# Each row represents data for a given hospital during a given week
-cur.execute(
-    """
-        CREATE TABLE Seymour_weekly_info (
-            -- refers to the unique IDs in the Seymour_hospital table
-            hospital_pk VARCHAR,
-            collection_week DATE,
-            all_adult_hospital_beds_7_day_avg FLOAT,
-            all_pediatric_inpatient_beds_7_day_avg FLOAT,
-            all_adult_hospital_inpatient_bed_occupied_7_day_coverage FLOAT,
-            all_pediatric_inpatient_bed_occupied_7_day_avg FLOAT,
-            total_icu_beds_7_day_avg FLOAT,
-            icu_beds_used_7_day_avg FLOAT,
-            inpatient_beds_used_covid_7_day_avg FLOAT,
-            staffed_icu_adult_patients_confirmed_covid_7_day_avg FLOAT
+    # Each row represents a hospital's information over the dates it was
+    # valid, kept when quality files are loaded with --history
+    cur.execute(
+        """
+            CREATE TABLE Seymour_hospital_history(
+                -- refers to the unique IDs in the Seymour_hospital table
+                hospital_pk VARCHAR,
+                hospital_name VARCHAR,
+                address VARCHAR,
+                city VARCHAR,
+                state VARCHAR,
+                zip_code INT,
+                county VARCHAR,
+                hospital_type VARCHAR,
+                emergency_services BOOL,
+                attribute_hash BIGINT,
+                valid_from DATE,
+                -- NULL while the row is the current one
+                valid_to DATE,
+                PRIMARY KEY (hospital_pk, valid_from)
+            )
+        """
         )
-    """
-    )
 
-# Each row represents the quality of a given hospital for at a given time
-cur.execute(
-    """
-        CREATE TABLE Seymour_quality(
-            -- refers to the unique IDs in the Seymour_hospital table
-            hospital_pk VARCHAR,
-            date DATE,
-            rating INT CHECK (-1 <= rating and rating <= 5)
+    # Each row represents data for a given hospital during a given week
+    partitioning = "PARTITION BY RANGE (collection_week)" if partitioned \
+        else ""
+    cur.execute(
+        f"""
+            CREATE TABLE Seymour_weekly_info (
+                -- refers to the unique IDs in the Seymour_hospital table
+                hospital_pk VARCHAR,
+                collection_week DATE,
+                all_adult_hospital_beds_7_day_avg FLOAT,
+                all_pediatric_inpatient_beds_7_day_avg FLOAT,
+                all_adult_hospital_inpatient_bed_occupied_7_day_coverage FLOAT,
+                all_pediatric_inpatient_bed_occupied_7_day_avg FLOAT,
+                total_icu_beds_7_day_avg FLOAT,
+                icu_beds_used_7_day_avg FLOAT,
+                inpatient_beds_used_covid_7_day_avg FLOAT,
+                staffed_icu_adult_patients_confirmed_covid_7_day_avg FLOAT,
+                -- position of the row in the file it was loaded from, so
+                -- the rows of a week can be read in the order of the file
+                file_row INT,
+                PRIMARY KEY (hospital_pk, collection_week)
+            ) {partitioning}
+        """
         )
-    """
-    )
 
-# Each row represents a hospital's fips_code and geocode
-# This table exist because of the nature of the data
-cur.execute(
-    """
-        CREATE TABLE Seymour_geo(
-            -- refers to the unique IDs in the Seymour_hospital table
-            hospital_pk VARCHAR,
-            fips_code FLOAT,
-            hosptial_geocode VARCHAR
+    # Each row represents the quality of a given hospital for at a given time
+    cur.execute(
+        """
+            CREATE TABLE Seymour_quality(
+                -- refers to the unique IDs in the Seymour_hospital table
+                hospital_pk VARCHAR,
+                date DATE,
+                rating INT CHECK (-1 <= rating and rating <= 5),
+                PRIMARY KEY (hospital_pk, date)
+            )
+        """
+        )
+
+    # Each row represents a hospital's fips_code and geocode
+    # This table exist because of the nature of the data
+    cur.execute(
+        """
+            CREATE TABLE Seymour_geo(
+                -- refers to the unique IDs in the Seymour_hospital table
+                hospital_pk VARCHAR PRIMARY KEY,
+                fips_code FLOAT,
+                hosptial_geocode VARCHAR
+            )
+        """
+        )
+
+    # Each row represents a hospital's rating over the dates it held,
+    # kept instead of Seymour_quality rows when quality files are loaded
+    # with --compact
+    cur.execute(
+        """
+            CREATE TABLE Seymour_rating_interval(
+                -- refers to the unique IDs in the Seymour_hospital table
+                hospital_pk VARCHAR,
+                rating INT CHECK (-1 <= rating and rating <= 5),
+                valid_from DATE,
+                -- NULL while the rating is the current one
+                valid_to DATE,
+                PRIMARY KEY (hospital_pk, valid_from)
+            )
+        """
+        )
+
+    # Indexes for the report's date windows and per-state summaries
+    # (joins on hospital_pk use the primary keys)
+    cur.execute(
+        """
+            CREATE INDEX Seymour_weekly_info_week
+            ON Seymour_weekly_info (collection_week)
+        """
         )
+    cur.execute(
+        """
+            CREATE INDEX Seymour_quality_date
+            ON Seymour_quality (date)
+        """
+        )
+    cur.execute(
+        """
+            CREATE INDEX Seymour_hospital_state
+            ON Seymour_hospital (state)
+        """
+        )
+
+    # Each row represents one load of a file into the tables above
+    # Lets the loaders skip files whose contents were already loaded
+    cur.execute(
+        """
+            CREATE TABLE Seymour_load_manifest(
+                file_name VARCHAR,
+                content_hash VARCHAR,
+                -- hhs or quality
+                loader VARCHAR,
+                -- date given to load-quality.py, NULL for load-hhs.py
+                file_date DATE,
+                rows_read INT,
+                rows_added INT,
+                rows_rejected INT,
+                duration_seconds FLOAT,
+                status VARCHAR CHECK (status IN ('complete', 'partial')),
+                loaded_at TIMESTAMP DEFAULT now()
+            )
+        """
+        )
+    cur.execute(
+        """
+            CREATE INDEX Seymour_load_manifest_hash
+            ON Seymour_load_manifest (loader, content_hash)
+        """
+        )
+
+    # Ratings of Seymour_rating_interval at each date a quality file was
+    # loaded, in the same shape as Seymour_quality
+    cur.execute(
+        """
+            CREATE VIEW Seymour_rating_snapshot AS
+            SELECT held.hospital_pk, loaded.date, held.rating
+            FROM (
+                SELECT DISTINCT file_date AS date FROM Seymour_load_manifest
+                WHERE loader = 'quality'
+            ) loaded
+            JOIN Seymour_rating_interval held
+            ON held.valid_from <= loaded.date
+            AND (held.valid_to IS NULL OR loaded.date < held.valid_to)
+        """
+        )
+
+    # Ratings of Seymour_rating_interval at any date
+    cur.execute(
+        """
+            CREATE FUNCTION Seymour_rating_at(at DATE)
+            RETURNS TABLE (hospital_pk VARCHAR, rating INT) AS $$
+                SELECT hospital_pk, rating FROM Seymour_rating_interval
+                WHERE valid_from <= at AND (valid_to IS NULL OR at < valid_to)
+            $$ LANGUAGE SQL STABLE
+        """
+        )
+
+    # Rollups of Seymour_weekly_info for the report, kept up to date by
+    # the loaders from the start
+    rollups.create_tables(cur)
+
+
+def main():
+    """
+    Create the tables in the database from credentials.py
     """
+    parser = argparse.ArgumentParser(
+        description="Create the tables in the database"
     )
+    parser.add_argument("--partitioned", action="store_true",
+                        help="Partition Seymour_weekly_info by month of"
+                             " collection_week")
+    args = parser.parse_args()
+
+    # Connect to SQL
+    conn = db.connect()
+    cur = conn.cursor()
+
+    create_tables(cur, partitioned=args.partitioned)
+
+    # Close SQL
+    conn.commit()
+    conn.close()
+
 
-# Close SQL
-conn.commit()
-conn.close()
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,50 @@
-import credentials
-# install package psycopg2-binary
-import psycopg2
+import db
+import rollups
 
-# Connect to SQL
-conn = psycopg2.connect(
-    host=credentials.get_hostname(), dbname=credentials.get_db(),
-    user=credentials.get_username(), password=credentials.get_password()
-)
 
-cur = conn.cursor()
+def drop_tables(cur):
+    """
+    Drop the tables created by table_setup.py
+    :param cur: Cursor of an open connection
+    """
+    cur.execute("DROP TABLE Seymour_hospital")
 
-cur.execute("DROP TABLE Seymour_hospital")
+    cur.execute("DROP TABLE Seymour_weekly_info")
 
-cur.execute("DROP TABLE Seymour_weekly_info")
+    cur.execute("DROP TABLE Seymour_quality")
 
-cur.execute("DROP TABLE Seymour_quality")
+    cur.execute("DROP TABLE Seymour_geo")
 
-cur.execute("DROP TABLE Seymour_geo")
+    # Older deployments may not have the manifest, history or rating
+    # intervals yet; the view reads the manifest, so it goes first
+    cur.execute("DROP VIEW IF EXISTS Seymour_rating_snapshot")
 
-# Close SQL
-conn.commit()
-conn.close()
+    cur.execute("DROP FUNCTION IF EXISTS Seymour_rating_at(DATE)")
+
+    cur.execute("DROP TABLE IF EXISTS Seymour_rating_interval")
+
+    cur.execute("DROP TABLE IF EXISTS Seymour_load_manifest")
+
+    rollups.drop_tables(cur)
+
+    cur.execute("DROP TABLE IF EXISTS Seymour_hospital_history")
+
+
+def main():
+    """
+    Drop the tables in the database from credentials.py
+    """
+    # Connect to SQL
+    conn = db.connect()
+
+    cur = conn.cursor()
+
+    drop_tables(cur)
+
+    # Close SQL
+    conn.commit()
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
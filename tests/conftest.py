@@ -0,0 +1,65 @@
+import os
+import sys
+import uuid
+import pytest
+
+# The modules are at the top of the repository rather than in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__
+))))
+
+
+@pytest.fixture
+def connect():
+    """
+    Function opening connections to a schema of the test's own, holding
+    the tables of table_setup.py and dropped when the test ends
+    The test is skipped when psycopg2, credentials.py or the database is
+    missing.
+    :return: Function taking no arguments and returning an open
+    connection whose search_path is the test's schema
+    """
+    psycopg2 = pytest.importorskip("psycopg2")
+    try:
+        import db
+    except ImportError as error:
+        pytest.skip(f"no credentials.py: {error}")
+    import table_setup
+
+    schema = f"test_{uuid.uuid4().hex[:12]}"
+    connections = []
+
+    def open_connection():
+        try:
+            conn = db.connect()
+        except psycopg2.OperationalError as error:
+            pytest.skip(f"no database: {error}")
+        # Set outside of a transaction, so a rollback keeps it
+        conn.autocommit = True
+        conn.cursor().execute(f"SET search_path TO {schema}")
+        conn.autocommit = False
+        connections.append(conn)
+        return conn
+
+    conn = open_connection()
+    cur = conn.cursor()
+    cur.execute(f"CREATE SCHEMA {schema}")
+    table_setup.create_tables(cur)
+    conn.commit()
+    yield open_connection
+
+    for open_conn in connections:
+        open_conn.rollback()
+    cur.execute(f"DROP SCHEMA {schema} CASCADE")
+    conn.commit()
+    for open_conn in connections:
+        open_conn.close()
+
+
+@pytest.fixture
+def cur(connect):
+    """
+    Cursor of a connection to the test's schema
+    :return: Cursor, whose changes are dropped with the schema
+    """
+    return connect().cursor()
@@ -0,0 +1,59 @@
+import pandas as pd
+import pytest
+
+# bulk_load connects through db, which needs credentials.py
+bulk_load = pytest.importorskip("bulk_load")
+
+
+def quality_rows(ratings):
+    """
+    Rows for Seymour_quality, one hospital per rating
+    :param ratings: List of ratings
+    :return: Data frame indexed from 100, so labels differ from positions
+    """
+    return pd.DataFrame({
+        "hospital_pk": [f"h{number}" for number in range(len(ratings))],
+        "date": "2022-10-01",
+        "rating": ratings
+    }, index=range(100, 100 + len(ratings)))
+
+
+def stored(cur):
+    """
+    Hospitals written to Seymour_quality
+    :param cur: Cursor of an open connection
+    :return: Sorted list of hospital_pk values
+    """
+    cur.execute("SELECT hospital_pk FROM Seymour_quality ORDER BY hospital_pk")
+    return [row[0] for row in cur.fetchall()]
+
+
+def test_copy_or_bisect_isolates_bad_row(cur):
+    # A rating of 9 breaks the CHECK on Seymour_quality
+    frame = quality_rows([1, 2, 3, 4, 5, 9, 1, 2, 3, 4, 5])
+    failed = []
+    bulk_load._copy_or_bisect(cur, frame, "Seymour_quality", failed)
+
+    assert [label for label, _ in failed] == [105]
+    assert "check" in str(failed[0][1]).lower()
+    assert stored(cur) == sorted(frame["hospital_pk"].drop(index=105))
+
+
+def test_copy_or_bisect_isolates_every_bad_row(cur):
+    frame = quality_rows([9, 1, 2, 9, 9, 3, 4, 5, 9])
+    failed = []
+    bulk_load._copy_or_bisect(cur, frame, "Seymour_quality", failed)
+
+    assert [label for label, _ in failed] == [100, 103, 104, 108]
+    assert stored(cur) == sorted(
+        frame["hospital_pk"].drop(index=[100, 103, 104, 108])
+    )
+
+
+def test_write_batches_keeps_batches_around_bad_row(cur):
+    frame = quality_rows([1, 2, 3, 4, 9, 5, 1])
+    failed = bulk_load.write_batches(cur, frame, "Seymour_quality",
+                                     batch_size=3)
+
+    assert [label for label, _ in failed] == [104]
+    assert len(stored(cur)) == 6
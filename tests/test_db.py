@@ -0,0 +1,48 @@
+import pytest
+
+# db needs credentials.py
+db = pytest.importorskip("db")
+
+
+def prepared(cur):
+    """
+    Names of the statements prepared on the session
+    :param cur: Cursor of an open connection
+    :return: List of names
+    """
+    cur.execute("SELECT name FROM pg_prepared_statements")
+    return [row[0] for row in cur.fetchall()]
+
+
+def test_prepared_statement_deallocated_after_block(cur):
+    with db.prepared_statement(cur, "test_select", "SELECT $1::int + 1") \
+            as execute:
+        cur.execute(f"{execute} (%s)", (41,))
+        assert cur.fetchone()[0] == 42
+        assert prepared(cur) == ["test_select"]
+    assert prepared(cur) == []
+
+
+def test_prepared_statement_deallocated_after_error(cur):
+    with pytest.raises(RuntimeError):
+        with db.prepared_statement(cur, "test_select", "SELECT $1::int"):
+            raise RuntimeError("failed inside the block")
+    assert prepared(cur) == []
+
+
+def test_prepared_statement_after_aborted_transaction(cur):
+    psycopg2 = pytest.importorskip("psycopg2")
+    with pytest.raises(psycopg2.Error):
+        with db.prepared_statement(cur, "test_select", "SELECT $1::int") \
+                as execute:
+            cur.execute(f"{execute} (%s)", ("not a number",))
+    cur.connection.rollback()
+
+    # The statement outlived the rollback, and is replaced by the next
+    # block
+    assert prepared(cur) == ["test_select"]
+    with db.prepared_statement(cur, "test_select", "SELECT $1::int * 2") \
+            as execute:
+        cur.execute(f"{execute} (%s)", (21,))
+        assert cur.fetchone()[0] == 42
+    assert prepared(cur) == []
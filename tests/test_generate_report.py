@@ -0,0 +1,118 @@
+import os
+import threading
+import pandas as pd
+import pytest
+
+# generate_report connects through db, which needs credentials.py
+generate_report = pytest.importorskip("generate_report")
+import bulk_load  # noqa: E402
+import rollups  # noqa: E402
+from test_rollups import hospitals, weekly_rows, set_hospitals  # noqa: E402
+
+WEEKS = [str(week.date()) for week in
+         pd.date_range("2022-08-26", "2022-10-28", freq="7D")]
+
+# Reports whose windows overlap, start before the first week and end
+# after the last one
+END_DATES = ["2022-09-10", "2022-10-07", "2022-10-21", "2022-11-15"]
+
+# Frames computed only by the batch, to slice each report's frames from
+BATCH_ONLY = {"fresh", "rating_weeks", "state_weeks", "change_weeks"}
+
+
+def load(cur):
+    """
+    Load hospitals, ratings and weekly rows the way the loaders do, with
+    hospitals that move state partway through and rows in file order
+    :param cur: Cursor of an open connection
+    """
+    frame = hospitals(24, states=("AL", "CA", "NY", "TX"))
+    set_hospitals(cur, frame)
+    cur.connection.commit()
+    for number, week in enumerate(WEEKS):
+        rows = weekly_rows(frame["hospital_pk"], [week], seed=number)
+        # Each week's file lists the hospitals in another order
+        rows = rows.sample(frac=1, random_state=number) \
+            .reset_index(drop=True)
+        bulk_load.create_staging_table(cur, "Seymour_weekly_info")
+        bulk_load.copy_frame(cur, rows.assign(file_row=rows.index),
+                             bulk_load.staging_table("Seymour_weekly_info"))
+        bulk_load.insert_new_rows(cur, "Seymour_weekly_info",
+                                  ["hospital_pk", "collection_week"])
+        rollups.refresh_weeks(
+            cur, bulk_load.staging_table("Seymour_weekly_info")
+        )
+        cur.connection.commit()
+    set_hospitals(cur, frame.assign(state=frame["state"].where(
+        frame.index % 5 != 0, "NY"
+    )))
+    cur.connection.commit()
+    for date, shift in [("2022-07-01", 0), ("2022-10-01", 1)]:
+        ratings = pd.DataFrame({
+            "hospital_pk": frame["hospital_pk"],
+            "date": date,
+            "rating": [(number + shift) % 6 or None
+                       for number in range(len(frame.index))]
+        }).astype({"rating": "Int64"})
+        bulk_load.copy_frame(cur, ratings, "Seymour_quality")
+    cur.connection.commit()
+
+
+def assert_same(single, batch):
+    """
+    Check that a frame of a single report matches the one sliced from a
+    batch
+    :param single: Frame computed by the report's own queries
+    :param batch: Frame taken from the batch
+    """
+    if isinstance(single, pd.DataFrame):
+        pd.testing.assert_frame_equal(single, batch, check_dtype=False)
+    elif isinstance(single, pd.Series):
+        pd.testing.assert_series_equal(single, batch, check_dtype=False)
+    else:
+        assert single == batch
+
+
+@pytest.mark.parametrize("fresh", [True, False])
+def test_window_frames_match_single_reports(cur, fresh):
+    load(cur)
+    if not fresh:
+        # Without a status row the rollups are not read
+        cur.execute(f"DELETE FROM {rollups.STATUS_TABLE}")
+    assert rollups.is_fresh(cur) == fresh
+
+    batch = generate_report.batch_frames(cur, END_DATES)
+    for end_date in END_DATES:
+        single = generate_report.report_frames(cur, end_date)
+        sliced = generate_report.frames.FrameEngine(
+            generate_report.REPORT_FRAMES,
+            provided=generate_report.window_frames(batch, end_date),
+            end_date=end_date
+        )
+        for name in generate_report.REPORT_FRAMES:
+            if name not in BATCH_ONLY:
+                assert_same(single[name], sliced[name])
+
+
+def test_charts_script_shared_from_threads(tmp_path):
+    file_name = str(tmp_path / "report.html")
+    start = threading.Barrier(8)
+    errors = []
+
+    def write():
+        start.wait()
+        try:
+            generate_report.charts_script(file_name, "shared")
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=write) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert os.listdir(tmp_path) == [generate_report.PLOTLY_JS_FILE]
+    with open(tmp_path / generate_report.PLOTLY_JS_FILE) as f:
+        assert f.read() == generate_report.plotly.offline.get_plotlyjs()
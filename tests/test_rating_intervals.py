@@ -0,0 +1,100 @@
+import pandas as pd
+import pytest
+
+# load-quality.py is not a valid module name, and connects through db,
+# which needs credentials.py
+load_quality = pytest.importorskip("load-quality")
+
+
+def ratings(pairs):
+    """
+    Data frame of hospital_pk and rating
+    :param pairs: List of (hospital_pk, rating) pairs, rating None when
+    not available
+    :return: Data frame
+    """
+    return pd.DataFrame(pairs, columns=["hospital_pk", "rating"]) \
+        .astype({"rating": "Int64"})
+
+
+def test_rating_changes():
+    current = ratings([("same", 3), ("up", 2), ("gone", 4),
+                       ("to_missing", 5), ("from_missing", None),
+                       ("still_missing", None)])
+    new = ratings([("same", 3), ("up", 3), ("to_missing", None),
+                   ("from_missing", 1), ("still_missing", None),
+                   ("added", 2)])
+    ended, started = load_quality.rating_changes(current, new)
+
+    assert sorted(ended) == ["from_missing", "gone", "to_missing", "up"]
+    started = dict(zip(started["hospital_pk"], started["rating"]))
+    assert set(started) == {"up", "to_missing", "from_missing", "added"}
+    assert started["up"] == 3
+    assert started["from_missing"] == 1
+    assert started["added"] == 2
+    assert pd.isna(started["to_missing"])
+
+
+def test_rating_changes_without_open_intervals():
+    new = ratings([("a", 1), ("b", None)])
+    ended, started = load_quality.rating_changes(ratings([]), new)
+    assert list(ended) == []
+    assert sorted(started["hospital_pk"]) == ["a", "b"]
+
+
+def intervals(cur):
+    """
+    Rows of Seymour_rating_interval
+    :param cur: Cursor of an open connection
+    :return: List of (hospital_pk, rating, valid_from, valid_to) with
+    dates as YYYY-MM-DD
+    """
+    cur.execute(
+        """
+            SELECT hospital_pk, rating, valid_from::text, valid_to::text
+            FROM Seymour_rating_interval ORDER BY hospital_pk, valid_from
+        """
+    )
+    return cur.fetchall()
+
+
+def compact(cur, pairs, date):
+    """
+    Compact the ratings of a file in a transaction of its own, as
+    load-quality.py does
+    :param cur: Cursor of an open connection
+    :param pairs: List of (hospital_pk, rating) pairs
+    :param date: Date of the file as YYYY-MM-DD
+    :return: Tuple of the number of intervals started and ended
+    """
+    counts = load_quality.compact_ratings(cur, ratings(pairs), date)
+    cur.connection.commit()
+    return counts
+
+
+def test_compact_ratings_keeps_only_changes(cur):
+    assert compact(cur, [("a", 1), ("b", 2), ("c", None)],
+                   "2022-01-01") == (3, 0)
+    assert compact(cur, [("a", 1), ("b", 3), ("c", None)],
+                   "2022-02-01") == (1, 1)
+    assert compact(cur, [("a", 1), ("b", 3)], "2022-03-01") == (0, 1)
+
+    assert intervals(cur) == [
+        ("a", 1, "2022-01-01", None),
+        ("b", 2, "2022-01-01", "2022-02-01"),
+        ("b", 3, "2022-02-01", None),
+        ("c", None, "2022-01-01", "2022-03-01")
+    ]
+
+
+def test_compact_ratings_loads_latest_date_again(cur):
+    compact(cur, [("a", 1)], "2022-01-01")
+    compact(cur, [("a", 2)], "2022-02-01")
+    compact(cur, [("a", 4)], "2022-02-01")
+
+    assert intervals(cur) == [
+        ("a", 1, "2022-01-01", "2022-02-01"),
+        ("a", 4, "2022-02-01", None)
+    ]
+    with pytest.raises(RuntimeError):
+        compact(cur, [("a", 4)], "2022-01-01")
@@ -0,0 +1,189 @@
+import threading
+import numpy as np
+import pandas as pd
+import pytest
+
+# bulk_load connects through db, which needs credentials.py
+bulk_load = pytest.importorskip("bulk_load")
+import rollups  # noqa: E402
+
+WEEKS = ["2022-10-07", "2022-10-14", "2022-10-21"]
+
+
+def hospitals(count, states=("AL", "CA", "NY")):
+    """
+    Rows for Seymour_hospital, spread over states and two types
+    :param count: Number of hospitals
+    :param states: States the hospitals are spread over
+    :return: Data frame of hospital_pk, state and hospital_type
+    """
+    return pd.DataFrame({
+        "hospital_pk": [f"h{number}" for number in range(count)],
+        "state": [states[number % len(states)] for number in range(count)],
+        "hospital_type": ["Acute Care Hospitals" if number % 2
+                          else "Critical Access Hospitals"
+                          for number in range(count)]
+    })
+
+
+def weekly_rows(hospital_pks, weeks, seed=0):
+    """
+    Rows for Seymour_weekly_info with missing values and hospitals
+    without adult beds among them
+    :param hospital_pks: Hospitals that have a row each week
+    :param weeks: Weeks as YYYY-MM-DD
+    :param seed: Seed of the random values
+    :return: Data frame
+    """
+    random = np.random.default_rng(seed)
+    rows = pd.DataFrame([(pk, week) for week in weeks for pk in hospital_pks],
+                        columns=["hospital_pk", "collection_week"])
+    for column in rollups.BED_COLUMNS:
+        values = random.integers(0, 200, len(rows.index)).astype(float)
+        values[random.random(len(rows.index)) < 0.1] = np.nan
+        rows[column] = values
+    return rows
+
+
+def add_weekly(cur, rows):
+    """
+    Add weekly rows and refresh their weeks, as load-hhs.py does
+    :param cur: Cursor of an open connection
+    :param rows: Data frame returned by weekly_rows
+    """
+    bulk_load.create_staging_table(cur, "Seymour_weekly_info")
+    bulk_load.copy_frame(cur, rows,
+                         bulk_load.staging_table("Seymour_weekly_info"))
+    bulk_load.insert_new_rows(cur, "Seymour_weekly_info",
+                              ["hospital_pk", "collection_week"])
+    rollups.refresh_weeks(cur, bulk_load.staging_table("Seymour_weekly_info"))
+
+
+def set_hospitals(cur, frame):
+    """
+    Add or change hospitals and refresh the groups they moved between, as
+    load-quality.py does with --upsert
+    :param cur: Cursor of an open connection
+    :param frame: Data frame returned by hospitals
+    """
+    bulk_load.create_staging_table(cur, "Seymour_hospital")
+    staging = bulk_load.staging_table("Seymour_hospital")
+    bulk_load.copy_frame(cur, frame, staging)
+    rollups.remember_hospitals(cur, staging)
+    bulk_load.insert_new_rows(cur, "Seymour_hospital", ["hospital_pk"],
+                              update_columns=["state", "hospital_type"],
+                              columns=list(frame.columns))
+    rollups.refresh_hospitals(cur)
+
+
+def rollup_rows(cur):
+    """
+    Rows of the rollup, with sums rounded so that the order they were
+    added in does not matter
+    :param cur: Cursor of an open connection
+    :return: List of tuples
+    """
+    columns = ", ".join(
+        f"round({name}::numeric, 6)" if name.endswith("_sum") else name
+        for name, _ in rollups.AGGREGATES
+    )
+    cur.execute(
+        f"""
+            SELECT collection_week, state, hospital_type, {columns}
+            FROM {rollups.ROLLUP_TABLE}
+            ORDER BY collection_week, state, hospital_type
+        """
+    )
+    return cur.fetchall()
+
+
+def rebuilt_rows(cur):
+    """
+    Rows of the rollup as table_rollup.py would rebuild it
+    :param cur: Cursor of an open connection
+    :return: List of tuples
+    """
+    rollups.rebuild(cur)
+    return rollup_rows(cur)
+
+
+def test_refresh_matches_rebuild(cur):
+    # Each load commits, like the loaders do
+    frame = hospitals(30)
+    set_hospitals(cur, frame.iloc[:20])
+    cur.connection.commit()
+    add_weekly(cur, weekly_rows(frame["hospital_pk"], WEEKS[:2]))
+    cur.connection.commit()
+
+    # Weeks added again keep their rows; hospitals added late and
+    # hospitals that change state or type move their rows across groups
+    add_weekly(cur, weekly_rows(frame["hospital_pk"], WEEKS[1:], seed=1))
+    cur.connection.commit()
+    moved = frame.assign(state=frame["state"].where(
+        frame.index % 3 != 0, "TX"
+    ))
+    set_hospitals(cur, moved)
+    cur.connection.commit()
+    set_hospitals(cur, moved.assign(hospital_type="Childrens"))
+    cur.connection.commit()
+
+    refreshed = rollup_rows(cur)
+    assert len(refreshed) > 0
+    assert refreshed == rebuilt_rows(cur)
+
+
+def test_forget_missing_weeks(cur):
+    frame = hospitals(10)
+    set_hospitals(cur, frame)
+    add_weekly(cur, weekly_rows(frame["hospital_pk"], WEEKS))
+    cur.execute("DELETE FROM Seymour_weekly_info WHERE collection_week = %s",
+                (WEEKS[0],))
+    rollups.forget_missing_weeks(cur)
+    assert rollup_rows(cur) == rebuilt_rows(cur)
+
+
+def record_load(cur, loader):
+    """
+    Record a load in the manifest
+    :param cur: Cursor of an open connection
+    :param loader: Name of the loader
+    """
+    cur.execute(
+        """
+            INSERT INTO Seymour_load_manifest
+            (file_name, content_hash, loader, rows_read, status)
+            VALUES ('test', 'test', %s, 0, 'complete')
+        """,
+        (loader,)
+    )
+
+
+def test_concurrent_loads_keep_rollup_fresh(connect):
+    hhs_conn, quality_conn = connect(), connect()
+    frame = hospitals(12)
+    cur = hhs_conn.cursor()
+    set_hospitals(cur, frame)
+    hhs_conn.commit()
+
+    # The quality load starts first, then waits while the HHS load adds
+    # a week holding rows of the hospitals it moves
+    quality_cur = quality_conn.cursor()
+    quality_cur.execute("SELECT now()")
+    add_weekly(cur, weekly_rows(frame["hospital_pk"], WEEKS[:1]))
+
+    def load_quality():
+        set_hospitals(quality_cur, frame.assign(state="TX"))
+        record_load(quality_cur, "quality")
+        quality_conn.commit()
+
+    thread = threading.Thread(target=load_quality)
+    thread.start()
+    thread.join(1)
+    assert thread.is_alive()
+    record_load(cur, "hhs")
+    hhs_conn.commit()
+    thread.join()
+
+    assert rollups.is_fresh(cur)
+    assert {row[1] for row in rollup_rows(cur)} == {"TX"}
+    assert rollup_rows(cur) == rebuilt_rows(cur)
@@ -0,0 +1,81 @@
+import pandas as pd
+import validation
+
+
+def failures(errors):
+    """
+    Failing rows of a validation
+    :param errors: List returned by validation.validate
+    :return: Dictionary of index label to "column check"
+    """
+    return {label: f"{error.column} {error.check}" for label, error in errors}
+
+
+def test_validate_reports_each_failing_row():
+    frame = pd.DataFrame({
+        "hospital_pk": ["a", None, "c", "d", "e", "f"],
+        "date": ["2022-10-01", "2022-10-01", "October", None, "2022-10-01",
+                 "2022-10-01"],
+        "zip_code": ["12345", "1", "2", "3", "12.5", "99999999999"],
+        "emergency_services": ["Yes", "no", "maybe", "TRUE", "f", None],
+        "rating": ["5", "-1", "1", "Not Available", "6", None]
+    }, index=[10, 11, 12, 13, 14, 15])
+    errors = validation.validate(frame, validation.QUALITY_CHECKS)
+
+    # Each row is reported once, for the first check it fails
+    assert failures(errors) == {
+        11: "hospital_pk not_null",
+        12: "emergency_services bool",
+        13: "date not_null",
+        14: "zip_code int",
+        15: "zip_code int"
+    }
+    assert all(isinstance(error, validation.ValidationError)
+               for _, error in errors)
+    assert str(dict(errors)[12]) == "emergency_services is not a boolean:" \
+        + " 'maybe'"
+
+
+def test_validate_checks_ratings_after_numbers():
+    frame = pd.DataFrame({
+        "rating": ["1", "Not Available", "6", "-2", "-1", None]
+    })
+    errors = validation.validate(frame, {"rating": ["int", "rating"]})
+    assert failures(errors) == {
+        1: "rating int",
+        2: "rating rating",
+        3: "rating rating"
+    }
+
+
+def test_validate_checks_categories_like_values():
+    values = ["1.5", "n/a", "2", "n/a", None, "3e2"]
+    plain = pd.DataFrame({"fips_code": values, "hospital_pk": "a"})
+    categorical = plain.astype({"fips_code": "category"})
+    checks = {"hospital_pk": ["not_null"], "fips_code": ["float"]}
+    assert failures(validation.validate(plain, checks)) \
+        == {1: "fips_code float", 3: "fips_code float"}
+    assert failures(validation.validate(categorical, checks)) \
+        == failures(validation.validate(plain, checks))
+
+
+def test_validate_skips_missing_columns_and_numeric_floats():
+    frame = pd.DataFrame({
+        "hospital_pk": ["a", "b"],
+        "collection_week": ["2022-10-21", "2022-10-28"],
+        "total_icu_beds_7_day_avg": [1.5, float("nan")]
+    })
+    checks = dict(validation.WEEKLY_CHECKS,
+                  total_icu_beds_7_day_avg=["float"],
+                  fips_code=["float"])
+    assert validation.validate(frame, checks) == []
+
+
+def test_count_errors():
+    frame = pd.DataFrame({"zip_code": ["x", "1", "y"],
+                          "hospital_pk": [None, "b", "c"]})
+    errors = validation.validate(frame, validation.QUALITY_CHECKS)
+    assert validation.count_errors(errors) == {
+        "hospital_pk not_null": 1,
+        "zip_code int": 1
+    }
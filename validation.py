@@ -0,0 +1,221 @@
+import collections
+import pandas as pd
+
+# Range of the INT columns of the tables
+INT_MIN = -2 ** 31
+INT_MAX = 2 ** 31 - 1
+
+# Lowest and highest ratings allowed by the CHECK on Seymour_quality
+RATING_MIN = -1
+RATING_MAX = 5
+
+# Spellings Postgres accepts for a BOOL, in lowercase
+TRUE_STRINGS = {"t", "true", "y", "yes", "on", "1"}
+BOOL_STRINGS = TRUE_STRINGS | {"f", "false", "n", "no", "off", "0"}
+
+
+class ValidationError(ValueError):
+    """
+    Raised for a row that breaks a constraint of the table it is meant for
+    """
+    def __init__(self, column, check, message):
+        super().__init__(message)
+        self.column = column
+        self.check = check
+
+
+def _by_category(series, check):
+    """
+    Run a check on the categories of a categorical column instead of on
+    every row
+    :param series: Column to check
+    :param check: Function from a column to a mask of failing values
+    :return: Mask of failing rows
+    """
+    if not isinstance(series.dtype, pd.CategoricalDtype):
+        return check(series)
+    categories = pd.Series(series.cat.categories)
+    failing = categories[check(categories).to_numpy()]
+    return series.isin(failing)
+
+
+def _numbers(series):
+    """
+    Convert a column to floats, with values that are not numbers missing
+    :param series: Column to convert
+    :return: Column of float64
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        series = series.astype("object")
+    return pd.to_numeric(series, errors="coerce").astype("float64")
+
+
+def is_null(series):
+    """
+    Find missing values, which primary key columns cannot hold
+    :param series: Column to check
+    :return: Mask of failing rows
+    """
+    return series.isna()
+
+
+def not_date(series):
+    """
+    Find values that are not dates written as YYYY-MM-DD
+    :param series: Column to check
+    :return: Mask of failing rows
+    """
+    def check(values):
+        dates = pd.to_datetime(values, format="ISO8601", errors="coerce")
+        return values.notna() & dates.isna()
+    return _by_category(series, check)
+
+
+def not_integer(series):
+    """
+    Find values that are not whole numbers within the range of an INT
+    :param series: Column to check
+    :return: Mask of failing rows
+    """
+    def check(values):
+        numbers = _numbers(values)
+        return values.notna() & (numbers.isna() | (numbers % 1 != 0)
+                                 | (numbers < INT_MIN) | (numbers > INT_MAX))
+    return _by_category(series, check)
+
+
+def not_float(series):
+    """
+    Find values that are not numbers
+    :param series: Column to check
+    :return: Mask of failing rows
+    """
+    if pd.api.types.is_numeric_dtype(series):
+        return pd.Series(False, index=series.index)
+    return _by_category(
+        series, lambda values: values.notna() & _numbers(values).isna()
+    )
+
+
+def not_bool(series):
+    """
+    Find values that are not booleans
+    :param series: Column to check
+    :return: Mask of failing rows
+    """
+    if pd.api.types.is_bool_dtype(series):
+        return pd.Series(False, index=series.index)
+    return _by_category(
+        series,
+        lambda values: values.notna()
+        & ~values.astype(str).str.strip().str.lower().isin(BOOL_STRINGS)
+    )
+
+
+def not_rating(series):
+    """
+    Find ratings outside of the range allowed by Seymour_quality
+    :param series: Column to check
+    :return: Mask of failing rows
+    """
+    def check(values):
+        numbers = _numbers(values)
+        return numbers.notna() & ((numbers < RATING_MIN)
+                                  | (numbers > RATING_MAX))
+    return _by_category(series, check)
+
+
+# Checks that can be listed for a column, by name, with the message
+# given for a failing value
+CHECKS = {
+    "not_null": (is_null, "is missing"),
+    "date": (not_date, "is not a YYYY-MM-DD date"),
+    "int": (not_integer, "is not a whole number in the range of an INT"),
+    "float": (not_float, "is not a number"),
+    "bool": (not_bool, "is not a boolean"),
+    "rating": (not_rating,
+               f"is not between {RATING_MIN} and {RATING_MAX}")
+}
+
+# Checks for the rows of Seymour_weekly_info, following table_setup.py
+# The bed columns, like fips_code below, are parsed as floats by
+# readers.py, so a value that is not a number fails the whole file
+# before any check runs and they have none
+WEEKLY_CHECKS = {
+    "hospital_pk": ["not_null"],
+    "collection_week": ["not_null", "date"]
+}
+
+# Checks for the rows of Seymour_geo
+GEO_CHECKS = {
+    "hospital_pk": ["not_null"]
+}
+
+# Checks for the rows load-quality.py stages for Seymour_hospital and
+# Seymour_quality
+QUALITY_CHECKS = {
+    "hospital_pk": ["not_null"],
+    "zip_code": ["int"],
+    "emergency_services": ["bool"],
+    "date": ["not_null", "date"],
+    "rating": ["int", "rating"]
+}
+
+
+def validate(frame, checks):
+    """
+    Run checks over whole columns of a data frame at once
+    Each failing row is reported once, for the first check it fails.
+    Columns the frame does not have are skipped.
+    :param frame: Data frame to check
+    :param checks: Dictionary of column name to list of check names
+    :return: List of (index label, ValidationError) pairs for the rows
+    that fail, in the same form as the rows rejected by the database
+    """
+    failed = pd.Series(False, index=frame.index)
+    errors = []
+    for column, names in checks.items():
+        if column not in frame.columns:
+            continue
+        for name in names:
+            check, message = CHECKS[name]
+            mask = check(frame[column]).to_numpy() & ~failed.to_numpy()
+            if not mask.any():
+                continue
+            failed = failed | mask
+            for label, value in frame.loc[mask, column].items():
+                errors.append((label, ValidationError(
+                    column, name, f"{column} {message}: {value!r}"
+                )))
+    return errors
+
+
+def count_errors(errors):
+    """
+    Count failing rows by column and check
+    :param errors: List of (index label, ValidationError) pairs
+    :return: Counter of "column check" strings
+    """
+    return collections.Counter(f"{error.column} {error.check}"
+                               for _, error in errors)
+
+
+def convert(frame, dtypes):
+    """
+    Convert text columns that passed validation to their types
+    :param frame: Data frame whose rows passed the int and bool checks of
+    the converted columns
+    :param dtypes: Dictionary of column name to "boolean" or a nullable
+    integer type such as "Int32"
+    :return: Data frame with the columns converted
+    """
+    converted = {}
+    for column, dtype in dtypes.items():
+        values = frame[column].astype("string").str.strip()
+        if dtype == "boolean":
+            values = values.str.lower()
+            converted[column] = values.isin(TRUE_STRINGS) \
+                .astype("boolean").mask(values.isna())
+        else:
+            converted[column] = pd.to_numeric(values).astype(dtype)
+    return frame.assign(**converted)